@@ -1,15 +1,19 @@
 from fastapi import APIRouter, HTTPException, Header, Depends
 from pydantic import BaseModel
 from typing import Optional, List
-import sqlite3
-from contextlib import contextmanager
 import logging
 from logging.handlers import RotatingFileHandler
 import os
+import asyncio
 
 from auth import hash_password, verify_password, create_access_token, get_current_user
-from query_config import get_query, set_query, get_all_queries, get_query_with_sql, delete_query, validate_query_syntax, get_default_query
+from query_config import get_query, set_query, get_all_queries, get_query_with_sql, delete_query, validate_query_syntax, get_default_query, normalize_query_name
 from logger import get_logger
+import sqlite_db
+from services.scheduler_service import get_scheduler_status
+from services.notification_outbox import get_outbox_stats
+from services import query_shadow, query_dry_run
+from config import QUERY_REQUIRE_SHADOW_RUN
 
 logger = get_logger(__name__)
 
@@ -60,19 +64,8 @@ def log_user_activity(username: str, activity: str):
 router = APIRouter(prefix="/admin", tags=["admin"])
 SQLITE_DB_PATH = "building_schedules.db"
 
-@contextmanager
 def get_sqlite_connection():
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    except Exception:
-        conn.rollback()
-        raise
-    else:
-        conn.commit()
-    finally:
-        conn.close()
+    return sqlite_db.get_connection(SQLITE_DB_PATH)
 
 # Models
 class LoginRequest(BaseModel):
@@ -97,6 +90,15 @@ class QueryResponse(BaseModel):
     created_at: Optional[str]
     updated_at: Optional[str]
 
+class QueryTestRequest(BaseModel):
+    # Omit to test the active query
+    query_sql: Optional[str] = None
+    # Capped at QUERY_TEST_MAX_ROWS / QUERY_TEST_TIMEOUT_SECONDS
+    max_rows: Optional[int] = None
+    timeout_seconds: Optional[float] = None
+    preview_rows: int = 20
+    use_standin: bool = False
+
 class CreateUserRequest(BaseModel):
     username: str
     password: str
@@ -236,6 +238,11 @@ async def get_default_query_endpoint(query_name: str, auth_info: tuple = Depends
 
 @router.post("/queries")
 async def update_query(request: QueryRequest, admin_username: str = Depends(require_admin)):
+    if QUERY_REQUIRE_SHADOW_RUN:
+        log_user_activity(admin_username, f"QUERY_UPDATE_REFUSED - {request.query_name} - Shadow run required")
+        raise HTTPException(status_code=409,
+                            detail="Direct query changes are disabled. Stage the query and promote it after its shadow runs.")
+
     is_valid, error_message = validate_query_syntax(request.query_sql)
     if not is_valid:
         log_user_activity(admin_username, f"QUERY_UPDATE_FAILED - {request.query_name} - Invalid syntax")
@@ -248,6 +255,93 @@ async def update_query(request: QueryRequest, admin_username: str = Depends(requ
     log_user_activity(admin_username, f"QUERY_UPDATED - {request.query_name}")
     return {"success": True, "message": f"Query '{request.query_name}' saved successfully"}
 
+@router.post("/queries/{query_name}/test")
+async def test_query(query_name: str, request: QueryTestRequest, admin_username: str = Depends(require_admin)):
+    """Dry-run a query: timing, row count, first rows, column shape and execution plan. Nothing is saved."""
+    if normalize_query_name(query_name) not in query_shadow.RESULT_SHAPES:
+        raise HTTPException(status_code=404, detail=f"Query '{query_name}' not found")
+
+    if request.query_sql is not None:
+        is_valid, error_message = validate_query_syntax(request.query_sql)
+        if not is_valid:
+            log_user_activity(admin_username, f"QUERY_TEST_FAILED - {query_name} - Invalid syntax")
+            raise HTTPException(status_code=400, detail=f"Invalid query: {error_message}")
+
+    try:
+        # Runs for up to QUERY_TEST_TIMEOUT_SECONDS, so keep it off the event loop
+        result = await asyncio.to_thread(
+            query_dry_run.run_query_test, query_name, request.query_sql, request.max_rows,
+            request.preview_rows, request.timeout_seconds, request.use_standin
+        )
+    except query_dry_run.DryRunError as e:
+        log_user_activity(admin_username, f"QUERY_TEST_FAILED - {query_name} - {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    log_user_activity(admin_username, f"QUERY_TESTED - {query_name} - {result['elapsed_ms']} ms")
+    return result
+
+# ==================== STAGED QUERY ROUTES ====================
+
+@router.get("/query_candidates")
+async def list_query_candidates(auth_info: tuple = Depends(get_current_admin_user)):
+    """All staged queries with their shadow runs and promotion verdicts"""
+    return {"candidates": query_shadow.get_all_candidates()}
+
+@router.post("/queries/stage")
+async def stage_query(request: QueryRequest, admin_username: str = Depends(require_admin)):
+    """Stage a query; it runs in shadow next to the active one before it can be promoted"""
+    is_valid, error_message = validate_query_syntax(request.query_sql)
+    if not is_valid:
+        log_user_activity(admin_username, f"QUERY_STAGE_FAILED - {request.query_name} - Invalid syntax")
+        raise HTTPException(status_code=400, detail=f"Invalid query: {error_message}")
+
+    try:
+        candidate = query_shadow.stage_query(request.query_name, request.query_sql,
+                                             request.description or "", admin_username)
+    except query_shadow.CandidateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    log_user_activity(admin_username, f"QUERY_STAGED - {request.query_name}")
+    return candidate
+
+@router.get("/queries/{query_name}/candidate")
+async def get_query_candidate(query_name: str, auth_info: tuple = Depends(get_current_admin_user)):
+    candidate = query_shadow.get_candidate(query_name)
+    if candidate is None:
+        raise HTTPException(status_code=404, detail=f"No candidate staged for '{query_name}'")
+    return candidate
+
+@router.post("/queries/{query_name}/promote")
+async def promote_query_candidate(query_name: str, admin_username: str = Depends(require_admin)):
+    """Make the staged query active (only when its shadow runs passed)"""
+    try:
+        query_shadow.promote_candidate(query_name)
+    except query_shadow.CandidateError as e:
+        log_user_activity(admin_username, f"QUERY_PROMOTE_REFUSED - {query_name} - {e}")
+        raise HTTPException(status_code=409, detail=str(e))
+
+    log_user_activity(admin_username, f"QUERY_PROMOTED - {query_name}")
+    return {"success": True, "message": f"Query '{query_name}' promoted"}
+
+@router.delete("/queries/{query_name}/candidate")
+async def discard_query_candidate(query_name: str, admin_username: str = Depends(require_admin)):
+    if not query_shadow.discard_candidate(query_name):
+        raise HTTPException(status_code=404, detail=f"No candidate staged for '{query_name}'")
+    log_user_activity(admin_username, f"QUERY_CANDIDATE_DISCARDED - {query_name}")
+    return {"success": True, "message": f"Candidate for '{query_name}' discarded"}
+
+# ==================== SCHEDULER ROUTES ====================
+
+@router.get("/scheduler")
+async def scheduler_status(auth_info: tuple = Depends(get_current_admin_user)):
+    """Get scheduler job metadata (next run, last run, duration, errors)"""
+    return get_scheduler_status()
+
+@router.get("/outbox")
+async def outbox_status(auth_info: tuple = Depends(get_current_admin_user)):
+    """Get notification outbox depth, oldest pending age and delivery rate"""
+    return get_outbox_stats()
+
 # ==================== USER MANAGEMENT ROUTES ====================
 
 @router.get("/users", response_model=List[UserResponse])
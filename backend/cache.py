@@ -1,55 +1,401 @@
+"""
+Application Cache
+=================
+Small key/value store for runtime state (global panel status, last-seen panel
+states per building), persisted in a WAL-mode SQLite table.
+
+The previous implementation rewrote the whole app_cache.json on every set,
+non-atomically, so a crash mid-write could corrupt it. Here every key is its
+own row and every write is a transaction:
+
+- the in-memory cache is authoritative; it is loaded once at startup and
+  reads never hit disk afterwards
+- set_value() only updates memory and marks the key dirty (no-op if the value
+  is unchanged); a background flusher writes dirty keys every
+  CACHE_FLUSH_INTERVAL_SECONDS in one transaction, so repeated sets of a key
+  coalesce into one write and request threads never wait on disk
+- flush() persists immediately; the FastAPI lifespan calls it on shutdown
+- update_value() is an atomic read-modify-write of one key, across processes
+
+Several uvicorn workers can share the database. Writes take SQLite's write
+lock (BEGIN IMMEDIATE) and bump a generation counter in cache_meta. Readers
+compare that counter with the one they last loaded, at most every
+CACHE_REFRESH_INTERVAL_SECONDS, and re-read the table only when it moved,
+keeping their own unflushed keys. A write on one worker is therefore visible
+on the others within the flush interval plus the refresh interval; callers
+that need it sooner (POST /panel_status) flush right away.
+
+An existing app_cache.json is imported on first start. The file is left in
+place (it is tracked in git); the import is recorded in cache_meta
+(legacy_migrated) so it runs only once, even after the cache is emptied.
+"""
+
+import atexit
 import json
 import os
-from logger import get_logger
+import sqlite3
 import threading
+import time
+from typing import Any, Callable
+from config import CACHE_FLUSH_INTERVAL_SECONDS, CACHE_REFRESH_INTERVAL_SECONDS
+from logger import get_logger
 
 logger = get_logger(__name__)
 
-CACHE_FILE = "app_cache.json"
+CACHE_DB_PATH = "app_cache.db"
+LEGACY_CACHE_FILE = "app_cache.json"
+
 _cache = {}
-_cache_lock = threading.Lock()
+# Serialized form of each value as last set, used to skip unchanged writes
+_serialized = {}
+# key -> serialized value (or _DELETED) waiting for the flusher
+_dirty = {}
+_loaded = False
+# Generation of cache_kv that _cache reflects, and when to check it next
+_generation = 0
+_next_refresh_at = 0.0
+_MISSING = object()
+_DELETED = object()
+_cache_lock = threading.RLock()
+# Guards _conn; lock order is _cache_lock, then _db_lock
+_db_lock = threading.Lock()
+# Serializes flushes; held while writing to disk, never while _cache_lock is needed by readers
+_flush_lock = threading.Lock()
+_flush_wake = threading.Event()
+_flusher = None
+_flusher_stopping = threading.Event()
+_stats = {"sets": 0, "flushes": 0, "keys_written": 0, "flush_failures": 0, "refreshes": 0}
+_conn = None
+
+
+def _serialize(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _connection() -> sqlite3.Connection:
+    """Returns the cache's SQLite connection (one per process, used under _db_lock)."""
+    global _conn
+    if _conn is None:
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        _conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, timeout=10, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        _conn.execute("INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('generation', 0)")
+    return _conn
+
+
+def _read_generation(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT value FROM cache_meta WHERE name = 'generation'").fetchone()[0]
+
+
+def _write(conn: sqlite3.Connection, pending: dict, meta: dict | None = None) -> int:
+    """
+    Writes `pending` (key -> serialized value or _DELETED) in one cross-process
+    transaction and bumps the generation. `meta` rows are set in cache_meta in
+    the same transaction.
+
+    Returns:
+        int: The generation before this write
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        generation = _read_generation(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache_kv (key, value, updated_at) VALUES (?, ?, ?)",
+            [(key, value, now) for key, value in pending.items() if value is not _DELETED]
+        )
+        conn.executemany(
+            "DELETE FROM cache_kv WHERE key = ?",
+            [(key,) for key, value in pending.items() if value is _DELETED]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache_meta (name, value) VALUES (?, ?)",
+            list((meta or {}).items())
+        )
+        conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'generation'")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return generation
+
 
-def load_cache():
+def _advance_generation(previous: int):
     """
-    Load the cache from a JSON file into memory.
+    Called after this process wrote generation previous + 1. If nobody else
+    wrote since our last refresh, memory already matches the table; otherwise
+    leave the generation behind so the next read refreshes.
     """
-    global _cache
+    global _generation
     with _cache_lock:
-        if _cache:
-            return _cache
-        
-        if not os.path.exists(CACHE_FILE):
-            logger.warning(f"Cache file not found at {CACHE_FILE}. Creating a new one.")
-            _cache = {}
-            # --- FIX: Write the empty cache file directly instead of calling save_cache() ---
-            try:
-                with open(CACHE_FILE, 'w') as f:
-                    json.dump(_cache, f, indent=4)
-                logger.info("Cache file created.")
-            except IOError as e:
-                logger.error(f"Failed to create cache file: {e}")
-            # --- END OF FIX ---
+        if _generation == previous:
+            _generation = previous + 1
+
+
+def _migrate_legacy_file(conn: sqlite3.Connection):
+    """Imports app_cache.json once, leaving the file where it is."""
+    if not os.path.exists(LEGACY_CACHE_FILE):
+        return
+    if conn.execute("SELECT 1 FROM cache_meta WHERE name = 'legacy_migrated'").fetchone():
+        return
+    marker = {"legacy_migrated": int(time.time())}
+    if conn.execute("SELECT 1 FROM cache_kv LIMIT 1").fetchone():
+        # The table already holds live state; the file is older than it
+        _write(conn, {}, meta=marker)
+        return
+    try:
+        with open(LEGACY_CACHE_FILE, 'r') as f:
+            legacy = json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Error reading legacy cache file {LEGACY_CACHE_FILE}: {e}. Not migrated.")
+        return
+
+    _write(conn, {key: _serialize(value) for key, value in legacy.items()}, meta=marker)
+    logger.info(f"✅ Migrated {len(legacy)} keys from {LEGACY_CACHE_FILE} to {CACHE_DB_PATH} "
+                f"({LEGACY_CACHE_FILE} left in place)")
+
+
+def load_cache() -> dict:
+    """
+    Loads every key from the cache table into memory (first call only).
+    Later calls return the in-memory cache without touching disk.
+    """
+    global _loaded
+    with _cache_lock:
+        if _loaded:
             return _cache
+        try:
+            with _db_lock:
+                _migrate_legacy_file(_connection())
+            _refresh()
+            logger.info(f"Cache loaded from {CACHE_DB_PATH} ({len(_cache)} keys).")
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            logger.error(f"Error loading cache: {e}. Using empty cache.")
+        _loaded = True
+        return _cache
+
+
+def _refresh():
+    """
+    Re-reads keys written by other processes if the generation moved (caller
+    holds _cache_lock). Values are only parsed when their JSON differs, and
+    keys this process has not flushed yet are kept.
+    """
+    global _generation
+    with _db_lock:
+        conn = _connection()
+        # Generation first: a write landing between the two reads is picked up next time
+        generation = _read_generation(conn)
+        if generation == _generation and _loaded:
+            return
+        rows = conn.execute("SELECT key, value FROM cache_kv").fetchall()
 
+    stored = set()
+    for key, value in rows:
+        stored.add(key)
+        if key in _dirty or _serialized.get(key) == value:
+            continue
+        _cache[key] = json.loads(value)
+        _serialized[key] = value
+    for key in [key for key in _cache if key not in stored and key not in _dirty]:
+        _cache.pop(key, None)
+        _serialized.pop(key, None)
+    if _loaded:
+        _stats["refreshes"] += 1
+    _generation = generation
+
+
+def _refresh_if_due():
+    """Checks the generation at most every CACHE_REFRESH_INTERVAL_SECONDS."""
+    global _next_refresh_at
+    now = time.monotonic()
+    if now < _next_refresh_at:
+        return
+    with _cache_lock:
+        if now < _next_refresh_at:
+            return
+        _next_refresh_at = now + CACHE_REFRESH_INTERVAL_SECONDS
         try:
-            with open(CACHE_FILE, 'r') as f:
-                _cache = json.load(f)
-                logger.info("Cache loaded from file.")
-                return _cache
-        except (IOError, json.JSONDecodeError) as e:
-            logger.error(f"Error loading cache file: {e}. Using empty cache.")
-            _cache = {}
-            return _cache
+            _refresh()
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            logger.error(f"Error refreshing cache: {e}. Serving local values.")
 
-def save_cache(cache_data):
+
+def get_value(key: str, default: Any = None) -> Any:
+    if not _loaded:
+        load_cache()
+    _refresh_if_due()
+    return _cache.get(key, default)
+
+
+def set_value(key: str, value: Any) -> bool:
+    """
+    Stores one key in memory and schedules it for the next flush.
+    Returns True if the value changed, False if it was unchanged.
+    """
+    with _cache_lock:
+        load_cache()
+        # Compare against what other workers last wrote, not a stale local copy
+        _refresh_if_due()
+        current = _cache.get(key, _MISSING)
+        # Cheap equality first; the same object may have been mutated in place, so compare its JSON instead
+        if current is not value and current == value:
+            return False
+        serialized = _serialize(value)
+        if _serialized.get(key) == serialized:
+            return False
+        _cache[key] = value
+        _serialized[key] = serialized
+        _mark_dirty(key, serialized)
+        return True
+
+
+def update_value(key: str, update: Callable[[Any], Any], default: Any = None) -> Any:
     """
-    Save the in-memory cache to the JSON file.
+    Atomically replaces a key with update(current_value) and returns the new value.
+    The key is read and written inside one write transaction, so no other
+    thread or process can interleave; the write goes to disk immediately.
     """
-    global _cache
     with _cache_lock:
-        _cache = cache_data
+        load_cache()
+        with _db_lock:
+            conn = _connection()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                generation = _read_generation(conn)
+                if key in _dirty:
+                    stored = _dirty[key]
+                else:
+                    row = conn.execute("SELECT value FROM cache_kv WHERE key = ?", (key,)).fetchone()
+                    stored = row[0] if row else _DELETED
+                new_value = update(default if stored is _DELETED else json.loads(stored))
+                serialized = _serialize(new_value)
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_kv (key, value, updated_at) VALUES (?, ?, ?)",
+                    (key, serialized, now)
+                )
+                conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'generation'")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        _cache[key] = new_value
+        _serialized[key] = serialized
+        _dirty.pop(key, None)
+        _advance_generation(generation)
+        return new_value
+
+
+def delete_value(key: str) -> bool:
+    with _cache_lock:
+        load_cache()
+        if key not in _cache:
+            return False
+        _cache.pop(key, None)
+        _serialized.pop(key, None)
+        _mark_dirty(key, _DELETED)
+        return True
+
+
+def save_cache(cache_data: dict):
+    """
+    Saves every key of `cache_data`. Kept for callers of the old whole-file API;
+    only keys whose value changed are written.
+    """
+    with _cache_lock:
+        for key, value in cache_data.items():
+            set_value(key, value)
+
+
+# --- Write-behind Flushing ---
+
+def _mark_dirty(key: str, serialized):
+    """Records a pending write (caller holds _cache_lock) and makes sure the flusher is running."""
+    _dirty[key] = serialized
+    _stats["sets"] += 1
+    _start_flusher()
+    _flush_wake.set()
+
+
+def flush() -> int:
+    """
+    Writes all dirty keys to disk in one transaction.
+
+    Returns:
+        int: Number of keys written
+    """
+    with _flush_lock:
+        with _cache_lock:
+            if not _dirty:
+                return 0
+            # Keys stay dirty until written, so a refresh meanwhile cannot replace them with older values
+            pending = dict(_dirty)
+
         try:
-            with open(CACHE_FILE, 'w') as f:
-                json.dump(_cache, f, indent=4)
-        except IOError as e:
-            logger.error(f"Failed to save cache to file: {e}")
\ No newline at end of file
+            with _db_lock:
+                generation = _write(_connection(), pending)
+        except sqlite3.Error as e:
+            _stats["flush_failures"] += 1
+            logger.error(f"Failed to flush {len(pending)} cache key(s): {e}. Will retry.")
+            _flush_wake.set()
+            return 0
+
+        with _cache_lock:
+            for key, value in pending.items():
+                # A key set again during the write stays dirty for the next flush
+                if _dirty.get(key) is value:
+                    del _dirty[key]
+            _advance_generation(generation)
+        _stats["flushes"] += 1
+        _stats["keys_written"] += len(pending)
+        return len(pending)
+
+
+def _flush_loop():
+    while not _flusher_stopping.is_set():
+        _flush_wake.wait()
+        # Let further sets within the interval coalesce into the same write
+        _flusher_stopping.wait(CACHE_FLUSH_INTERVAL_SECONDS)
+        _flush_wake.clear()
+        flush()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher_stopping.clear()
+        _flusher = threading.Thread(target=_flush_loop, daemon=True, name="CacheFlusher")
+        _flusher.start()
+
+
+def shutdown():
+    """Stops the background flusher and writes any pending keys. Called on app shutdown."""
+    global _flusher
+    _flusher_stopping.set()
+    _flush_wake.set()
+    if _flusher:
+        _flusher.join(5)
+        _flusher = None
+    written = flush()
+    if written:
+        logger.info(f"Cache flushed {written} pending key(s) on shutdown.")
+
+
+def get_stats() -> dict:
+    """Returns write-behind counters: sets, flushes, keys written (sets minus keys written were coalesced)."""
+    with _cache_lock:
+        return {**_stats, "dirty_keys": len(_dirty), "generation": _generation}
+
+
+# Last resort for scripts and unexpected exits; the lifespan calls shutdown() first
+atexit.register(flush)
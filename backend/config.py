@@ -4,7 +4,8 @@ import os
 import logging
 import urllib.parse
 import json
-from sqlalchemy import create_engine, text
+import threading
+from sqlalchemy import create_engine, text, event
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from contextlib import contextmanager
@@ -78,6 +79,111 @@ DB_TRUST_CERT = DECRYPTED_DB_CONFIG.get("DB_TRUST_CERT", "yes")
 # -----------------------------
 PROSERVER_IP = DECRYPTED_DB_CONFIG.get("PROSERVER_IP")
 PROSERVER_PORT = int(DECRYPTED_DB_CONFIG.get("PROSERVER_PORT", "7777"))
+PROSERVER_CONNECT_TIMEOUT_SECONDS = float(os.getenv("PROSERVER_CONNECT_TIMEOUT_SECONDS", 5))
+PROSERVER_SEND_TIMEOUT_SECONDS = float(os.getenv("PROSERVER_SEND_TIMEOUT_SECONDS", 5))
+# How often the idle notification connection is checked and re-established
+PROSERVER_PROBE_INTERVAL_SECONDS = float(os.getenv("PROSERVER_PROBE_INTERVAL_SECONDS", 30))
+# Connections used in parallel when a batch of alerts is due at once
+PROSERVER_SEND_CONCURRENCY = max(1, int(os.getenv("PROSERVER_SEND_CONCURRENCY", 4)))
+# Extra consumers of arm/disarm notifications besides ProServer, comma-separated:
+# udp://host:514, file:///spool/dir, http://127.0.0.1:8080/hook (see services/notification_sinks.py)
+NOTIFICATION_SINKS = os.getenv("NOTIFICATION_SINKS", "")
+NOTIFICATION_SINK_QUEUE_SIZE = int(os.getenv("NOTIFICATION_SINK_QUEUE_SIZE", 1000))
+NOTIFICATION_SINK_TIMEOUT_SECONDS = float(os.getenv("NOTIFICATION_SINK_TIMEOUT_SECONDS", 5))
+# Building names are reloaded in bulk this often (and when a lookup misses)
+BUILDING_NAME_CACHE_TTL_SECONDS = float(os.getenv("BUILDING_NAME_CACHE_TTL_SECONDS", 600))
+
+# -----------------------------
+# Connection Pool Limits
+# -----------------------------
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+
+# -----------------------------
+# Scheduler Configuration
+# -----------------------------
+SCHEDULER_INTERVAL_SECONDS = int(os.getenv("SCHEDULER_INTERVAL_SECONDS", 60))
+# Threads that run the scheduler's blocking DB work
+SCHEDULER_EXECUTOR_WORKERS = int(os.getenv("SCHEDULER_EXECUTOR_WORKERS", 2))
+# How long shutdown waits for in-flight jobs before abandoning them
+SCHEDULER_DRAIN_TIMEOUT_SECONDS = int(os.getenv("SCHEDULER_DRAIN_TIMEOUT_SECONDS", 30))
+# The schedule dispatcher is woken by schedule writes in its own process; it
+# polls for writes made by other workers only this often
+DISPATCHER_REMOTE_CHECK_SECONDS = float(os.getenv("DISPATCHER_REMOTE_CHECK_SECONDS", 15))
+
+# Buildings whose panel changed in a tick are processed by up to this many
+# workers. The worker pool is opt-in: the default of 1 keeps the batched
+# path (one fetch + one bulk write per tick, no concurrency). Set 2 or more
+# when one slow building should not hold up the others.
+# Capped at DB_POOL_SIZE so the scheduler never eats into the overflow
+# connections the API relies on.
+SCHEDULER_BUILDING_WORKERS = max(1, min(int(os.getenv("SCHEDULER_BUILDING_WORKERS", 1)), DB_POOL_SIZE))
+
+# Only one process (the lease holder) runs the scheduler. The lease expires
+# after LEADER_LEASE_TTL_SECONDS without a heartbeat.
+LEADER_LEASE_TTL_SECONDS = int(os.getenv("LEADER_LEASE_TTL_SECONDS", 30))
+LEADER_HEARTBEAT_SECONDS = int(os.getenv("LEADER_HEARTBEAT_SECONDS", 10))
+
+# Panel polling adapts between these bounds: PANEL_POLL_MIN_SECONDS within
+# PANEL_POLL_FAST_WINDOW_SECONDS of a start time or a detected change, backing
+# off towards PANEL_POLL_MAX_SECONDS when quiet. PANEL_POLL_MAX_PER_MINUTE caps
+# poll ticks per minute regardless. Each tick sends one probe query and, when
+# the probe shows a change, a full device scan, so ProServer can see up to
+# twice this many queries per minute.
+PANEL_POLL_MIN_SECONDS = float(os.getenv("PANEL_POLL_MIN_SECONDS", 10))
+PANEL_POLL_MAX_SECONDS = float(os.getenv("PANEL_POLL_MAX_SECONDS", SCHEDULER_INTERVAL_SECONDS))
+PANEL_POLL_MAX_PER_MINUTE = max(1, int(os.getenv("PANEL_POLL_MAX_PER_MINUTE", 6)))
+PANEL_POLL_FAST_WINDOW_SECONDS = float(os.getenv("PANEL_POLL_FAST_WINDOW_SECONDS", 120))
+
+# Notification outbox: background delivery of AXE alerts with retries.
+# A row is retried with exponential back-off (base * 2^n, capped) and marked
+# failed after OUTBOX_MAX_ATTEMPTS. Delivered/failed rows are kept this many days.
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 5))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 600))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+# A sender claims the rows of a batch for this long before sending them; rows
+# claimed by a sender that died are retried by the next leader afterwards
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", 60))
+
+# Staged queries run in shadow next to the active query QUERY_SHADOW_RUNS
+# times (one run per QUERY_SHADOW_INTERVAL_SECONDS) before they can be
+# promoted. With QUERY_REQUIRE_SHADOW_RUN=yes, POST /api/admin/queries
+# refuses direct saves and queries must go through staging.
+QUERY_SHADOW_RUNS = max(1, int(os.getenv("QUERY_SHADOW_RUNS", 5)))
+QUERY_SHADOW_INTERVAL_SECONDS = float(os.getenv("QUERY_SHADOW_INTERVAL_SECONDS", SCHEDULER_INTERVAL_SECONDS))
+QUERY_SHADOW_LATENCY_BUDGET_MS = float(os.getenv("QUERY_SHADOW_LATENCY_BUDGET_MS", 2000))
+QUERY_SHADOW_MAX_DIFF_RATIO = float(os.getenv("QUERY_SHADOW_MAX_DIFF_RATIO", 0.01))
+# A shadow run fails once either query returns more than this many rows
+QUERY_SHADOW_MAX_ROWS = max(1, int(os.getenv("QUERY_SHADOW_MAX_ROWS", 100000)))
+QUERY_REQUIRE_SHADOW_RUN = os.getenv("QUERY_REQUIRE_SHADOW_RUN", "no").lower() == "yes"
+
+# POST /api/admin/queries/{name}/test fetches at most QUERY_TEST_MAX_ROWS rows
+# and cancels statements running longer than QUERY_TEST_TIMEOUT_SECONDS
+# (requests may ask for less, never more). QUERY_TEST_STANDIN_DB is an
+# optional SQLite copy of the ProServer tables, used when the ProServer
+# database is unreachable or the request asks for it.
+QUERY_TEST_MAX_ROWS = max(1, int(os.getenv("QUERY_TEST_MAX_ROWS", 1000)))
+QUERY_TEST_TIMEOUT_SECONDS = max(1.0, float(os.getenv("QUERY_TEST_TIMEOUT_SECONDS", 10)))
+QUERY_TEST_STANDIN_DB = os.getenv("QUERY_TEST_STANDIN_DB", "")
+
+# Cache writes are kept in memory and flushed to app_cache.db this often
+CACHE_FLUSH_INTERVAL_SECONDS = float(os.getenv("CACHE_FLUSH_INTERVAL_SECONDS", 0.5))
+# How often each worker checks app_cache.db for writes made by other workers
+CACHE_REFRESH_INTERVAL_SECONDS = float(os.getenv("CACHE_REFRESH_INTERVAL_SECONDS", 0.2))
+
+# Local SQLite (building_schedules.db) connection tuning
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 16384))
+SQLITE_MMAP_SIZE_BYTES = int(os.getenv("SQLITE_MMAP_SIZE_BYTES", 256 * 1024 * 1024))
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", 256))
+# How often each worker checks whether another worker changed schedules, ignore lists or queries
+SQLITE_CACHE_CHECK_INTERVAL_SECONDS = float(os.getenv("SQLITE_CACHE_CHECK_INTERVAL_SECONDS", 1.0))
+
+# Building start times are wall-clock times in this timezone
+SCHEDULE_TIMEZONE = os.getenv("SCHEDULE_TIMEZONE", "Asia/Kolkata")
+DEFAULT_START_TIME = "20:00"
 
 # -----------------------------
 # Connection String Builder
@@ -108,8 +214,8 @@ try:
     engine = create_engine(
         CONNECTION_STRING,
         echo=False,
-        pool_size=5,
-        max_overflow=10,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
         pool_timeout=30,
         pool_recycle=3600,
     )
@@ -118,6 +224,22 @@ except Exception as e:
     logger.error(f"❌ Error creating engine: {e}")
     raise
 
+# -----------------------------
+# Round-Trip Accounting
+# -----------------------------
+_round_trip_stats = threading.local()
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_round_trip(conn, cursor, statement, parameters, context, executemany):
+    """Counts MSSQL round-trips issued by the current thread."""
+    # pyodbc without fast_executemany sends one batch per parameter set
+    trips = len(parameters) if executemany and parameters else 1
+    _round_trip_stats.count = getattr(_round_trip_stats, "count", 0) + trips
+
+def get_thread_round_trips() -> int:
+    """Returns the number of MSSQL round-trips made so far by the current thread."""
+    return getattr(_round_trip_stats, "count", 0)
+
 # -----------------------------
 # Session Factory
 # -----------------------------
@@ -9,6 +9,7 @@ import sqlite3
 import os
 from logger import get_logger
 from auth import hash_password
+from query_names import QUERY_NAME_ALIASES
 
 logger = get_logger(__name__)
 
@@ -104,12 +105,78 @@ def init_sqlite_db():
                 )
             """)
 
+            # ============ SCHEDULER TABLES ============
+
+            # Lease row used to elect a single scheduler leader across workers
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_lease (
+                    name TEXT PRIMARY KEY,
+                    holder_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    acquired_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+
+            # Durable queue of AXE notifications, drained by the outbox sender
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    dedupe_key TEXT NOT NULL UNIQUE,
+                    building_id INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    sent_at REAL,
+                    last_error TEXT,
+                    claimed_by TEXT,
+                    claimed_until REAL,
+                    published INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_notification_outbox_status_next
+                ON notification_outbox (status, next_attempt_at)
+            """)
+
+            # Staged replacements for query_config rows and their shadow-run results
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_candidates (
+                    query_name TEXT PRIMARY KEY,
+                    query_sql TEXT NOT NULL,
+                    description TEXT,
+                    staged_by TEXT,
+                    staged_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    runs TEXT NOT NULL DEFAULT '[]'
+                )
+            """)
+
+            # Counters bumped by writers so every worker's read cache knows when to reload
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS data_generation (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO data_generation (name, value) VALUES ('schedules', 0)")
+
             conn.commit()
             logger.info("✅ SQLite database tables verified successfully.")
 
             # ============ MIGRATE EXISTING USERS ============
             migrate_existing_users(conn)
 
+            # ============ MIGRATE OUTBOX CLAIMS ============
+            migrate_outbox_claims(conn)
+
+            # ============ MIGRATE INDEXES ============
+            create_missing_indexes(conn)
+
+            # ============ MIGRATE QUERY NAMES ============
+            migrate_legacy_query_names(conn)
+
             # ============ CREATE DEFAULT ADMIN USER ============
             create_default_admin(conn)
 
@@ -151,6 +218,139 @@ def migrate_existing_users(conn):
             pass
 
 
+def migrate_outbox_claims(conn):
+    """
+    Adds the claim columns and the published flag to notification_outbox
+    tables created before senders claimed their rows and tracked delivery to
+    the extra sinks.
+    """
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(notification_outbox)")
+    columns = [row[1] for row in cursor.fetchall()]
+
+    added = []
+    for column, column_type in (("claimed_by", "TEXT"), ("claimed_until", "REAL"),
+                                ("published", "INTEGER NOT NULL DEFAULT 0")):
+        if column not in columns:
+            try:
+                cursor.execute(f"ALTER TABLE notification_outbox ADD COLUMN {column} {column_type}")
+                added.append(column)
+            except Exception as e:
+                logger.error(f"Error adding {column} to notification_outbox: {e}")
+    if "published" in added:
+        # Rows tried before were handed to the sinks on their first attempt
+        cursor.execute("UPDATE notification_outbox SET published = 1 WHERE attempts > 0")
+    if added:
+        conn.commit()
+        logger.info(f"✅ Notification outbox migrated: added {', '.join(added)}")
+
+
+# (index name, table, columns) for lookups the application runs on every request or tick
+LOOKUP_INDEXES = [
+    # State history of one ProEvent, newest first
+    ("idx_proevent_state_history_proevent_time", "proevent_state_history", ("proevent_id", "timestamp")),
+    # get_snapshot / save_snapshot / clear_snapshot by building
+    ("idx_device_state_snapshot_building", "device_state_snapshot", ("building_id",)),
+    # OutboxSender reading back the rows it just claimed
+    ("idx_notification_outbox_claimed_by", "notification_outbox", ("claimed_by",)),
+]
+
+# Indexes created by earlier versions that no lookup uses any more. Ignored
+# ProEvents are served from sqlite_config's in-memory snapshot, which is
+# rebuilt with a full table scan, so the per-building index only cost writes.
+OBSOLETE_INDEXES = ["idx_ignored_proevents_building_disarm"]
+
+
+def create_missing_indexes(conn):
+    """
+    Creates the lookup indexes on databases created before they existed and
+    drops obsolete ones. An index is skipped when an existing one (including
+    the automatic index of a UNIQUE constraint) already starts with the same
+    columns.
+    """
+    cursor = conn.cursor()
+    created = []
+
+    for index_name in OBSOLETE_INDEXES:
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone():
+            cursor.execute(f"DROP INDEX {index_name}")
+            conn.commit()
+            logger.info(f"Dropped obsolete index {index_name}")
+
+    for index_name, table, columns in LOOKUP_INDEXES:
+        covered = False
+        for index_row in cursor.execute(f"PRAGMA index_list({table})").fetchall():
+            indexed = [row[2] for row in cursor.execute(f"PRAGMA index_info({index_row[1]})").fetchall()]
+            if tuple(indexed[:len(columns)]) == columns:
+                covered = True
+                break
+        if covered:
+            continue
+        try:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({', '.join(columns)})")
+            created.append(index_name)
+        except Exception as e:
+            logger.error(f"Error creating index {index_name}: {e}")
+
+    if created:
+        conn.commit()
+        logger.info(f"✅ Created missing indexes: {', '.join(created)}")
+
+
+def migrate_legacy_query_names(conn):
+    """
+    Makes queries saved under the legacy names ('device', 'building') visible
+    under the names the application looks up. Runs once per database: a
+    'legacy_query_names' row in data_generation, written in the same
+    transaction, records that it ran, so a query deleted later (reset to its
+    default) is not brought back from the legacy row on the next start.
+
+    Nothing is renamed or deleted; the legacy row stays where it is. When only
+    the legacy row exists it is copied to the current name. When both exist,
+    the one with the newest updated_at wins (the current name on a tie): a
+    newer legacy row is copied over the current one, otherwise the current row
+    is kept as it is. The choice is logged.
+    """
+    cursor = conn.cursor()
+    if cursor.execute("SELECT 1 FROM data_generation WHERE name = 'legacy_query_names'").fetchone():
+        return
+    copied = 0
+    for legacy_name, query_name in QUERY_NAME_ALIASES.items():
+        rows = {
+            row[0]: row
+            for row in cursor.execute(
+                "SELECT query_name, query_sql, description, created_at, updated_at "
+                "FROM query_config WHERE query_name IN (?, ?)",
+                (legacy_name, query_name)
+            )
+        }
+        legacy, current = rows.get(legacy_name), rows.get(query_name)
+        if legacy is None:
+            continue
+        if current is not None:
+            if (current[4] or "") >= (legacy[4] or ""):
+                logger.info(f"Query '{query_name}' (updated {current[4]}) is not older than legacy '{legacy_name}' "
+                            f"(updated {legacy[4]}); keeping it. The legacy row is left in place.")
+                continue
+            logger.warning(f"⚠️ Legacy query '{legacy_name}' (updated {legacy[4]}) is newer than '{query_name}' "
+                           f"(updated {current[4]}); using it for '{query_name}'. The legacy row is left in place.")
+        else:
+            logger.info(f"Query '{legacy_name}' is only saved under its legacy name; copying it to '{query_name}'.")
+        cursor.execute("""
+            INSERT INTO query_config (query_name, query_sql, description, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(query_name) DO UPDATE SET
+                query_sql = excluded.query_sql,
+                description = excluded.description,
+                updated_at = excluded.updated_at
+        """, (query_name, *legacy[1:]))
+        copied += 1
+    cursor.execute("INSERT INTO data_generation (name, value) VALUES ('legacy_query_names', 1)")
+    conn.commit()
+    if copied:
+        logger.info(f"✅ Copied {copied} legacy query name(s) to their current names")
+
+
 def create_default_admin(conn):
     """
     Creates a default admin user if no admin users exist.
@@ -16,8 +16,10 @@ import logging
 from logger import get_logger, redirect_prints_to_logging
 from routes import router as api_router
 from admin_routes import router as admin_router
-from services.scheduler_service import start_scheduler
+from services.scheduler_service import start_scheduler, stop_scheduler
 from database_setup import init_sqlite_db
+import cache
+import sqlite_db
 
 # --- Configuration ---
 APP_HOST = "127.0.0.1"
@@ -46,10 +48,13 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ Failed to initialize SQLite database: {e}", exc_info=True)
         raise
+
+    # Load the app cache now so request handlers never read it from disk
+    cache.load_cache()
     
-    logger.info("Starting scheduler thread...")
+    logger.info("Starting scheduler...")
     try:
-        start_scheduler()
+        await start_scheduler()
         logger.info("✅ Scheduler started successfully")
     except Exception as e:
         logger.error(f"❌ Failed to start scheduler: {e}", exc_info=True)
@@ -58,6 +63,21 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("Application shutting down...")
+    logger.info("Stopping scheduler and draining in-flight work...")
+    try:
+        await stop_scheduler()
+        logger.info("✅ Scheduler stopped")
+    except Exception as e:
+        logger.error(f"❌ Error while stopping scheduler: {e}", exc_info=True)
+
+    logger.info("Flushing app cache...")
+    try:
+        cache.shutdown()
+        logger.info("✅ App cache flushed")
+    except Exception as e:
+        logger.error(f"❌ Error while flushing app cache: {e}", exc_info=True)
+
+    sqlite_db.close_all()
 
 # --- FastAPI Setup ---
 app = FastAPI(lifespan=lifespan)
@@ -45,6 +45,15 @@ class IgnoredItemResponse(BaseModel):
 
 class IgnoredItemBulkRequest(BaseModel):
     items: List[IgnoredItemRequest]
+    # Re-apply ProEvent states once per affected building after saving
+    reevaluate: bool = False
+
+class IgnoredItemBulkResponse(BaseModel):
+    status: str
+    saved: int
+    failed: int
+    results: List[IgnoredItemResponse]
+    reevaluated_buildings: List[int] = []
 
 class PanelStatus(BaseModel):
     armed: bool
\ No newline at end of file
@@ -3,16 +3,29 @@ Query Configuration Manager
 ============================
 Manages dynamic SQL queries stored in SQLite database.
 Queries are encrypted for security and can be updated via admin panel.
+
+Decrypted queries and their compiled sqlalchemy text() statements are cached
+per query name, so get_query() is a dict lookup once warm. set_query() and
+delete_query() drop the entry locally; changes made by other workers are
+detected every SQLITE_CACHE_CHECK_INTERVAL_SECONDS by comparing each row's
+updated_at and ciphertext (updated_at alone has one-second resolution;
+every encryption produces a different Fernet token).
 """
 
-import sqlite3
 import json
-from contextlib import contextmanager
+import threading
+import time
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+import sqlite_db
+from query_names import normalize_query_name  # re-exported
+from config import SQLITE_CACHE_CHECK_INTERVAL_SECONDS
 from logger import get_logger
 from cryptography.fernet import Fernet
 import base64
 import os
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 
 logger = get_logger(__name__)
@@ -44,21 +57,9 @@ ENCRYPTION_KEY = get_or_create_encryption_key()
 cipher_suite = Fernet(ENCRYPTION_KEY)
 
 
-@contextmanager
 def get_sqlite_connection():
-    """Context manager for SQLite database connections."""
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"SQLite transaction error: {e}")
-        raise
-    else:
-        conn.commit()
-    finally:
-        conn.close()
+    """Context manager for this thread's pooled SQLite connection (see sqlite_db)."""
+    return sqlite_db.get_connection(SQLITE_DB_PATH)
 
 
 def encrypt_query(query: str) -> str:
@@ -69,6 +70,8 @@ def encrypt_query(query: str) -> str:
 
 def decrypt_query(encrypted_query: str) -> str:
     """Decrypt a SQL query string."""
+    with _query_cache_lock:
+        _query_cache_stats["decrypts"] += 1
     try:
         decoded = base64.b64decode(encrypted_query.encode('utf-8'))
         decrypted = cipher_suite.decrypt(decoded)
@@ -95,9 +98,128 @@ FROM Building_TBL
 """
 
 
+# ==================== QUERY CACHE ====================
+
+@dataclass(frozen=True)
+class CachedQuery:
+    query_name: str
+    sql: str
+    # Compiled text() statement, or None for an empty query
+    statement: Optional[TextClause]
+    # (updated_at, ciphertext) of the row it was read from; None when it is the default
+    version: Optional[tuple]
+
+
+_query_cache: Dict[str, CachedQuery] = {}
+# Guards _query_cache and _query_cache_stats; reentrant because decrypt_query counts under it
+_query_cache_lock = threading.RLock()
+_next_change_check_at = 0.0
+_query_cache_stats = {"hits": 0, "misses": 0, "decrypts": 0, "invalidations": 0, "change_checks": 0}
+# Callbacks notified with the query name after a query changed (here or in another worker)
+_query_change_listeners: List[Callable[[str], None]] = []
+
+
+def add_query_change_listener(callback: Callable[[str], None]) -> None:
+    """Registers callback(query_name), called after a cached query was invalidated."""
+    _query_change_listeners.append(callback)
+
+
+def _notify_query_change_listeners(query_names: List[str]) -> None:
+    for query_name in query_names:
+        for callback in list(_query_change_listeners):
+            try:
+                callback(query_name)
+            except Exception as e:
+                logger.error(f"Query change listener failed for '{query_name}': {e}")
+
+
+def invalidate_query_cache(query_name: Optional[str] = None) -> None:
+    """Drops one cached query (or all of them); the next get_query() reloads it."""
+    with _query_cache_lock:
+        names = [normalize_query_name(query_name)] if query_name else list(_query_cache)
+        invalidated = [name for name in names if _query_cache.pop(name, None) is not None]
+        _query_cache_stats["invalidations"] += len(invalidated)
+    _notify_query_change_listeners(names)
+
+
+def _check_for_changes() -> None:
+    """Drops cached queries whose row was changed, added or deleted by another worker."""
+    global _next_change_check_at
+    with _query_cache_lock:
+        if time.monotonic() < _next_change_check_at:
+            return
+        _next_change_check_at = time.monotonic() + SQLITE_CACHE_CHECK_INTERVAL_SECONDS
+        if not _query_cache:
+            return
+        _query_cache_stats["change_checks"] += 1
+        try:
+            with get_sqlite_connection() as conn:
+                versions = {
+                    row['query_name']: (row['updated_at'], row['query_sql'])
+                    for row in conn.execute("SELECT query_name, updated_at, query_sql FROM query_config")
+                }
+        except Exception as e:
+            logger.error(f"Error checking queries for changes: {e}")
+            return
+        changed = [name for name, entry in _query_cache.items() if versions.get(name) != entry.version]
+        for name in changed:
+            del _query_cache[name]
+        _query_cache_stats["invalidations"] += len(changed)
+    if changed:
+        logger.info(f"Queries changed by another worker: {', '.join(changed)}. Reloading.")
+        _notify_query_change_listeners(changed)
+
+
+def get_cached_query(query_name: str) -> CachedQuery:
+    """
+    Returns the decrypted SQL and compiled statement for a query name,
+    from the cache when possible. Falls back to the default query if the
+    query is not configured or cannot be read.
+    """
+    name = normalize_query_name(query_name)
+    if time.monotonic() >= _next_change_check_at:
+        _check_for_changes()
+
+    entry = _query_cache.get(name)
+    if entry is not None:
+        with _query_cache_lock:
+            _query_cache_stats["hits"] += 1
+        return entry
+
+    with _query_cache_lock:
+        entry = _query_cache.get(name)
+        if entry is not None:
+            _query_cache_stats["hits"] += 1
+            return entry
+        _query_cache_stats["misses"] += 1
+        try:
+            with get_sqlite_connection() as conn:
+                row = conn.execute(
+                    "SELECT query_sql, updated_at FROM query_config WHERE query_name = ?",
+                    (name,)
+                ).fetchone()
+            if row:
+                sql = decrypt_query(row['query_sql'])
+                version = (row['updated_at'], row['query_sql'])
+            else:
+                # Return default query if not found
+                logger.info(f"Query '{name}' not found in DB, using default")
+                sql = get_default_query(name)
+                version = None
+        except Exception as e:
+            logger.error(f"Error retrieving query '{name}': {e}")
+            # Fallback to default on error, without caching it so the next call retries
+            sql = get_default_query(name)
+            return CachedQuery(name, sql, text(sql) if sql else None, None)
+
+        entry = CachedQuery(name, sql, text(sql) if sql else None, version)
+        _query_cache[name] = entry
+        return entry
+
+
 def get_query(query_name: str) -> str:
     """
-    Retrieve a query by name from database, or return default.
+    Retrieve a query by name from the cache or database, or return default.
     
     Args:
         query_name: Name of the query to retrieve ('device_query' or 'building_query')
@@ -105,26 +227,13 @@ def get_query(query_name: str) -> str:
     Returns:
         Decrypted SQL query string
     """
-    try:
-        with get_sqlite_connection() as conn:
-            cursor = conn.execute(
-                "SELECT query_sql FROM query_config WHERE query_name = ?",
-                (query_name,)
-            )
-            row = cursor.fetchone()
-            
-            if row:
-                encrypted_query = row['query_sql']
-                return decrypt_query(encrypted_query)
-            else:
-                # Return default query if not found
-                logger.info(f"Query '{query_name}' not found in DB, using default")
-                return get_default_query(query_name)
-                
-    except Exception as e:
-        logger.error(f"Error retrieving query '{query_name}': {e}")
-        # Fallback to default on error
-        return get_default_query(query_name)
+    return get_cached_query(query_name).sql
+
+
+def get_query_cache_stats() -> dict:
+    """Cache counters; 'decrypts' counts every Fernet decryption, cached or not."""
+    with _query_cache_lock:
+        return {**_query_cache_stats, "cached_queries": sorted(_query_cache)}
 
 
 def get_default_query(query_name: str) -> str:
@@ -132,11 +241,8 @@ def get_default_query(query_name: str) -> str:
     defaults = {
         'device_query': DEFAULT_DEVICE_QUERY,
         'building_query': DEFAULT_BUILDING_QUERY,
-        # Legacy names for backward compatibility
-        'device': DEFAULT_DEVICE_QUERY,
-        'building': DEFAULT_BUILDING_QUERY
     }
-    return defaults.get(query_name, "")
+    return defaults.get(normalize_query_name(query_name), "")
 
 
 def set_query(query_name: str, query_sql: str, description: str = "") -> bool:
@@ -151,6 +257,7 @@ def set_query(query_name: str, query_sql: str, description: str = "") -> bool:
     Returns:
         True if successful, False otherwise
     """
+    query_name = normalize_query_name(query_name)
     try:
         encrypted_query = encrypt_query(query_sql)
         
@@ -163,6 +270,7 @@ def set_query(query_name: str, query_sql: str, description: str = "") -> bool:
                     description = excluded.description,
                     updated_at = CURRENT_TIMESTAMP
             """, (query_name, encrypted_query, description))
+        invalidate_query_cache(query_name)
         
         logger.info(f"✅ Query '{query_name}' saved successfully")
         return True
@@ -243,9 +351,11 @@ def delete_query(query_name: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
+    query_name = normalize_query_name(query_name)
     try:
         with get_sqlite_connection() as conn:
             conn.execute("DELETE FROM query_config WHERE query_name = ?", (query_name,))
+        invalidate_query_cache(query_name)
         
         logger.info(f"✅ Query '{query_name}' deleted (will use default)")
         return True
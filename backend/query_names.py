@@ -0,0 +1,17 @@
+"""
+Query Names
+===========
+Legacy query names and the names they are stored and looked up under.
+
+Kept free of config/crypto imports so database_setup can use it before the
+rest of the application is configured.
+"""
+
+QUERY_NAME_ALIASES = {
+    'device': 'device_query',
+    'building': 'building_query',
+}
+
+
+def normalize_query_name(query_name: str) -> str:
+    return QUERY_NAME_ALIASES.get(query_name, query_name)
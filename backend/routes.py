@@ -4,10 +4,11 @@ from fastapi import APIRouter, HTTPException, Query
 from services import device_service, proevent_service, cache_service
 from models import (DeviceOut, DeviceActionRequest, DeviceActionSummaryResponse,
                    BuildingOut, BuildingTimeRequest, BuildingTimeResponse,
-                   IgnoredItemRequest, IgnoredItemBulkRequest,
+                   IgnoredItemRequest, IgnoredItemBulkRequest, IgnoredItemBulkResponse,
+                   IgnoredItemResponse,
                    PanelStatus)
 from sqlite_config import (get_building_time, set_building_time,
-                           get_ignored_proevents, set_proevent_ignore_status,
+                           get_ignored_proevents_for_building, set_proevent_ignore_status_bulk,
                            get_all_building_times)
 from logger import get_logger
 
@@ -30,7 +31,7 @@ def get_panel_status():
 @router.post("/panel_status", response_model=PanelStatus)
 def set_panel_status(status: PanelStatus):
     logger.info(f"POST /panel_status called with status: {'Armed' if status.armed else 'Disarmed'}")
-    cache_service.set_cache_value('panel_armed', status.armed)
+    cache_service.set_cache_value('panel_armed', status.armed, flush_now=True)
     logger.info(f"✅ Global panel status set to: {'Armed' if status.armed else 'Disarmed'}")
     return status
 
@@ -93,8 +94,8 @@ def list_proevents(
         )
         logger.debug(f"Retrieved {len(proevents)} proevents")
         
-        ignored_proevents = get_ignored_proevents()
-        logger.debug(f"Retrieved {len(ignored_proevents)} ignored proevents from SQLite")
+        ignored_proevents = get_ignored_proevents_for_building(building)
+        logger.debug(f"Retrieved {len(ignored_proevents)} ignored proevents for building {building} from SQLite")
         
         proevents_out = []
         
@@ -176,26 +177,52 @@ def reevaluate_building(building_id: int):
         raise HTTPException(status_code=500, detail=f"Failed to re-evaluate building: {e}")
 
 
-@router.post("/proevents/ignore/bulk")
+@router.post("/proevents/ignore/bulk", response_model=IgnoredItemBulkResponse)
 def manage_ignored_proevents_bulk(req: IgnoredItemBulkRequest):
     """
-    Saves the ignore list to the local SQLite DB.
+    Saves the ignore list to the local SQLite DB in one transaction.
+    With reevaluate=true, each affected building is re-evaluated once afterwards.
     """
-    logger.info(f"POST /proevents/ignore/bulk called with {len(req.items)} items")
+    logger.info(f"POST /proevents/ignore/bulk called with {len(req.items)} items (reevaluate={req.reevaluate})")
     try:
-        for item in req.items:
-            logger.debug(f"Setting ignore status for proevent {item.item_id}: ignore={item.ignore}")
-            set_proevent_ignore_status(
-                item.item_id, item.building_frk, item.device_prk, 
-                ignore_on_arm=False,
-                ignore_on_disarm=item.ignore
-            )
-        logger.info(f"✅ Successfully saved ignore status for {len(req.items)} proevents")
-        return {"status": "success"}
+        results = set_proevent_ignore_status_bulk([
+            {
+                "proevent_id": item.item_id,
+                "building_frk": item.building_frk,
+                "device_prk": item.device_prk,
+                "ignore_on_arm": False,
+                "ignore_on_disarm": item.ignore,
+            }
+            for item in req.items
+        ])
     except Exception as e:
         logger.error(f"❌ Error saving ignore bulk: {e}", exc_info=True)
         raise HTTPException(500, "Failed to save ignore status")
 
+    saved = results.count(True)
+    if req.items and saved == 0:
+        logger.error(f"❌ Failed to save ignore status for all {len(req.items)} proevents")
+        raise HTTPException(500, "Failed to save ignore status")
+
+    reevaluated = []
+    if req.reevaluate:
+        for building_id in sorted({item.building_frk for item, ok in zip(req.items, results) if ok}):
+            try:
+                proevent_service.reevaluate_building_state(building_id)
+                reevaluated.append(building_id)
+            except Exception as e:
+                logger.error(f"❌ Failed to re-evaluate building {building_id} after ignore update: {e}", exc_info=True)
+
+    logger.info(f"✅ Saved ignore status for {saved}/{len(req.items)} proevents"
+                + (f", re-evaluated buildings {reevaluated}" if req.reevaluate else ""))
+    return IgnoredItemBulkResponse(
+        status="success" if saved == len(req.items) else "partial",
+        saved=saved,
+        failed=len(req.items) - saved,
+        results=[IgnoredItemResponse(item_id=item.item_id, success=ok) for item, ok in zip(req.items, results)],
+        reevaluated_buildings=reevaluated,
+    )
+
 
 # --- Legacy Endpoint ---
 
@@ -0,0 +1,132 @@
+"""
+Adaptive Panel Poller
+=====================
+Chooses how long to wait before the next panel-state poll.
+
+Polling every minute means an arm/disarm can take up to 60 s to be acted on,
+while polling every few seconds all day multiplies the DB load. The poller
+runs at PANEL_POLL_MIN_SECONDS around building start times and right after a
+detected change, and doubles the interval during quiet periods up to
+PANEL_POLL_MAX_SECONDS. PANEL_POLL_MAX_PER_MINUTE is a hard cap on poll ticks
+that holds no matter what the other rules ask for. It counts polls, not MSSQL
+queries: a tick sends one probe query, plus a full device scan when the probe
+shows a change, so up to twice as many queries can reach ProServer.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from config import (PANEL_POLL_MIN_SECONDS, PANEL_POLL_MAX_SECONDS,
+                    PANEL_POLL_MAX_PER_MINUTE, PANEL_POLL_FAST_WINDOW_SECONDS)
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Reaction latencies kept for the percentile metrics
+LATENCY_SAMPLES = 100
+
+
+class AdaptivePoller:
+    """
+    Tracks poll outcomes and computes the next poll interval.
+
+    Reaction latency is reported as an upper bound: a change seen by a poll
+    happened at some point after the previous poll, so the worst case is the
+    gap between the two polls plus the time it took to apply the change.
+    """
+
+    def __init__(self, schedule_source=None,
+                 min_seconds: float = PANEL_POLL_MIN_SECONDS,
+                 max_seconds: float = PANEL_POLL_MAX_SECONDS,
+                 max_per_minute: int = PANEL_POLL_MAX_PER_MINUTE,
+                 fast_window_seconds: float = PANEL_POLL_FAST_WINDOW_SECONDS):
+        self.min_seconds = min_seconds
+        self.max_seconds = max(max_seconds, min_seconds)
+        self.max_per_minute = max_per_minute
+        self.fast_window_seconds = fast_window_seconds
+        self._schedule_source = schedule_source
+        self._lock = threading.Lock()
+        self._interval = self.max_seconds
+        self._reason = "startup"
+        self._poll_times = deque()
+        self._last_poll_at = None
+        self._last_change_at = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_poll(self, started_at: float, buildings_changed: int, processing_seconds: float):
+        """
+        Records one completed poll.
+
+        Args:
+            started_at: Epoch time the poll started
+            buildings_changed: Number of buildings whose panel state changed
+            processing_seconds: Time taken to detect and apply the changes
+        """
+        with self._lock:
+            if buildings_changed:
+                self._last_change_at = started_at
+                if self._last_poll_at is not None:
+                    self._latencies.append(started_at - self._last_poll_at + processing_seconds)
+            self._last_poll_at = started_at
+            self._poll_times.append(started_at)
+
+    def next_interval(self) -> float:
+        """Returns the number of seconds to wait before the next poll."""
+        now = time.time()
+        with self._lock:
+            if self._last_change_at is not None and now - self._last_change_at < self.fast_window_seconds:
+                interval, reason = self.min_seconds, "recent change"
+            elif self._near_start_time(now):
+                interval, reason = self.min_seconds, "start time window"
+            else:
+                interval, reason = min(self._interval * 2, self.max_seconds), "quiet"
+
+            # Hard cap: never more than max_per_minute polls in any 60 s window
+            while self._poll_times and self._poll_times[0] <= now - 60:
+                self._poll_times.popleft()
+            if len(self._poll_times) >= self.max_per_minute:
+                earliest_allowed = self._poll_times[-self.max_per_minute] + 60
+                if earliest_allowed - now > interval:
+                    interval, reason = earliest_allowed - now, "rate cap"
+
+            if reason != self._reason:
+                logger.info(f"⏱️ POLLER: Interval {self._interval:.0f}s → {interval:.0f}s ({reason})")
+            self._interval = interval
+            self._reason = reason
+            return interval
+
+    def _near_start_time(self, now: float) -> bool:
+        if self._schedule_source is None:
+            return False
+        next_due = self._schedule_source.next_due()
+        if next_due and next_due["fire_at"] - now < self.fast_window_seconds:
+            return True
+        last_fired_at = self._schedule_source.last_fired_at
+        return last_fired_at is not None and now - last_fired_at < self.fast_window_seconds
+
+    def status(self) -> dict:
+        """Returns the current interval, its bounds and reaction latency metrics."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            last_latency = self._latencies[-1] if self._latencies else None
+            polls_last_minute = sum(1 for t in self._poll_times if t > time.time() - 60)
+            interval, reason = self._interval, self._reason
+
+        def nearest_rank(pct):
+            return round(latencies[max(0, math.ceil(pct / 100 * len(latencies)) - 1)], 2)
+
+        return {
+            "current_interval_seconds": round(interval, 1),
+            "reason": reason,
+            "min_interval_seconds": self.min_seconds,
+            "max_interval_seconds": self.max_seconds,
+            "max_polls_per_minute": self.max_per_minute,
+            "polls_last_minute": polls_last_minute,
+            "reaction_latency_seconds": {
+                "samples": len(latencies),
+                "last": round(last_latency, 2),
+                "p50": nearest_rank(50),
+                "p95": nearest_rank(95),
+            } if latencies else None,
+        }
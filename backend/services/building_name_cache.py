@@ -0,0 +1,117 @@
+"""
+Building Name Cache
+===================
+In-process map of building id → name, loaded in bulk from ProServer.
+
+AXE messages need the building name, and looking it up per alert meant one
+MSSQL round-trip per building when hundreds of buildings share a start time.
+The cache loads every building with one query and is reused by the alert
+path and the building list endpoint.
+
+The map is reloaded when older than its TTL, or when a lookup misses (a
+building added since the last load), at most once per MISS_REFRESH_SECONDS
+so an unknown id cannot trigger a reload on every call.
+"""
+
+import threading
+import time
+from typing import Callable
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+MISS_REFRESH_SECONDS = 30.0
+
+
+class BuildingNameCache:
+    """
+    Thread-safe building id → name map with TTL and refresh-on-miss.
+
+    The loader returns [{"id", "name"}, ...] and raises on database errors.
+    If a reload fails, the previous map keeps being served (also after
+    invalidate(), which only marks it stale); with no previous map the error
+    propagates so callers can retry.
+    """
+
+    def __init__(self, loader: Callable[[], list[dict]], ttl_seconds: float):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._buildings: list[dict] = []
+        self._names: dict[int, str] = {}
+        self._loaded_at = None
+        # Set by invalidate(): reload on the next lookup, but keep serving the map if that fails
+        self._stale = False
+        # After a failed reload, no new attempt before this time
+        self._retry_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "load_failures": 0}
+
+    def get_name(self, building_id: int) -> str | None:
+        """Returns the building's name, or None if ProServer has no such building."""
+        names = self._current()
+        name = names.get(building_id)
+        loaded_at = self._loaded_at
+        now = time.monotonic()
+        if name is None and now >= self._retry_at and (loaded_at is None or now - loaded_at >= MISS_REFRESH_SECONDS):
+            names = self._refresh(force=True)
+            name = names.get(building_id)
+
+        self._stats["hits" if name is not None else "misses"] += 1
+        return name
+
+    def get_all(self) -> list[dict]:
+        """Returns every building as [{"id", "name"}, ...]."""
+        self._current()
+        return list(self._buildings)
+
+    def invalidate(self):
+        """Reloads on the next lookup (e.g. after building_query is changed); the current map stays as a fallback."""
+        with self._lock:
+            self._stale = True
+            self._retry_at = 0.0
+
+    def _needs_reload(self) -> bool:
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            return True
+        now = time.monotonic()
+        return now >= self._retry_at and (self._stale or now - loaded_at >= self.ttl_seconds)
+
+    def _current(self) -> dict[int, str]:
+        if self._needs_reload():
+            return self._refresh()
+        return self._names
+
+    def _refresh(self, force: bool = False) -> dict[int, str]:
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if not force and not self._needs_reload():
+                return self._names
+            try:
+                buildings = self._loader()
+            except Exception as e:
+                self._stats["load_failures"] += 1
+                if self._loaded_at is None:
+                    raise
+                logger.error(f"❌ BUILDING NAMES: Reload failed, serving {len(self._names)} cached names: {e}")
+                # Back off for the miss interval instead of retrying on every lookup
+                self._retry_at = time.monotonic() + MISS_REFRESH_SECONDS
+                return self._names
+
+            self._buildings = buildings
+            self._names = {b["id"]: b["name"] for b in buildings if b["name"]}
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._retry_at = 0.0
+            self._stats["loads"] += 1
+            logger.info(f"✅ BUILDING NAMES: Loaded {len(self._names)} building names")
+            return self._names
+
+    def status(self) -> dict:
+        return {
+            "buildings": len(self._names),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            "ttl_seconds": self.ttl_seconds,
+            "stale": self._stale,
+            **self._stats,
+        }
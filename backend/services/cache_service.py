@@ -1,17 +1,24 @@
-from cache import load_cache, save_cache
+from cache import flush, get_value, set_value, update_value
 from logger import get_logger
 
 logger = get_logger(__name__)
 
 def get_cache_value(key):
     logger.debug(f"Getting value from cache for key: {key}")
-    cache = load_cache()
-    return cache.get(key)
+    return get_value(key)
 
-def set_cache_value(key, value):
+def set_cache_value(key, value, flush_now=False):
+    """Sets a key; with flush_now=True it is written to disk (and visible to other workers) before returning."""
     logger.debug(f"Setting value in cache for key: {key}")
-    cache = load_cache()
-    cache[key] = value
-    save_cache(cache)
-    logger.info(f"Cache updated for key: {key}")
-    return True
\ No newline at end of file
+    if set_value(key, value):
+        logger.info(f"Cache updated for key: {key}")
+        if flush_now:
+            flush()
+    else:
+        logger.debug(f"Cache value unchanged for key: {key}. Write skipped.")
+    return True
+
+def update_cache_value(key, update, default=None):
+    """Atomically applies update(current_value) to a key and returns the new value."""
+    logger.debug(f"Updating value in cache for key: {key}")
+    return update_value(key, update, default)
@@ -0,0 +1,47 @@
+"""
+Statement Timeouts
+==================
+Cancels long-running statements on one SQLAlchemy connection, for code that
+runs admin-supplied SQL against ProServer (query dry runs, shadow runs).
+
+On SQL Server the pyodbc query timeout is used (whole seconds, reported as
+HYT00 "Timeout expired"); on SQLite a progress handler aborts the statement
+with "interrupted".
+"""
+
+import math
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def statement_timeout(conn, seconds: float):
+    """Cancels statements on `conn` that run longer than `seconds`, restoring the connection afterwards."""
+    dbapi_conn = conn.connection.dbapi_connection
+    if conn.dialect.name == "sqlite":
+        deadline = time.monotonic() + seconds
+        # A non-zero return aborts the statement with "interrupted"
+        dbapi_conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        try:
+            yield
+        finally:
+            dbapi_conn.set_progress_handler(None, 0)
+    else:
+        # pyodbc query timeout, whole seconds, applies to every statement on the connection
+        previous = getattr(dbapi_conn, "timeout", 0)
+        dbapi_conn.timeout = max(1, math.ceil(seconds))
+        try:
+            yield
+        finally:
+            dbapi_conn.timeout = previous
+
+
+def error_message(error: Exception) -> str:
+    # The driver's message, without SQLAlchemy's echo of the SQL
+    return str(getattr(error, "orig", None) or error)
+
+
+def is_timeout(error: Exception) -> bool:
+    """True if `error` is a statement cancelled by statement_timeout()."""
+    message = error_message(error).lower()
+    return "interrupted" in message or "hyt00" in message or "timeout expired" in message
@@ -0,0 +1,137 @@
+"""
+Leader Election
+===============
+Ensures exactly one process runs the scheduler when uvicorn runs with several workers.
+
+Every worker competes for a lease row in building_schedules.db (table
+scheduler_lease). The holder renews it with a heartbeat; if the holder dies or
+stops renewing, the lease expires after LEADER_LEASE_TTL_SECONDS and another
+worker takes over on its next heartbeat. Only the lease holder runs
+leader-only scheduler jobs and the start-time dispatcher.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable
+import sqlite_config
+from config import LEADER_LEASE_TTL_SECONDS
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LeaderLease:
+    """
+    A renewable, expiring lease stored in SQLite.
+
+    try_acquire() both acquires a free/expired lease and renews one already
+    held. is_leader also checks the local expiry, so a process that stalled
+    past its lease stops acting as leader even before its next heartbeat.
+    """
+
+    def __init__(self, name: str = "scheduler", ttl_seconds: float = LEADER_LEASE_TTL_SECONDS):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._expires_at = 0.0
+        self._held = False
+        self._lock = threading.Lock()
+        self._on_acquired: list[Callable[[], None]] = []
+        self._on_lost: list[Callable[[], None]] = []
+
+    @property
+    def is_leader(self) -> bool:
+        return self._held and time.time() < self._expires_at
+
+    def on_acquired(self, callback: Callable[[], None]):
+        """Registers a callback run when this process becomes leader."""
+        self._on_acquired.append(callback)
+
+    def on_lost(self, callback: Callable[[], None]):
+        """Registers a callback run when this process stops being leader."""
+        self._on_lost.append(callback)
+
+    def try_acquire(self) -> bool:
+        """
+        Acquires the lease if it is free or expired, or renews it if already held.
+
+        Returns:
+            bool: True if this process holds the lease after the call
+        """
+        with self._lock:
+            was_leader = self.is_leader
+            now = time.time()
+            expires_at = now + self.ttl_seconds
+
+            try:
+                with sqlite_config.get_sqlite_connection() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO scheduler_lease (name, holder_id, expires_at, acquired_at, heartbeat_at) "
+                        "VALUES (?, '', 0, 0, 0)",
+                        (self.name,)
+                    )
+                    cursor = conn.execute("""
+                        UPDATE scheduler_lease
+                        SET holder_id = ?,
+                            acquired_at = CASE WHEN holder_id = ? THEN acquired_at ELSE ? END,
+                            heartbeat_at = ?,
+                            expires_at = ?
+                        WHERE name = ? AND (holder_id = ? OR expires_at < ?)
+                    """, (self.holder_id, self.holder_id, now, now, expires_at, self.name, self.holder_id, now))
+                    acquired = cursor.rowcount == 1
+            except Exception as e:
+                logger.error(f"❌ LEADER: Heartbeat failed for lease '{self.name}': {e}")
+                acquired = False
+
+            self._held = acquired
+            if acquired:
+                self._expires_at = expires_at
+
+        if acquired and not was_leader:
+            logger.info(f"👑 LEADER: {self.holder_id} acquired lease '{self.name}'")
+            self._run_callbacks(self._on_acquired)
+        elif was_leader and not acquired:
+            logger.warning(f"⚠️ LEADER: {self.holder_id} lost lease '{self.name}'")
+            self._run_callbacks(self._on_lost)
+        return acquired
+
+    def release(self):
+        """Gives up the lease so another process can take over immediately."""
+        with self._lock:
+            was_leader = self._held
+            self._held = False
+            self._expires_at = 0.0
+            try:
+                with sqlite_config.get_sqlite_connection() as conn:
+                    conn.execute(
+                        "UPDATE scheduler_lease SET expires_at = 0 WHERE name = ? AND holder_id = ?",
+                        (self.name, self.holder_id)
+                    )
+            except Exception as e:
+                logger.error(f"❌ LEADER: Failed to release lease '{self.name}': {e}")
+
+        if was_leader:
+            logger.info(f"LEADER: {self.holder_id} released lease '{self.name}'")
+            self._run_callbacks(self._on_lost)
+
+    def status(self) -> dict:
+        """Returns this process's view of the lease."""
+        return {
+            "name": self.name,
+            "holder_id": self.holder_id,
+            "is_leader": self.is_leader,
+            "expires_in_seconds": round(max(0.0, self._expires_at - time.time()), 1) if self.is_leader else None,
+        }
+
+    def _run_callbacks(self, callbacks: list[Callable[[], None]]):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"❌ LEADER: Lease callback failed: {e}", exc_info=True)
+
+
+scheduler_lease = LeaderLease()
@@ -0,0 +1,409 @@
+"""
+Notification Outbox
+===================
+Durable queue for AXE notifications, stored in building_schedules.db.
+
+Alerts used to be sent inline by the scheduler and were lost on any socket
+error. Now the scheduler only appends a row to notification_outbox (a local
+SQLite insert) and OutboxSender delivers it in the background: in batches,
+with retries and exponential back-off, and surviving restarts because pending
+rows stay in the table.
+
+Each row carries a dedupe key of building + event + local date, so a building
+gets at most one alert of each kind per day even if its start time is
+reached twice (a schedule edit, a leader failover, a manual re-run).
+
+Only the scheduler leader runs the sender. A leader whose process stalled
+past its lease keeps its sender thread until the next heartbeat notices,
+so the sender fences itself: it sends only while the lease is unexpired,
+and it claims each batch atomically (claimed_by / claimed_until) before
+sending, so two senders never deliver the same row.
+
+Extra notification sinks (see notification_sinks) get each row once: the
+published flag is set as soon as a row has been handed to them, whichever
+attempt that is, so a row whose first attempt failed before the send (a
+building name lookup error) still reaches them on a later one.
+"""
+
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+import pytz
+import sqlite_config
+from config import (SCHEDULE_TIMEZONE, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS,
+                    OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETENTION_DAYS, OUTBOX_CLAIM_SECONDS)
+from services import proserver_service
+from services.leader_election import LeaderLease, scheduler_lease
+from services.notification_sinks import AXE_MESSAGE_FORMATS, Notification
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Sleep between outbox checks when nothing wakes the sender
+IDLE_POLL_SECONDS = 5.0
+CLEANUP_INTERVAL_SECONDS = 3600
+# Window used for the delivery rate in get_outbox_stats
+RATE_WINDOW_SECONDS = 300
+# Delivery latencies kept for the percentile metrics
+LATENCY_SAMPLES = 1000
+
+
+def dedupe_key(building_id: int, event: str, event_date: str) -> str:
+    return f"{building_id}:{event}:{event_date}"
+
+
+def enqueue(building_id: int, event: str, event_date: str | None = None) -> bool:
+    """
+    Queues an AXE notification for background delivery.
+
+    Args:
+        building_id: Building the alert is for
+        event: "armed" or "disarmed"
+        event_date: Local date (YYYY-MM-DD) used for deduplication; defaults to today
+
+    Returns:
+        bool: True if queued, False if already queued for that day or on error
+    """
+    return enqueue_many([building_id], event, event_date) == 1
+
+
+def enqueue_many(building_ids: list[int], event: str, event_date: str | None = None) -> int:
+    """
+    Queues the same AXE notification for several buildings in one transaction,
+    so alerts due together reach the sender as one batch.
+
+    Returns:
+        int: Number of alerts queued (duplicates for the same day are skipped)
+    """
+    if event not in AXE_MESSAGE_FORMATS:
+        raise ValueError(f"Unknown notification event '{event}'")
+    if event_date is None:
+        event_date = datetime.now(pytz.timezone(SCHEDULE_TIMEZONE)).strftime("%Y-%m-%d")
+
+    now = time.time()
+    queued, skipped = [], []
+    try:
+        with sqlite_config.get_sqlite_connection() as conn:
+            for building_id in building_ids:
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO notification_outbox
+                        (dedupe_key, building_id, event, status, attempts, next_attempt_at, created_at)
+                    VALUES (?, ?, ?, 'pending', 0, ?, ?)
+                """, (dedupe_key(building_id, event, event_date), building_id, event, now, now))
+                (queued if cursor.rowcount == 1 else skipped).append(building_id)
+    except Exception as e:
+        logger.error(f"❌ OUTBOX: Failed to queue {event} alerts for buildings {building_ids}: {e}")
+        return 0
+
+    if queued:
+        logger.info(f"📥 OUTBOX: Queued {event} alert for building(s) {queued}")
+        outbox_sender.wake()
+    if skipped:
+        logger.info(f"OUTBOX: {event} alert for building(s) {skipped} already queued for {event_date}. Skipped.")
+    return len(queued)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential back-off after the given number of failed attempts."""
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+
+class OutboxSender:
+    """
+    Background thread that delivers pending outbox rows to ProServer.
+
+    With a lease, batches are claimed and sent only while the lease is held.
+    Claims are per batch and expire after `claim_seconds`, so rows held by
+    a sender that died are picked up again by the next one.
+    """
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, lease: LeaderLease | None = None,
+                 claim_seconds: float = OUTBOX_CLAIM_SECONDS):
+        self.batch_size = batch_size
+        self.lease = lease
+        self.claim_seconds = claim_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._next_cleanup_at = 0.0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.last_batch = None
+        self.last_error = None
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Starts the sender thread (no-op if it is already running)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="OutboxSender")
+        self._thread.start()
+        logger.info("✅ OUTBOX: Sender started")
+
+    def stop(self, timeout: float = 10.0):
+        """Stops the sender after its current batch. Undelivered rows stay queued."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("OUTBOX: Sender stopped")
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def wake(self):
+        """Asks the sender to check the outbox now instead of at its next poll."""
+        self._wake.set()
+
+    # --- Delivery Loop ---
+
+    def _holds_lease(self) -> bool:
+        return self.lease is None or self.lease.is_leader
+
+    def _run(self):
+        while not self._stopping.is_set():
+            wait_seconds = 0.0
+            try:
+                if not self._holds_lease():
+                    # Lease ran out (e.g. a stalled process); on_lost stops this thread
+                    wait_seconds = IDLE_POLL_SECONDS
+                else:
+                    delivered = self.drain_once()
+                    if time.time() >= self._next_cleanup_at:
+                        self._cleanup()
+                    if delivered < self.batch_size:
+                        wait_seconds = self._seconds_until_next_due()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"❌ OUTBOX: Error in sender loop: {e}", exc_info=True)
+                wait_seconds = IDLE_POLL_SECONDS
+
+            if wait_seconds:
+                self._wake.wait(wait_seconds)
+                self._wake.clear()
+
+    def _seconds_until_next_due(self) -> float:
+        with sqlite_config.get_sqlite_connection() as conn:
+            # Rows claimed by another sender are due again when the claim expires
+            next_at = conn.execute("""
+                SELECT MIN(MAX(next_attempt_at, COALESCE(claimed_until, 0)))
+                FROM notification_outbox WHERE status = 'pending'
+            """).fetchone()[0]
+        if next_at is None:
+            return IDLE_POLL_SECONDS
+        return min(max(0.0, next_at - time.time()), IDLE_POLL_SECONDS)
+
+    def _claim_batch(self) -> tuple[str, list]:
+        """
+        Claims up to batch_size due, unclaimed rows with a single UPDATE.
+
+        Returns:
+            tuple: (claim token, claimed rows)
+        """
+        now = time.time()
+        holder = self.lease.holder_id if self.lease else "local"
+        claim = f"{holder}:{uuid.uuid4().hex[:8]}"
+        with sqlite_config.get_sqlite_connection() as conn:
+            conn.execute("""
+                UPDATE notification_outbox SET claimed_by = ?, claimed_until = ?
+                WHERE id IN (
+                    SELECT id FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                      AND (claimed_until IS NULL OR claimed_until < ?)
+                    ORDER BY id LIMIT ?
+                )
+            """, (claim, now + self.claim_seconds, now, now, self.batch_size))
+            rows = conn.execute("""
+                SELECT id, building_id, event, attempts, published, created_at FROM notification_outbox
+                WHERE claimed_by = ? ORDER BY id
+            """, (claim,)).fetchall()
+        return claim, rows
+
+    def _release_claim(self, claim: str):
+        with sqlite_config.get_sqlite_connection() as conn:
+            conn.execute(
+                "UPDATE notification_outbox SET claimed_by = NULL, claimed_until = NULL WHERE claimed_by = ?",
+                (claim,)
+            )
+
+    def drain_once(self) -> int:
+        """
+        Claims and delivers one batch of due rows.
+
+        Returns:
+            int: Number of rows processed (sent, rescheduled or failed)
+        """
+        if not self._holds_lease():
+            return 0
+        claim, rows = self._claim_batch()
+        if not rows:
+            return 0
+
+        results = self._deliver(rows)
+        if results is None:
+            logger.warning(f"⚠️ OUTBOX: Leader lease expired. Releasing {len(rows)} claimed row(s) unsent.")
+            self._release_claim(claim)
+            return 0
+        self._record_results(claim, *results)
+        return len(rows)
+
+    def _deliver(self, rows: list) -> tuple[list, list, list] | None:
+        """
+        Sends claimed rows.
+
+        Returns:
+            tuple: (sent [(row, sent_at)], retry [(row, error)], failed [(row, error)]),
+                   or None if the lease ran out before anything was sent
+        """
+        ready, notifications, retry, failed = [], [], [], []
+        for row in rows:
+            try:
+                building_name = proserver_service.get_building_name(row["building_id"])
+            except Exception as e:
+                retry.append((row, f"Building name lookup failed: {e}"))
+                continue
+            if not building_name:
+                failed.append((row, "Building name not found"))
+                continue
+            ready.append(row)
+            notifications.append(Notification.create(row["building_id"], building_name, row["event"],
+                                                     created_at=row["created_at"]))
+
+        # The lease may have run out while names were looked up
+        if notifications and not self._holds_lease():
+            return None
+
+        sent = []
+        if notifications:
+            # Extra sinks get each notification once, whatever ProServer does
+            sinks = proserver_service.notification_sinks
+            unpublished = [(row, n) for row, n in zip(ready, notifications) if not row["published"]]
+            if unpublished:
+                sinks.publish([n for _, n in unpublished])
+                self._mark_published([row["id"] for row, _ in unpublished])
+
+            # Fanned out over the connection pool; each slice reports when it was written
+            sent_times = sinks.primary.send_batch(notifications)
+            for row, notification, sent_at in zip(ready, notifications, sent_times):
+                if sent_at is None:
+                    retry.append((row, "ProServer send failed"))
+                else:
+                    sent.append((row, sent_at))
+                    logger.info(f"✅ OUTBOX: AXE notification sent: {notification.message}")
+            self._record_batch_timing(sent)
+        return sent, retry, failed
+
+    def _mark_published(self, row_ids: list[int]):
+        with sqlite_config.get_sqlite_connection() as conn:
+            conn.executemany("UPDATE notification_outbox SET published = 1 WHERE id = ?",
+                             [(row_id,) for row_id in row_ids])
+
+    def _record_batch_timing(self, sent: list):
+        """Records per-alert delivery latency (queued → written) and the first-to-last spread."""
+        if not sent:
+            return
+        latencies = [sent_at - row["created_at"] for row, sent_at in sent]
+        self._latencies.extend(latencies)
+        sent_times = [sent_at for _, sent_at in sent]
+        self.last_batch = {
+            "size": len(sent),
+            "spread_seconds": round(max(sent_times) - min(sent_times), 4),
+            "max_latency_seconds": round(max(latencies), 4),
+        }
+        logger.info(f"📤 OUTBOX: Delivered {len(sent)} alert(s); first-to-last spread "
+                    f"{self.last_batch['spread_seconds'] * 1000:.1f}ms, "
+                    f"max latency {self.last_batch['max_latency_seconds'] * 1000:.1f}ms")
+
+    def latency_percentiles(self) -> dict | None:
+        """Returns nearest-rank p50/p95/max of recent delivery latencies, in seconds."""
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+
+        def nearest_rank(pct):
+            return round(latencies[max(0, math.ceil(pct / 100 * len(latencies)) - 1)], 4)
+
+        return {"samples": len(latencies), "p50": nearest_rank(50), "p95": nearest_rank(95),
+                "max": round(latencies[-1], 4)}
+
+    def _record_results(self, claim: str, sent: list, retry: list, failed: list):
+        now = time.time()
+        updates = []
+        for row, error in retry:
+            attempts = row["attempts"] + 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                failed.append((row, f"{error} (gave up after {attempts} attempts)"))
+                continue
+            delay = retry_delay(attempts)
+            logger.warning(f"⚠️ OUTBOX: {row['event']} alert for building {row['building_id']}: {error}. "
+                           f"Retry {attempts} in {delay:.0f}s.")
+            updates.append(("pending", attempts, now + delay, None, error, row["id"], claim))
+        for row, error in failed:
+            logger.error(f"❌ OUTBOX: {row['event']} alert for building {row['building_id']} failed: {error}")
+            updates.append(("failed", row["attempts"] + 1, now, None, error, row["id"], claim))
+        updates.extend(("sent", row["attempts"] + 1, sent_at, sent_at, None, row["id"], claim)
+                       for row, sent_at in sent)
+
+        with sqlite_config.get_sqlite_connection() as conn:
+            conn.executemany("""
+                UPDATE notification_outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, sent_at = ?, last_error = ?,
+                    claimed_by = NULL, claimed_until = NULL
+                WHERE id = ? AND claimed_by = ?
+            """, updates)
+        if retry or failed:
+            self.last_error = (retry or failed)[-1][1]
+        elif sent:
+            self.last_error = None
+
+    def _cleanup(self):
+        cutoff = time.time() - OUTBOX_RETENTION_DAYS * 86400
+        with sqlite_config.get_sqlite_connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM notification_outbox WHERE status != 'pending' AND created_at < ?", (cutoff,)
+            )
+        if cursor.rowcount:
+            logger.info(f"🧹 OUTBOX: Removed {cursor.rowcount} delivered/failed rows older than {OUTBOX_RETENTION_DAYS} days")
+        self._next_cleanup_at = time.time() + CLEANUP_INTERVAL_SECONDS
+
+
+outbox_sender = OutboxSender(lease=scheduler_lease)
+
+
+def get_outbox_stats() -> dict:
+    """Returns queue depth, age of the oldest pending row and the recent delivery rate."""
+    now = time.time()
+    try:
+        with sqlite_config.get_sqlite_connection() as conn:
+            pending, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM notification_outbox WHERE status = 'pending'"
+            ).fetchone()
+            sent_recently = conn.execute(
+                "SELECT COUNT(*) FROM notification_outbox WHERE status = 'sent' AND sent_at > ?",
+                (now - RATE_WINDOW_SECONDS,)
+            ).fetchone()[0]
+            failed = conn.execute(
+                "SELECT COUNT(*) FROM notification_outbox WHERE status = 'failed'"
+            ).fetchone()[0]
+    except Exception as e:
+        logger.error(f"❌ OUTBOX: Failed to read outbox stats: {e}")
+        return {"error": str(e)}
+
+    return {
+        "sender_running": outbox_sender.is_running,
+        "queue_depth": pending,
+        "oldest_pending_age_seconds": round(now - oldest, 1) if oldest else None,
+        "sent_last_5_minutes": sent_recently,
+        "delivery_rate_per_minute": round(sent_recently / (RATE_WINDOW_SECONDS / 60), 2),
+        "failed": failed,
+        "delivery_latency_seconds": outbox_sender.latency_percentiles(),
+        "last_batch": outbox_sender.last_batch,
+        "sinks": proserver_service.notification_sinks.status(),
+        "last_error": outbox_sender.last_error,
+    }
@@ -0,0 +1,276 @@
+"""
+Notification Sinks
+==================
+Delivers arm/disarm notifications to ProServer and to optional local consumers.
+
+ProServer (raw TCP) is the primary sink: the outbox delivers to it directly
+and retries on failure. Extra sinks configured with NOTIFICATION_SINKS (a
+syslog/UDP collector, a file spool, a local HTTP webhook) each get their own
+bounded queue and worker thread, so a slow or unreachable consumer can never
+hold up ProServer delivery, the other sinks or the scheduler tick. Delivery to
+extra sinks is best effort: a few retries, then the batch is dropped and
+counted.
+
+NOTIFICATION_SINKS is a comma-separated list of URLs:
+    udp://host:514            syslog (RFC 3164) datagrams
+    file:///var/spool/axe     one JSON file per notification, written atomically
+    http://127.0.0.1:8080/x   JSON array POSTed per batch
+"""
+
+import abc
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.request
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from urllib.parse import urlparse
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+AXE_MESSAGE_FORMATS = {
+    "armed": "axe,{building_name}_Is_Armed@",
+    "disarmed": "axe,{building_name}_Is_Disarmed@",
+}
+
+# Extra-sink delivery: events per batch and attempts before a batch is dropped
+SINK_BATCH_SIZE = 100
+SINK_MAX_ATTEMPTS = 3
+
+
+@dataclass(frozen=True)
+class Notification:
+    building_id: int | None
+    building_name: str
+    event: str
+    message: str
+    created_at: float
+
+    @classmethod
+    def create(cls, building_id: int | None, building_name: str, event: str,
+               created_at: float | None = None) -> "Notification":
+        return cls(building_id, building_name, event,
+                   AXE_MESSAGE_FORMATS[event].format(building_name=building_name),
+                   created_at if created_at is not None else time.time())
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class NotificationSink(abc.ABC):
+    """
+    A notification destination.
+
+    send_batch() delivers a batch and returns, per notification, the epoch
+    time it was delivered or None. Extra sinks may instead raise on failure;
+    the whole batch is then retried.
+    """
+
+    name = "sink"
+
+    @abc.abstractmethod
+    def send_batch(self, notifications: list[Notification]) -> list[float | None]:
+        """Delivers `notifications`; see the class docstring for the return value."""
+
+    def close(self):
+        pass
+
+
+class TcpSink(NotificationSink):
+    """ProServer AXE frames over the shared connection pool."""
+
+    name = "proserver"
+
+    def __init__(self, client_pool):
+        self.client_pool = client_pool
+
+    def send_batch(self, notifications: list[Notification]) -> list[float | None]:
+        return self.client_pool.send_batch([n.message for n in notifications])
+
+    def close(self):
+        self.client_pool.close()
+
+
+class UdpSyslogSink(NotificationSink):
+    """One RFC 3164 syslog datagram per notification."""
+
+    def __init__(self, host: str, port: int = 514):
+        self.name = f"udp://{host}:{port}"
+        self.address = (host, port)
+        self.hostname = socket.gethostname()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send_batch(self, notifications: list[Notification]) -> list[float | None]:
+        sent_times = []
+        for n in notifications:
+            timestamp = datetime.fromtimestamp(n.created_at).strftime("%b %d %H:%M:%S")
+            # <14> = facility user, severity info
+            self._sock.sendto(f"<14>{timestamp} {self.hostname} axe-scheduler: {n.message}".encode(), self.address)
+            sent_times.append(time.time())
+        return sent_times
+
+    def close(self):
+        self._sock.close()
+
+
+class FileSpoolSink(NotificationSink):
+    """One JSON file per notification; written to a temp name and renamed so readers never see partial files."""
+
+    def __init__(self, directory: str):
+        self.name = f"file://{directory}"
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send_batch(self, notifications: list[Notification]) -> list[float | None]:
+        sent_times = []
+        for n in notifications:
+            filename = f"{int(n.created_at * 1000)}-{n.building_id}-{n.event}-{uuid.uuid4().hex[:8]}.json"
+            tmp_path = os.path.join(self.directory, f".{filename}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(n.to_dict(), f)
+            os.replace(tmp_path, os.path.join(self.directory, filename))
+            sent_times.append(time.time())
+        return sent_times
+
+
+class WebhookSink(NotificationSink):
+    """POSTs each batch as a JSON array; any non-2xx response fails the batch."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.name = url
+        self.url = url
+        self.timeout = timeout
+
+    def send_batch(self, notifications: list[Notification]) -> list[float | None]:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps([n.to_dict() for n in notifications]).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass  # urlopen raises HTTPError for non-2xx
+        return [time.time()] * len(notifications)
+
+
+def build_sinks(spec: str, timeout: float = 5.0) -> list[NotificationSink]:
+    """Parses a NOTIFICATION_SINKS value into sink instances, skipping invalid entries."""
+    sinks = []
+    for url in filter(None, (part.strip() for part in (spec or "").split(","))):
+        parsed = urlparse(url)
+        try:
+            if parsed.scheme in ("udp", "syslog"):
+                sinks.append(UdpSyslogSink(parsed.hostname, parsed.port or 514))
+            elif parsed.scheme == "file":
+                sinks.append(FileSpoolSink(parsed.path))
+            elif parsed.scheme in ("http", "https"):
+                sinks.append(WebhookSink(url, timeout))
+            else:
+                logger.error(f"❌ SINKS: Unsupported notification sink '{url}'. Skipped.")
+        except Exception as e:
+            logger.error(f"❌ SINKS: Could not set up notification sink '{url}': {e}")
+    return sinks
+
+
+class SinkWorker:
+    """Bounded queue plus a delivery thread for one extra sink."""
+
+    def __init__(self, sink: NotificationSink, queue_size: int):
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats = {"delivered": 0, "dropped": 0, "failures": 0, "last_error": None}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"Sink:{self.sink.name}")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def publish(self, notifications: list[Notification]):
+        """Queues notifications without blocking; drops them if the queue is full."""
+        for n in notifications:
+            try:
+                self._queue.put_nowait(n)
+            except queue.Full:
+                self._stats["dropped"] += 1
+                logger.warning(f"⚠️ SINKS: Queue full for '{self.sink.name}'. Dropped: {n.message}")
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+            while len(batch) < SINK_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._deliver(batch)
+
+    def _deliver(self, batch: list[Notification]):
+        for attempt in range(1, SINK_MAX_ATTEMPTS + 1):
+            try:
+                self.sink.send_batch(batch)
+                self._stats["delivered"] += len(batch)
+                return
+            except Exception as e:
+                self._stats["failures"] += 1
+                self._stats["last_error"] = str(e)
+                logger.warning(f"⚠️ SINKS: Delivery to '{self.sink.name}' failed (attempt {attempt}): {e}")
+                if self._stopping.wait(2 ** (attempt - 1)):
+                    break
+        self._stats["dropped"] += len(batch)
+        logger.error(f"❌ SINKS: Dropped {len(batch)} notification(s) for '{self.sink.name}'")
+
+    def status(self) -> dict:
+        return {"name": self.sink.name, "queue_depth": self._queue.qsize(), **self._stats}
+
+
+class NotificationFanout:
+    """
+    Sends notifications to the primary (ProServer) sink and hands them to
+    every extra sink's queue.
+    """
+
+    def __init__(self, primary: NotificationSink, extra_sinks: list[NotificationSink], queue_size: int = 1000):
+        self.primary = primary
+        self.workers = [SinkWorker(sink, queue_size) for sink in extra_sinks]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        if self.workers:
+            logger.info(f"✅ SINKS: Started {len(self.workers)} extra notification sink(s): "
+                        f"{', '.join(w.sink.name for w in self.workers)}")
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def publish(self, notifications: list[Notification]):
+        """Queues notifications for every extra sink. Never blocks."""
+        for worker in self.workers:
+            worker.publish(notifications)
+
+    def deliver(self, notifications: list[Notification]) -> list[float | None]:
+        """Publishes to the extra sinks, then sends to ProServer and returns its per-item results."""
+        self.publish(notifications)
+        return self.primary.send_batch(notifications)
+
+    def status(self) -> list[dict]:
+        return [worker.status() for worker in self.workers]
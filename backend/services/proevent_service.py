@@ -4,16 +4,46 @@ ProEvent Service - FIXED VERSION
 FIXED: When ProEvent is unchecked from ignore list, it becomes REACTIVE (state = 0) immediately
 """
 
-from services import proserver_service, device_service, cache_service
+from services import proserver_service, device_service, cache_service, notification_outbox
+from services.tick_context import TickContext
+from config import SCHEDULER_BUILDING_WORKERS, SCHEDULE_TIMEZONE, DEFAULT_START_TIME, get_thread_round_trips
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sqlite_config
 import pytz
+import threading
+import time
 from datetime import datetime
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+_building_executor = None
+_building_executor_lock = threading.Lock()
+
+# True when the last panel-state pass left buildings to retry
+_retry_pending = False
+
 # --- EXISTING FUNCTIONS ---
 
+def diff_target_states(current_proevents: list[dict], target_states: list[dict]) -> list[dict]:
+    """
+    Returns only the target states that differ from the current ProEvent states.
+    
+    Args:
+        current_proevents: ProEvents as read from the database, with 'id' and 'state'
+                           (or 'reactive_state') fields
+        target_states: List of {"id": proevent_id, "state": reactive_state}
+    
+    Returns:
+        list[dict]: Subset of target_states that actually needs to be written
+    """
+    current_by_id = {
+        p["id"]: p["state"] if "state" in p else p.get("reactive_state")
+        for p in current_proevents
+    }
+    return [t for t in target_states if current_by_id.get(t["id"]) != t["state"]]
+
+
 def get_all_proevents_for_building(building_id: int, search: str | None = None, limit: int = 100, offset: int = 0) -> list[dict]:
     """
     Gets all ProEvents for a building with their current reactive state.
@@ -67,16 +97,21 @@ def set_proevent_reactive_for_building(building_id: int, reactive_state: int, ig
             return 0
 
         target_states = [{"id": pid, "state": reactive_state} for pid in proevent_ids_to_update]
-        success = proserver_service.set_proevent_reactive_state_bulk(target_states)
+        changed_states = diff_target_states(proevents, target_states)
+        skipped = len(target_states) - len(changed_states)
+        if skipped:
+            logger.info(f"{skipped} ProEvents in building {building_id} already at state {reactive_state}. Skipping them.")
+
+        success = proserver_service.set_proevent_reactive_state_bulk(changed_states)
         
-        return len(proevent_ids_to_update) if success else 0
+        return len(changed_states) if success else 0
         
     except Exception as e:
         logger.error(f"Error in set_proevent_reactive_for_building (Building {building_id}): {e}")
         return 0
 
 
-def manage_proevents_on_panel_state_change():
+def manage_proevents_on_panel_state_change(ctx: TickContext | None = None):
     """
     FIXED LOGIC - Monitors panel state changes and manages ProEvent reactive states.
     
@@ -84,14 +119,28 @@ def manage_proevents_on_panel_state_change():
     - Panel ARMED (AreaArmingStates.4) -> Make ALL user-selected ProEvents REACTIVE (state = 0)
     - Panel DISARMED (AreaArmingStates.2) -> Make user-selected (ignored) ProEvents NON-REACTIVE (state = 1)
     - Respects manually set non-reactive ProEvents (always keeps them at state = 1)
+    
+    Args:
+        ctx: Shared per-tick snapshot. A fresh one is created when omitted.
     """
+    global _retry_pending
+
+    if ctx is None:
+        ctx = TickContext()
+
     try:
-        # Get current panel states from database
-        live_states = proserver_service.get_all_live_building_arm_states()
+        # Get current panel states from the tick snapshot
+        live_states = ctx.live_states
+
+        # Nothing changed since the last full scan and nothing is waiting for a retry
+        if ctx.live_states_unchanged and not _retry_pending:
+            logger.debug("Panel states unchanged since last tick. Nothing to do.")
+            return
         
         # Get cached panel states
         cached_states = cache_service.get_cache_value("panel_state_cache") or {}
         new_cached_states = cached_states.copy()
+        changed_buildings = {}
 
         for building_id, is_panel_armed in live_states.items():
             prev_state = cached_states.get(str(building_id))
@@ -114,13 +163,33 @@ def manage_proevents_on_panel_state_change():
             # Panel state changed
             state_change_str = f"{'DISARMED' if prev_state else 'ARMED'} → {'ARMED' if is_panel_armed else 'DISARMED'}"
             logger.info(f"🔄 [Building {building_id}] Panel state changed: {state_change_str}")
-
-            # Apply the correct ProEvent states based on new panel state
-            apply_proevent_states_for_building(building_id, is_panel_armed)
+            changed_buildings[building_id] = is_panel_armed
             
             # Update cache
             new_cached_states[str(building_id)] = is_panel_armed
 
+        ctx.buildings_changed = len(changed_buildings)
+
+        # Apply the correct ProEvent states for every changed building
+        if changed_buildings:
+            if SCHEDULER_BUILDING_WORKERS > 1 and len(changed_buildings) > 1:
+                summary = apply_proevent_states_concurrently(changed_buildings, ctx)
+            else:
+                # One fetch and one write for all buildings: only the batch as a whole has a latency
+                started = time.monotonic()
+                summary = apply_proevent_states_for_buildings(changed_buildings, ctx.ignored_map)
+                ctx.batch_latency = time.monotonic() - started
+
+            ctx.proevents_updated += summary["updated"]
+            ctx.proevents_skipped += summary["skipped"]
+
+            # Failed buildings keep their previous cached state so the change is retried next tick
+            for building_id in summary["failed"]:
+                new_cached_states[str(building_id)] = cached_states[str(building_id)]
+            _retry_pending = bool(summary["failed"])
+        else:
+            _retry_pending = False
+
         # Update cache with new states
         cache_service.set_cache_value("panel_state_cache", new_cached_states)
 
@@ -128,114 +197,292 @@ def manage_proevents_on_panel_state_change():
         logger.error(f"❌ Error in manage_proevents_on_panel_state_change: {e}", exc_info=True)
 
 
-def apply_proevent_states_for_building(building_id: int, is_panel_armed: bool):
+def plan_proevent_states_for_building(building_id: int, is_panel_armed: bool,
+                                      all_proevents: list[dict], ignored_map: dict) -> list[dict]:
     """
-    Applies the correct ProEvent reactive states based on panel state.
+    Computes the target reactive state of every ProEvent in a building.
     RESPECTS manually set non-reactive ProEvents.
     
     Args:
         building_id: Building ID
         is_panel_armed: True if panel is ARMED (AreaArmingStates.4), False if DISARMED (AreaArmingStates.2)
+        all_proevents: The building's ProEvents as read from the database
+        ignored_map: Ignore map as returned by sqlite_config.get_ignored_proevents()
+    
+    Returns:
+        list[dict]: {"id": proevent_id, "state": reactive_state} for every ProEvent
+    """
+    user_ignored_ids = {
+        pid for pid, data in ignored_map.items()
+        if data.get("building_frk") == building_id and data.get("ignore_on_disarm")
+    }
+
+    # Identify manually non-reactive ProEvents (those currently at state=1 that aren't in user's ignore list)
+    manually_non_reactive_ids = {
+        p["id"] for p in all_proevents 
+        if p["state"] == 1 and p["id"] not in user_ignored_ids
+    }
+
+    logger.info(f"[Building {building_id}] Total ProEvents: {len(all_proevents)}, "
+               f"User-ignored: {len(user_ignored_ids)}, "
+               f"Manually non-reactive: {len(manually_non_reactive_ids)}")
+
+    target_states = []
+
+    # === PANEL ARMED (AreaArmingStates.4) ===
+    if is_panel_armed:
+        # Make user-selected ProEvents REACTIVE (state = 0)
+        # Keep manually non-reactive ProEvents as NON-REACTIVE (state = 1)
+        for p in all_proevents:
+            if p["id"] in manually_non_reactive_ids:
+                # Keep manually non-reactive ProEvents at state = 1
+                target_states.append({"id": p["id"], "state": 1})
+            else:
+                # Make all others REACTIVE (state = 0)
+                target_states.append({"id": p["id"], "state": 0})
+
+    # === PANEL DISARMED (AreaArmingStates.2) ===
+    else:
+        # Make user-selected ProEvents NON-REACTIVE (state = 1)
+        # Keep manually non-reactive ProEvents as NON-REACTIVE (state = 1)
+        # Keep others as REACTIVE (state = 0)
+        for p in all_proevents:
+            if p["id"] in user_ignored_ids or p["id"] in manually_non_reactive_ids:
+                # Make user-ignored and manually non-reactive ProEvents NON-REACTIVE (state = 1)
+                target_states.append({"id": p["id"], "state": 1})
+            else:
+                # Keep others REACTIVE (state = 0)
+                target_states.append({"id": p["id"], "state": 0})
+
+    return target_states
+
+
+def apply_proevent_states_for_buildings(panel_states: dict[int, bool], ignored_map: dict | None = None) -> dict:
+    """
+    Applies the correct ProEvent reactive states for several buildings at once.
+    
+    ProEvents of all buildings are fetched with one query, target states are
+    computed in memory and every changed row is written in one bulk operation,
+    so the number of round-trips does not grow with the number of buildings.
+    
+    Args:
+        panel_states: {building_id: is_panel_armed} for the buildings to update
+        ignored_map: Pre-loaded ignore map (from the tick snapshot). Loaded from SQLite when omitted.
+    
+    Returns:
+        dict: {"updated": rows sent to the database, "skipped": rows already at target state,
+               "failed": building IDs whose states could not be applied}
     """
+    summary = {"updated": 0, "skipped": 0, "failed": []}
+    if not panel_states:
+        return summary
+
     try:
-        # Fetch all ProEvents for this building from database
-        all_proevents = proserver_service.get_proevents_for_building_from_db(building_id)
-        if not all_proevents:
-            logger.warning(f"[Building {building_id}] No ProEvents found in database.")
-            return
+        proevents_by_building = proserver_service.get_proevents_for_buildings_from_db(list(panel_states))
 
-        # Load user-selected (ignored) ProEvents from SQLite
-        ignored_map = sqlite_config.get_ignored_proevents()
-        user_ignored_ids = {
-            pid for pid, data in ignored_map.items()
-            if data.get("building_frk") == building_id and data.get("ignore_on_disarm")
-        }
+        # Load user-selected (ignored) ProEvents from SQLite unless the caller already has them
+        if ignored_map is None:
+            ignored_map = {}
+            for building_id in panel_states:
+                ignored_map.update(sqlite_config.get_ignored_proevents_for_building(building_id, disarm_only=True))
 
-        # Identify manually non-reactive ProEvents (those currently at state=1 that aren't in user's ignore list)
-        manually_non_reactive_ids = {
-            p["id"] for p in all_proevents 
-            if p["state"] == 1 and p["id"] not in user_ignored_ids
-        }
+        all_changed_states = []
+        building_results = []
 
-        logger.info(f"[Building {building_id}] Total ProEvents: {len(all_proevents)}, "
-                   f"User-ignored: {len(user_ignored_ids)}, "
-                   f"Manually non-reactive: {len(manually_non_reactive_ids)}")
+        for building_id, is_panel_armed in panel_states.items():
+            all_proevents = proevents_by_building.get(building_id)
+            if not all_proevents:
+                logger.warning(f"[Building {building_id}] No ProEvents found in database.")
+                continue
 
-        target_states = []
+            target_states = plan_proevent_states_for_building(building_id, is_panel_armed, all_proevents, ignored_map)
 
-        # === PANEL ARMED (AreaArmingStates.4) ===
-        if is_panel_armed:
-            # Make user-selected ProEvents REACTIVE (state = 0)
-            # Keep manually non-reactive ProEvents as NON-REACTIVE (state = 1)
-            for p in all_proevents:
-                if p["id"] in manually_non_reactive_ids:
-                    # Keep manually non-reactive ProEvents at state = 1
-                    target_states.append({"id": p["id"], "state": 1})
-                else:
-                    # Make all others REACTIVE (state = 0)
-                    target_states.append({"id": p["id"], "state": 0})
-            
-            success = proserver_service.set_proevent_reactive_state_bulk(target_states)
+            # Only send rows whose state actually differs from what we just read
+            changed_states = diff_target_states(all_proevents, target_states)
+            skipped = len(target_states) - len(changed_states)
+            summary["skipped"] += skipped
+
+            all_changed_states.extend(changed_states)
+            building_results.append((building_id, is_panel_armed, changed_states, skipped))
+
+        if not all_changed_states:
+            logger.info(f"✅ All ProEvents in {len(panel_states)} building(s) already at target state. No updates sent.")
+            return summary
+
+        success = proserver_service.set_proevent_reactive_state_bulk(all_changed_states)
+
+        for building_id, is_panel_armed, changed_states, skipped in building_results:
+            panel_str = "ARMED" if is_panel_armed else "DISARMED"
             if success:
-                reactive_count = sum(1 for s in target_states if s["state"] == 0)
-                non_reactive_count = len(target_states) - reactive_count
-                logger.info(f"✅ [Building {building_id}] Panel ARMED → "
+                reactive_count = sum(1 for s in changed_states if s["state"] == 0)
+                non_reactive_count = len(changed_states) - reactive_count
+                logger.info(f"✅ [Building {building_id}] Panel {panel_str} → "
                           f"{reactive_count} ProEvents set to REACTIVE (0), "
-                          f"{non_reactive_count} kept NON-REACTIVE (1)")
+                          f"{non_reactive_count} set to NON-REACTIVE (1), "
+                          f"{skipped} already at target (skipped)")
             else:
-                logger.error(f"❌ [Building {building_id}] Failed to set ProEvent states on panel ARM")
+                logger.error(f"❌ [Building {building_id}] Failed to set ProEvent states on panel {'ARM' if is_panel_armed else 'DISARM'}")
 
-        # === PANEL DISARMED (AreaArmingStates.2) ===
+        if success:
+            summary["updated"] = len(all_changed_states)
         else:
-            # Make user-selected ProEvents NON-REACTIVE (state = 1)
-            # Keep manually non-reactive ProEvents as NON-REACTIVE (state = 1)
-            # Keep others as REACTIVE (state = 0)
-            for p in all_proevents:
-                if p["id"] in user_ignored_ids or p["id"] in manually_non_reactive_ids:
-                    # Make user-ignored and manually non-reactive ProEvents NON-REACTIVE (state = 1)
-                    target_states.append({"id": p["id"], "state": 1})
-                else:
-                    # Keep others REACTIVE (state = 0)
-                    target_states.append({"id": p["id"], "state": 0})
-            
-            success = proserver_service.set_proevent_reactive_state_bulk(target_states)
-            if success:
-                non_reactive_count = sum(1 for s in target_states if s["state"] == 1)
-                reactive_count = len(target_states) - non_reactive_count
-                logger.info(f"✅ [Building {building_id}] Panel DISARMED → "
-                          f"{non_reactive_count} ProEvents set to NON-REACTIVE (1), "
-                          f"{reactive_count} kept REACTIVE (0)")
-            else:
-                logger.error(f"❌ [Building {building_id}] Failed to set ProEvent states on panel DISARM")
+            summary["failed"] = list(panel_states)
+        return summary
 
     except Exception as e:
-        logger.error(f"❌ Failed to apply ProEvent states for building {building_id}: {e}", exc_info=True)
+        logger.error(f"❌ Failed to apply ProEvent states for buildings {list(panel_states)}: {e}", exc_info=True)
+        summary["failed"] = list(panel_states)
+        return summary
+
+
+def apply_proevent_states_for_building(building_id: int, is_panel_armed: bool, ignored_map: dict | None = None) -> dict:
+    """
+    Applies the correct ProEvent reactive states based on panel state.
+    RESPECTS manually set non-reactive ProEvents.
+    
+    Args:
+        building_id: Building ID
+        is_panel_armed: True if panel is ARMED (AreaArmingStates.4), False if DISARMED (AreaArmingStates.2)
+        ignored_map: Pre-loaded ignore map (from the tick snapshot). Loaded from SQLite when omitted.
+    
+    Returns:
+        dict: {"updated": rows sent to the database, "skipped": rows already at target state,
+               "failed": building IDs whose states could not be applied}
+    """
+    return apply_proevent_states_for_buildings({building_id: is_panel_armed}, ignored_map)
+
+
+def _get_building_executor() -> ThreadPoolExecutor:
+    """Returns the shared worker pool for per-building processing, creating it on first use."""
+    global _building_executor
+    with _building_executor_lock:
+        if _building_executor is None:
+            _building_executor = ThreadPoolExecutor(
+                max_workers=SCHEDULER_BUILDING_WORKERS,
+                thread_name_prefix="BuildingWorker"
+            )
+        return _building_executor
+
+
+def shutdown_building_executor():
+    """Waits for in-flight building tasks and stops the worker pool."""
+    global _building_executor
+    with _building_executor_lock:
+        if _building_executor is not None:
+            _building_executor.shutdown(wait=True)
+            _building_executor = None
+
+
+def _apply_building_task(building_id: int, is_panel_armed: bool, ignored_map: dict) -> tuple[dict, float, int]:
+    """Runs one building on a worker thread; returns (summary, latency seconds, MSSQL round-trips)."""
+    round_trips_before = get_thread_round_trips()
+    started = time.monotonic()
+    summary = apply_proevent_states_for_building(building_id, is_panel_armed, ignored_map)
+    return summary, time.monotonic() - started, get_thread_round_trips() - round_trips_before
+
+
+def apply_proevent_states_concurrently(panel_states: dict[int, bool], ctx: TickContext) -> dict:
+    """
+    Processes changed buildings concurrently on a bounded worker pool
+    (SCHEDULER_BUILDING_WORKERS threads).
+    
+    Each building is a single task (fetch, plan, write), so its updates stay in order
+    and a slow or failing building does not hold up or break the others. The call
+    returns only when every building has finished, so the next tick never processes
+    a building that is still in flight.
+    
+    Args:
+        panel_states: {building_id: is_panel_armed} for the buildings to update
+        ctx: Tick snapshot; receives per-building latencies and worker round-trips
+    
+    Returns:
+        dict: {"updated": ..., "skipped": ..., "failed": [building_id, ...]}
+    """
+    # Load the ignore map once, before handing it to the workers
+    ignored_map = ctx.ignored_map
+    executor = _get_building_executor()
+
+    futures = {
+        executor.submit(_apply_building_task, building_id, is_panel_armed, ignored_map): building_id
+        for building_id, is_panel_armed in panel_states.items()
+    }
+
+    summary = {"updated": 0, "skipped": 0, "failed": []}
+    for future in as_completed(futures):
+        building_id = futures[future]
+        try:
+            building_summary, latency, round_trips = future.result()
+        except Exception as e:
+            logger.error(f"❌ [Building {building_id}] Worker failed: {e}", exc_info=True)
+            summary["failed"].append(building_id)
+            continue
+
+        ctx.building_latencies[building_id] = latency
+        ctx.worker_round_trips += round_trips
+        summary["updated"] += building_summary["updated"]
+        summary["skipped"] += building_summary["skipped"]
+        summary["failed"].extend(building_summary["failed"])
+
+    logger.info(f"Processed {len(panel_states)} buildings on {SCHEDULER_BUILDING_WORKERS} workers, "
+               f"{len(summary['failed'])} failed")
+    return summary
+
+
+def send_start_time_alerts(due_buildings: dict[int, str], live_states: dict):
+    """
+    Queues the start-time alert for every due building whose panel is DISARMED.
+    Delivery happens in the outbox sender, so this never waits on ProServer; the
+    alerts are queued together so they go out as one concurrent batch.
+    
+    Args:
+        due_buildings: {building_id: start_time} for buildings whose start time was reached
+        live_states: Current panel states {building_id: is_armed}
+    """
+    disarmed_buildings = []
+    for building_id, start_time in due_buildings.items():
+        is_panel_armed = live_states.get(building_id)
 
+        if is_panel_armed is None:
+            logger.warning(f"[Building {building_id}] No panel state found at start time {start_time}. No alert sent.")
+        elif is_panel_armed:
+            logger.info(f"[Building {building_id}] Panel ARMED (AreaArmingStates.4) at start time {start_time}. No alert sent.")
+        else:
+            logger.warning(f"⚠️ [Building {building_id}] Panel DISARMED (AreaArmingStates.2) at start time {start_time}. Queuing AXE alert.")
+            disarmed_buildings.append(building_id)
+
+    if disarmed_buildings:
+        notification_outbox.enqueue_many(disarmed_buildings, "disarmed")
 
-def check_and_manage_scheduled_states():
+
+def check_and_manage_scheduled_states(ctx: TickContext | None = None):
     """
     Checks if current time matches building start_time and sends alert if panel is disarmed.
+    
+    NOTE: The scheduler no longer calls this every minute; start-time alerts are fired
+    by services.schedule_dispatcher at the exact instant. Kept for manual/legacy use.
+    
+    Args:
+        ctx: Shared per-tick snapshot. A fresh one is created when omitted.
     """
+    if ctx is None:
+        ctx = TickContext()
+
     try:
-        tz = pytz.timezone('Asia/Kolkata')
+        tz = pytz.timezone(SCHEDULE_TIMEZONE)
         current_time = datetime.now(tz).strftime("%H:%M")
-        live_building_arm_states = proserver_service.get_all_live_building_arm_states()
+        building_times = ctx.building_times
 
-        for building_id, is_panel_armed in live_building_arm_states.items():
-            schedule = sqlite_config.get_building_time(building_id)
+        due_buildings = {}
+        for building_id in ctx.live_states:
+            schedule = building_times.get(building_id)
             if not schedule:
                 continue
 
-            start_time = (schedule.get("start_time") or "20:00")[:5]
-
-            if current_time != start_time:
-                continue
+            start_time = (schedule.get("start_time") or DEFAULT_START_TIME)[:5]
+            if current_time == start_time:
+                due_buildings[building_id] = start_time
 
-            if is_panel_armed:
-                logger.info(f"[Building {building_id}] Panel ARMED (AreaArmingStates.4) at start time {start_time}. No alert sent.")
-            else:
-                logger.warning(f"⚠️ [Building {building_id}] Panel DISARMED (AreaArmingStates.2) at start time {start_time}. Sending AXE alert.")
-                proserver_service.send_disarmed_axe_message(building_id)
+        send_start_time_alerts(due_buildings, ctx.live_states)
 
     except Exception as e:
         logger.error(f"❌ Error in check_and_manage_scheduled_states: {e}", exc_info=True)
@@ -298,11 +545,7 @@ def take_snapshot_and_apply_schedule(building_id: int):
         logger.info(f"[Building {building_id}] Snapshot saved with {len(snapshot_data)} ProEvents")
         
         # Get user-ignored ProEvents
-        ignored_map = sqlite_config.get_ignored_proevents()
-        ignored_ids = {
-            pid for pid, data in ignored_map.items()
-            if data.get("building_frk") == building_id and data.get("ignore_on_disarm")
-        }
+        ignored_ids = set(sqlite_config.get_ignored_proevents_for_building(building_id, disarm_only=True))
         
         # Apply scheduled state
         target_states = []
@@ -316,11 +559,14 @@ def take_snapshot_and_apply_schedule(building_id: int):
                 # Others -> REACTIVE (state = 0)
                 target_states.append({"id": proevent_id, "state": 0})
 
+        changed_states = diff_target_states(snapshot_data, target_states)
+
         logger.info(f"[Building {building_id}] Applying schedule: "
                    f"{len(ignored_ids)} ProEvents to NON-REACTIVE (1), "
-                   f"{len(target_states) - len(ignored_ids)} to REACTIVE (0)")
+                   f"{len(target_states) - len(ignored_ids)} to REACTIVE (0), "
+                   f"{len(target_states) - len(changed_states)} already at target (skipped)")
         
-        proserver_service.set_proevent_reactive_state_bulk(target_states)
+        proserver_service.set_proevent_reactive_state_bulk(changed_states)
 
     except Exception as e:
         logger.error(f"❌ Failed to take snapshot for building {building_id}: {e}", exc_info=True)
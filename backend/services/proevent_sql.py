@@ -0,0 +1,57 @@
+"""
+ProEvent Bulk Update SQL
+========================
+The set-based ProEvent_TBL reactive-state UPDATE used by proserver_service.
+
+Kept free of config imports (engine, Fernet-decrypted credentials) so it
+runs on any SQLAlchemy connection, including the SQLite stand-in in
+tools/bench_proevent_bulk_update.py.
+"""
+
+from sqlalchemy import text, bindparam
+
+# SQL Server rejects statements with more than 2100 parameters.
+# Keep a margin for the non-list parameters (e.g. :state, used twice).
+MSSQL_MAX_PARAMS = 2100
+MSSQL_IN_CHUNK_SIZE = MSSQL_MAX_PARAMS - 100
+
+
+def chunked(items: list, size: int):
+    """Yields consecutive slices of at most `size` items."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+_BULK_REACTIVE_UPDATE_SQL = text("""
+    UPDATE ProEvent_TBL 
+    SET pevReactive_FRK = :state 
+    WHERE ProEvent_PRK IN :proevent_ids
+      AND (pevReactive_FRK IS NULL OR pevReactive_FRK <> :state)
+""").bindparams(bindparam("proevent_ids", expanding=True))
+
+
+def apply_reactive_state_updates(db, target_states: list[dict]) -> int:
+    """
+    Writes ProEvent reactive states with set-based UPDATE statements.
+    
+    Rows are grouped by target state and sent as `WHERE ProEvent_PRK IN (...)`
+    statements, chunked to stay under SQL Server's 2100-parameter limit.
+    The caller owns the session/connection and the transaction.
+    
+    Args:
+        db: Open SQLAlchemy session or connection
+        target_states: List of {"id": proevent_id, "state": reactive_state}
+    
+    Returns:
+        int: Number of rows the database reported as updated
+    """
+    ids_by_state: dict[int, list[int]] = {}
+    for item in target_states:
+        ids_by_state.setdefault(item["state"], []).append(item["id"])
+
+    updated = 0
+    for state, proevent_ids in ids_by_state.items():
+        for chunk in chunked(proevent_ids, MSSQL_IN_CHUNK_SIZE):
+            result = db.execute(_BULK_REACTIVE_UPDATE_SQL, {"state": state, "proevent_ids": chunk})
+            updated += max(result.rowcount, 0)
+    return updated
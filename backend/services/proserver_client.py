@@ -0,0 +1,291 @@
+"""
+ProServer TCP Client
+====================
+A long-lived TCP connection to ProServer for AXE notification frames.
+
+Opening a socket per alert costs a TCP handshake per frame, and with no
+connect timeout an unreachable ProServer could stall the calling thread
+indefinitely. ProServerClient keeps one connection open, bounds connect and
+send with timeouts, and pipelines frames without waiting for a reply (frames
+are self-delimiting with a trailing '@'). send_many writes a batch in a single
+sendall; send_each writes frame by frame and records when each one went out,
+which is what the outbox uses for per-alert delivery times.
+
+A broken connection is detected before each send and by a periodic liveness
+probe, and re-established with exponential back-off so a ProServer outage
+fails sends fast instead of paying the connect timeout on every alert.
+"""
+
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Back-off between reconnect attempts after a failure
+RECONNECT_BACKOFF_INITIAL_SECONDS = 1.0
+RECONNECT_BACKOFF_MAX_SECONDS = 30.0
+
+
+class ProServerClient:
+    """
+    Thread-safe, reconnecting TCP client for ProServer notification frames.
+
+    Sends are serialized on one connection. start() runs the liveness probe
+    thread; sending works without it (the connection is opened on demand).
+    """
+
+    def __init__(self, host: str, port: int, connect_timeout: float = 5.0,
+                 send_timeout: float = 5.0, probe_interval: float = 30.0):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.probe_interval = probe_interval
+        self._sock = None
+        self._lock = threading.Lock()
+        self._backoff = RECONNECT_BACKOFF_INITIAL_SECONDS
+        self._next_connect_at = 0.0
+        self._stop_event = threading.Event()
+        self._probe_thread = None
+        self._stats = {"connects": 0, "connect_failures": 0, "frames_sent": 0,
+                       "send_failures": 0, "probes": 0, "last_error": None}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Starts the liveness probe thread (no-op if it is already running)."""
+        if self._probe_thread and self._probe_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._probe_thread = threading.Thread(target=self._probe_loop, daemon=True, name="ProServerProbe")
+        self._probe_thread.start()
+        logger.info(f"✅ PROSERVER CLIENT: Liveness probe started for {self.host}:{self.port}")
+
+    def stop(self):
+        """Stops the probe thread and closes the connection."""
+        self._stop_event.set()
+        if self._probe_thread:
+            self._probe_thread.join(self.connect_timeout + 1)
+            self._probe_thread = None
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    # --- Sending ---
+
+    def send(self, message: str) -> bool:
+        """Sends one frame. Returns True if it was written to the socket."""
+        return self.send_many([message]) == 1
+
+    def send_many(self, messages: list[str]) -> int:
+        """
+        Pipelines frames over the shared connection in one write.
+
+        If the write fails, the connection is re-established and the batch is
+        retried once. ProServer may then see a frame twice if the failure came
+        after part of the batch reached it; that is preferred over losing it.
+
+        Returns:
+            int: Number of frames sent (0 or len(messages))
+        """
+        if not messages:
+            return 0
+        payload = "".join(messages).encode()
+
+        with self._lock:
+            for attempt in (1, 2):
+                if not self._ensure_connected_locked():
+                    break
+                try:
+                    self._sock.sendall(payload)
+                    self._stats["frames_sent"] += len(messages)
+                    return len(messages)
+                except OSError as e:
+                    self._stats["last_error"] = str(e)
+                    logger.warning(f"⚠️ PROSERVER CLIENT: Send failed (attempt {attempt}): {e}")
+                    self._close_locked()
+
+            self._stats["send_failures"] += len(messages)
+            return 0
+
+    def send_each(self, messages: list[str]) -> list[float | None]:
+        """
+        Writes frames one after another over the shared connection, timestamping each.
+
+        Unlike send_many, each frame gets its own sendall, so the returned time
+        is when that frame was handed to the socket rather than when the whole
+        batch was. A failed write is retried once from the failed frame on a
+        fresh connection, with the same duplicate caveat as send_many.
+
+        Returns:
+            list: For each message, the epoch time it was written, or None if it failed
+        """
+        sent_times = [None] * len(messages)
+        position = 0
+        with self._lock:
+            for attempt in (1, 2):
+                if not self._ensure_connected_locked():
+                    break
+                try:
+                    while position < len(messages):
+                        self._sock.sendall(messages[position].encode())
+                        sent_times[position] = time.time()
+                        self._stats["frames_sent"] += 1
+                        position += 1
+                    return sent_times
+                except OSError as e:
+                    self._stats["last_error"] = str(e)
+                    logger.warning(f"⚠️ PROSERVER CLIENT: Send failed at frame {position + 1} of "
+                                   f"{len(messages)} (attempt {attempt}): {e}")
+                    self._close_locked()
+
+            self._stats["send_failures"] += len(messages) - position
+            return sent_times
+
+    # --- Connection Management ---
+
+    def _ensure_connected_locked(self) -> bool:
+        if self._sock is not None and not self._peer_closed_locked():
+            return True
+        self._close_locked()
+
+        now = time.monotonic()
+        if now < self._next_connect_at:
+            return False  # still backing off after a failed connect
+
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            sock.settimeout(self.send_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except OSError as e:
+            self._stats["connect_failures"] += 1
+            self._stats["last_error"] = str(e)
+            self._next_connect_at = now + self._backoff
+            logger.error(f"❌ PROSERVER CLIENT: Connect to {self.host}:{self.port} failed: {e}. "
+                         f"Retrying in {self._backoff:.0f}s.")
+            self._backoff = min(self._backoff * 2, RECONNECT_BACKOFF_MAX_SECONDS)
+            return False
+
+        self._sock = sock
+        self._stats["connects"] += 1
+        self._backoff = RECONNECT_BACKOFF_INITIAL_SECONDS
+        self._next_connect_at = 0.0
+        logger.info(f"🔌 PROSERVER CLIENT: Connected to {self.host}:{self.port}")
+        return True
+
+    def _peer_closed_locked(self) -> bool:
+        """Non-blocking check for a connection closed or reset by ProServer."""
+        try:
+            while select.select([self._sock], [], [], 0)[0]:
+                data = self._sock.recv(4096)
+                if not data:
+                    return True
+                # ProServer does not answer AXE frames; discard anything it sends
+                logger.debug(f"PROSERVER CLIENT: Discarded {len(data)} unsolicited byte(s)")
+            return False
+        except (OSError, ValueError):
+            return True
+
+    def _close_locked(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    # --- Liveness Probe ---
+
+    def _probe_loop(self):
+        while not self._stop_event.wait(self.probe_interval):
+            with self._lock:
+                self._stats["probes"] += 1
+                if not self._ensure_connected_locked():
+                    logger.warning(f"⚠️ PROSERVER CLIENT: Liveness probe: {self.host}:{self.port} unreachable")
+
+    def status(self) -> dict:
+        """Returns connection state and counters."""
+        return {
+            "host": self.host,
+            "port": self.port,
+            "connected": self._sock is not None,
+            **self._stats,
+        }
+
+
+class ProServerClientPool:
+    """
+    Up to `size` ProServerClient connections used concurrently.
+
+    send_batch() splits a batch into one contiguous slice per connection and
+    writes the slices in parallel, so a burst of alerts is not serialized
+    behind a single socket. Single sends rotate over the connections.
+    """
+
+    def __init__(self, host: str, port: int, size: int = 1, **client_options):
+        self.size = max(1, size)
+        self.clients = [ProServerClient(host, port, **client_options) for _ in range(self.size)]
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="ProServerSend")
+        # Guards the round-robin position; the outbox sender and sink workers send from different threads
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def start(self):
+        for client in self.clients:
+            client.start()
+
+    def stop(self):
+        for client in self.clients:
+            client.stop()
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    def send(self, message: str) -> bool:
+        with self._lock:
+            client = self.clients[self._next % self.size]
+            self._next += 1
+        return client.send(message)
+
+    def send_many(self, messages: list[str]) -> int:
+        """Sends a batch; returns the number of frames written."""
+        return sum(1 for sent_at in self.send_batch(messages) if sent_at is not None)
+
+    def send_batch(self, messages: list[str]) -> list[float | None]:
+        """
+        Sends a batch over all connections concurrently.
+
+        Returns:
+            list: For each message, the epoch time it was written, or None if it failed
+        """
+        if not messages:
+            return []
+        slice_size = -(-len(messages) // self.size)
+        slices = [messages[i:i + slice_size] for i in range(0, len(messages), slice_size)]
+
+        futures = [self._executor.submit(client.send_each, chunk) for client, chunk in zip(self.clients, slices)]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def status(self) -> dict:
+        """Returns aggregated counters plus per-connection state."""
+        connections = [client.status() for client in self.clients]
+        return {
+            "host": self.clients[0].host,
+            "port": self.clients[0].port,
+            "pool_size": self.size,
+            "connected": sum(1 for c in connections if c["connected"]),
+            "frames_sent": sum(c["frames_sent"] for c in connections),
+            "send_failures": sum(c["send_failures"] for c in connections),
+            "connections": connections,
+        }
@@ -9,18 +9,58 @@ TERMINOLOGY CLARIFICATION:
 - Panel State: AreaArmingStates.4 = ARMED, AreaArmingStates.2 = DISARMED
 """
 
-import socket
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 from sqlalchemy.orm import Session
 from logger import get_logger
-from config import get_db_connection, engine, PROSERVER_IP, PROSERVER_PORT
-from query_config import get_query
+from config import (get_db_connection, engine, PROSERVER_IP, PROSERVER_PORT,
+                    PROSERVER_CONNECT_TIMEOUT_SECONDS, PROSERVER_SEND_TIMEOUT_SECONDS,
+                    PROSERVER_PROBE_INTERVAL_SECONDS, PROSERVER_SEND_CONCURRENCY,
+                    BUILDING_NAME_CACHE_TTL_SECONDS, NOTIFICATION_SINKS, NOTIFICATION_SINK_QUEUE_SIZE,
+                    NOTIFICATION_SINK_TIMEOUT_SECONDS)
+from query_config import get_cached_query, add_query_change_listener
+from services.proserver_client import ProServerClientPool
+from services.building_name_cache import BuildingNameCache
+from services.notification_sinks import Notification, NotificationFanout, TcpSink, build_sinks
+from services.proevent_sql import MSSQL_IN_CHUNK_SIZE, apply_reactive_state_updates, chunked
 
 logger = get_logger(__name__)
 
+# Last full panel-state scan of the scheduler tick, reused while the checksum
+# probe reports no change. Only the tick path reads or records it.
+_arm_state_snapshot = {"query_sql": None, "fingerprint": None, "states": None}
+_arm_state_probe_unsupported = set()
+_arm_state_probe_stats = {"probes": 0, "hits": 0, "rows_skipped": 0}
+
+# Shared connections for all AXE notification frames
+proserver_client = ProServerClientPool(
+    PROSERVER_IP, PROSERVER_PORT,
+    size=PROSERVER_SEND_CONCURRENCY,
+    connect_timeout=PROSERVER_CONNECT_TIMEOUT_SECONDS,
+    send_timeout=PROSERVER_SEND_TIMEOUT_SECONDS,
+    probe_interval=PROSERVER_PROBE_INTERVAL_SECONDS,
+)
+
+# ProServer plus any extra sinks from NOTIFICATION_SINKS
+notification_sinks = NotificationFanout(
+    TcpSink(proserver_client),
+    build_sinks(NOTIFICATION_SINKS, timeout=NOTIFICATION_SINK_TIMEOUT_SECONDS),
+    queue_size=NOTIFICATION_SINK_QUEUE_SIZE,
+)
+
 
 # --- TCP/IP NOTIFICATION FUNCTIONS ---
 
+def send_notification(building_id: int | None, building_name: str, event: str) -> bool:
+    """
+    Sends one notification to ProServer and queues it for the extra sinks.
+    
+    Returns:
+        bool: True if ProServer received it
+    """
+    notification = Notification.create(building_id, building_name, event)
+    return notification_sinks.deliver([notification])[0] is not None
+
+
 def send_proserver_notification(building_name: str):
     """
     Sends a unified notification to the ProServer.
@@ -29,25 +69,22 @@ def send_proserver_notification(building_name: str):
     message = f"axe,{building_name}_Is_Armed@"
     logger.info(f"Sending notification to ProServer: {message}")
     
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((PROSERVER_IP, PROSERVER_PORT))
-            s.sendall(message.encode())
-            logger.info(f"✅ Notification sent successfully: {message}")
-    except Exception as e:
-        logger.error(f"❌ Failed to send notification to ProServer: {e}")
+    if send_notification(None, building_name, "armed"):
+        logger.info(f"✅ Notification sent successfully: {message}")
+    else:
+        logger.error(f"❌ Failed to send notification to ProServer: {message}")
 
 
 def send_armed_axe_message(building_id: int):
     """
     Checks if a building panel is in ARMED state (AreaArmingStates.4).
     If yes, sends armed AXE alert to ProServer.
+    
+    The panel state is always read live; the name comes from the building name cache.
     """
-    # Using building query to get building name
     query_sql = """
-        SELECT bldBuildingName_TXT 
-        FROM Building_TBL 
-        JOIN Device_TBL ON dvcBuilding_FRK = Building_PRK 
+        SELECT 1
+        FROM Device_TBL
         WHERE dvcCurrentState_TXT = 'AreaArmingStates.4' AND dvcBuilding_FRK = :building_id
     """
     
@@ -57,10 +94,10 @@ def send_armed_axe_message(building_id: int):
     try:
         with get_db_connection() as db:
             result = db.execute(sql, {"building_id": building_id})
-            row = result.fetchone()
-            
-            if row:
-                building_name = row.bldBuildingName_TXT
+            is_armed = result.fetchone() is not None
+
+        if is_armed:
+            building_name = get_building_name(building_id)
 
     except Exception as e:
         logger.error(f"❌ Failed to query building name for AXE message: {e}")
@@ -71,42 +108,43 @@ def send_armed_axe_message(building_id: int):
         message = f"axe,{building_name}_Is_Armed@"
         logger.info(f"[Building {building_id}] Panel is ARMED (AreaArmingStates.4). Sending: {message}")
         
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((PROSERVER_IP, PROSERVER_PORT))
-                s.sendall(message.encode())
-                logger.info(f"✅ Armed AXE notification sent: {message}")
-        except Exception as e:
-            logger.error(f"❌ Failed to send armed AXE notification: {e}")
+        if send_notification(building_id, building_name, "armed"):
+            logger.info(f"✅ Armed AXE notification sent: {message}")
+        else:
+            logger.error(f"❌ Failed to send armed AXE notification: {message}")
     else:
         logger.debug(f"[Building {building_id}] Panel not in ARMED state (AreaArmingStates.4). No message sent.")
 
 
+def get_building_name(building_id: int) -> str | None:
+    """
+    Returns a building's name from the building name cache, or None if it has
+    no name. Raises if the names could never be loaded, so callers can retry.
+    """
+    return building_names.get_name(building_id)
+
+
 def send_disarmed_axe_message(building_id: int):
     """
-    Sends a 'disarmed' AXE alert to ProServer at schedule start time.
+    Sends a 'disarmed' AXE alert to ProServer immediately.
     Message format: axe,<building_name>_Is_Disarmed@
+    
+    Scheduled start-time alerts go through services.notification_outbox instead,
+    which retries failed sends.
     """
     try:
-        with get_db_connection() as session:
-            result = session.execute(
-                text("SELECT bldBuildingName_TXT FROM Building_TBL WHERE Building_PRK = :building_id"),
-                {"building_id": building_id}
-            )
-            row = result.fetchone()
-
-        if not row or not row[0]:
+        building_name = get_building_name(building_id)
+        if not building_name:
             logger.warning(f"[Building {building_id}] Building name not found for disarmed alert.")
             return
 
-        building_name = row[0]
         message = f"axe,{building_name}_Is_Disarmed@"
         logger.info(f"[Building {building_id}] Panel DISARMED (AreaArmingStates.2). Sending: {message}")
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((PROSERVER_IP, PROSERVER_PORT))
-            s.sendall(message.encode())
+        if send_notification(building_id, building_name, "disarmed"):
             logger.info(f"✅ Disarmed AXE notification sent: {message}")
+        else:
+            logger.error(f"❌ Failed to send disarmed AXE notification: {message}")
 
     except Exception as e:
         logger.error(f"❌ Failed to send disarmed AXE notification: {e}")
@@ -173,10 +211,70 @@ def get_proevents_for_building_from_db(building_id: int) -> list[dict]:
         raise
 
 
+_PROEVENTS_FOR_BUILDINGS_SQL = text("""
+    SELECT
+        p.pevBuilding_FRK,
+        p.pevReactive_FRK,
+        p.ProEvent_PRK,
+        p.pevAlias_TXT,
+        b.bldBuildingName_TXT
+    FROM
+        ProEvent_TBL AS p
+    LEFT JOIN
+        Building_TBL AS b ON p.pevBuilding_FRK = b.Building_PRK
+    WHERE
+        p.pevBuilding_FRK IN :building_ids
+""").bindparams(bindparam("building_ids", expanding=True))
+
+
+def get_proevents_for_buildings_from_db(building_ids: list[int]) -> dict[int, list[dict]]:
+    """
+    Fetches the ProEvents of several buildings with one `pevBuilding_FRK IN (...)` query
+    (chunked under SQL Server's parameter limit) and groups them in memory.
+    
+    Returns:
+        dict: {building_id: [ProEvent dicts as returned by get_proevents_for_building_from_db]}
+              Buildings without ProEvents map to an empty list.
+    """
+    building_ids = list(dict.fromkeys(building_ids))
+    results: dict[int, list[dict]] = {building_id: [] for building_id in building_ids}
+    if not building_ids:
+        return results
+
+    logger.info(f"Fetching ProEvents for {len(building_ids)} buildings from ProServer database...")
+
+    try:
+        with get_db_connection() as db:
+            for chunk in chunked(building_ids, MSSQL_IN_CHUNK_SIZE):
+                rows = db.execute(_PROEVENTS_FOR_BUILDINGS_SQL, {"building_ids": chunk}).fetchall()
+                for row in rows:
+                    # pevReactive_FRK: 0 = REACTIVE (armed), 1 = NON-REACTIVE (disarmed)
+                    results.setdefault(int(row.pevBuilding_FRK), []).append({
+                        "id": row.ProEvent_PRK,
+                        "state": row.pevReactive_FRK,
+                        "name": row.pevAlias_TXT,
+                        "building_name": row.bldBuildingName_TXT
+                    })
+            db.commit()
+
+        total = sum(len(proevents) for proevents in results.values())
+        logger.info(f"✅ Fetched {total} ProEvents for {len(building_ids)} buildings from database")
+        return results
+
+    except Exception as e:
+        logger.error(f"❌ Failed to query ProEvents for buildings from database: {e}")
+        raise
+
+
 def set_proevent_reactive_state_bulk(target_states: list[dict]) -> bool:
     """
     Updates ProEvent reactive states in bulk in ProServer database.
     
+    All changes go out as a few set-based statements (one per target state
+    and chunk of MSSQL_IN_CHUNK_SIZE IDs) in a single transaction.
+    Rows already at the target state are never touched: the UPDATE is guarded
+    on the current pevReactive_FRK value.
+    
     Args:
         target_states: List of {"id": proevent_id, "state": reactive_state}
                       where state: 0 = REACTIVE (armed), 1 = NON-REACTIVE (disarmed)
@@ -194,23 +292,13 @@ def set_proevent_reactive_state_bulk(target_states: list[dict]) -> bool:
     logger.info(f"Updating {len(target_states)} ProEvent states in ProServer database: "
                f"{reactive_count} to REACTIVE (0), {non_reactive_count} to NON-REACTIVE (1)")
     
-    sql = text("""
-        UPDATE ProEvent_TBL 
-        SET pevReactive_FRK = :state 
-        WHERE ProEvent_PRK = :proevent_id
-    """)
-    
-    data_to_update = [
-        {"state": item['state'], "proevent_id": item['id']} 
-        for item in target_states
-    ]
-    
     try:
         with get_db_connection() as db:
-            db.execute(sql, data_to_update)
+            updated = apply_reactive_state_updates(db, target_states)
             db.commit()
             
-        logger.info(f"✅ Successfully updated {len(data_to_update)} ProEvent states in ProServer database")
+        logger.info(f"✅ Successfully updated ProEvent states in ProServer database: "
+                   f"{updated} rows changed, {len(target_states) - updated} already at target")
         return True
         
     except Exception as e:
@@ -218,64 +306,160 @@ def set_proevent_reactive_state_bulk(target_states: list[dict]) -> bool:
         return False
 
 
-def get_all_live_building_arm_states() -> dict:
+def _probe_arm_state_fingerprint(session, query_sql: str) -> tuple:
     """
-    Returns current panel arm/disarm state for all buildings.
+    Runs a single-row aggregate over the device query instead of fetching it.
     
-    Panel States:
-    - AreaArmingStates.4 = ARMED
-    - AreaArmingStates.2 = DISARMED
-    - All other states = ARMED (default)
+    Returns:
+        tuple: (row count, CHECKSUM_AGG, SUM of CHECKSUM) over (dvcBuilding_FRK, dvcCurrentState_TXT).
+               Two independent aggregates make an accidental match after a change very unlikely.
+    """
+    probe_sql = f"""
+        SELECT
+            COUNT_BIG(*) AS row_count,
+            CHECKSUM_AGG(CHECKSUM(dvcBuilding_FRK, dvcCurrentState_TXT)) AS checksum_agg,
+            SUM(CAST(CHECKSUM(dvcBuilding_FRK, dvcCurrentState_TXT) AS BIGINT)) AS checksum_sum
+        FROM ({query_sql.strip().rstrip(';')}) AS device_states
+    """
+    row = session.execute(text(probe_sql)).fetchone()
+    return tuple(row)
+
+
+def get_live_building_arm_states_with_probe() -> tuple[dict, bool]:
+    """
+    Returns current panel states, skipping the full Device_TBL scan when nothing changed.
+    For the scheduler tick (TickContext) only.
+    
+    A cheap aggregate checksum probe runs first. If it matches the fingerprint of
+    the previous tick's full scan (for the same device query), the previous result
+    is returned without fetching or classifying any rows. Queries the probe cannot
+    wrap (e.g. with ORDER BY) fall back to a full scan every time.
+    
+    "Unchanged" means unchanged since the last tick, which is what lets the tick
+    skip diffing against panel_state_cache. Other callers must use
+    get_all_live_building_arm_states(): a scan recorded between two ticks would
+    make the next tick's probe match and hide the change from it.
     
     Returns:
-        dict: {building_id: is_armed} where is_armed is True for ARMED, False for DISARMED
+        tuple: ({building_id: is_armed}, unchanged) where unchanged is True when the
+               probe matched and the previous result was reused
     """
     try:
-        logger.debug("Fetching all building panel states from ProServer database...")
-
-        query_sql = get_query('device')
+        device_query = get_cached_query('device_query')
+        query_sql = device_query.sql
         
         if not query_sql:
-            logger.error("❌ Query 'device' not found in configuration!")
-            return {}
+            logger.error("❌ Query 'device_query' not found in configuration!")
+            return {}, False
 
         with Session(engine) as session:
-            query = text(query_sql)
-            rows = session.execute(query).fetchall()
+            fingerprint = None
+            if query_sql not in _arm_state_probe_unsupported:
+                try:
+                    fingerprint = _probe_arm_state_fingerprint(session, query_sql)
+                    _arm_state_probe_stats["probes"] += 1
+                except Exception as e:
+                    session.rollback()
+                    _arm_state_probe_unsupported.add(query_sql)
+                    logger.warning(f"⚠️ Panel state probe not supported for the device query, "
+                                   f"using full scans: {e}")
+
+            snapshot = _arm_state_snapshot
+            if fingerprint is not None and snapshot["query_sql"] == query_sql and snapshot["fingerprint"] == fingerprint:
+                _arm_state_probe_stats["hits"] += 1
+                _arm_state_probe_stats["rows_skipped"] += fingerprint[0]
+                logger.debug(f"Panel state probe unchanged ({fingerprint[0]} rows). Skipping full scan.")
+                return dict(snapshot["states"]), True
+
+            logger.debug("Fetching all building panel states from ProServer database...")
+            rows = session.execute(device_query.statement).fetchall()
+
+        result = classify_panel_states(rows)
+        if fingerprint is not None:
+            _arm_state_snapshot.update(query_sql=query_sql, fingerprint=fingerprint, states=dict(result))
+        return result, False
 
-        result = {}
-        armed_count = 0
-        disarmed_count = 0
-        
-        for building_id, state_txt in rows:
-            if not building_id:
-                continue
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch building panel states: {e}")
+        return {}, False
 
-            state_str = (state_txt or "").strip()
 
-            # AreaArmingStates.2 = DISARMED, all others = ARMED
-            if "AreaArmingStates.2" in state_str:
-                is_armed = False
-                disarmed_count += 1
-            else:
-                is_armed = True
-                armed_count += 1
+def classify_panel_states(rows) -> dict:
+    """
+    Converts (dvcBuilding_FRK, dvcCurrentState_TXT) rows into {building_id: is_armed}.
+    
+    Panel States:
+    - AreaArmingStates.4 = ARMED
+    - AreaArmingStates.2 = DISARMED
+    - All other states = ARMED (default)
+    """
+    result = {}
+    armed_count = 0
+    disarmed_count = 0
+    
+    for building_id, state_txt in rows:
+        if not building_id:
+            continue
 
-            result[int(building_id)] = is_armed
+        state_str = (state_txt or "").strip()
+
+        # AreaArmingStates.2 = DISARMED, all others = ARMED
+        if "AreaArmingStates.2" in state_str:
+            is_armed = False
+            disarmed_count += 1
+        else:
+            is_armed = True
+            armed_count += 1
+
+        result[int(building_id)] = is_armed
+
+    logger.info(f"✅ Fetched panel states for {len(result)} buildings: "
+               f"{armed_count} ARMED (AreaArmingStates.4), "
+               f"{disarmed_count} DISARMED (AreaArmingStates.2)")
+    return result
+
+
+def get_all_live_building_arm_states() -> dict:
+    """
+    Returns current panel arm/disarm state for all buildings with a full scan.
+    Leaves the tick's probe fingerprint alone (see get_live_building_arm_states_with_probe).
+    
+    Panel States:
+    - AreaArmingStates.4 = ARMED
+    - AreaArmingStates.2 = DISARMED
+    - All other states = ARMED (default)
+    
+    Returns:
+        dict: {building_id: is_armed} where is_armed is True for ARMED, False for DISARMED
+    """
+    try:
+        device_query = get_cached_query('device_query')
+        if not device_query.sql:
+            logger.error("❌ Query 'device_query' not found in configuration!")
+            return {}
 
-        logger.info(f"✅ Fetched panel states for {len(result)} buildings: "
-                   f"{armed_count} ARMED (AreaArmingStates.4), "
-                   f"{disarmed_count} DISARMED (AreaArmingStates.2)")
-        return result
+        logger.debug("Fetching all building panel states from ProServer database...")
+        with Session(engine) as session:
+            rows = session.execute(device_query.statement).fetchall()
+        return classify_panel_states(rows)
 
     except Exception as e:
         logger.error(f"❌ Failed to fetch building panel states: {e}")
         return {}
 
 
-def get_all_distinct_buildings_from_db() -> list[dict]:
+def get_arm_state_probe_stats() -> dict:
+    """Returns probe counters: probes run, hits (full scans skipped) and rows not fetched."""
+    probes = _arm_state_probe_stats["probes"]
+    return {
+        **_arm_state_probe_stats,
+        "hit_rate": round(_arm_state_probe_stats["hits"] / probes, 3) if probes else None,
+    }
+
+
+def fetch_all_buildings_from_db() -> list[dict]:
     """
-    Fetches list of all unique buildings from Building_TBL.
+    Runs the configured building_query. Database errors are raised.
     
     Returns:
         list[dict]: Buildings with fields:
@@ -284,35 +468,43 @@ def get_all_distinct_buildings_from_db() -> list[dict]:
     """
     logger.info("Fetching all distinct buildings from ProServer database...")
     
-    query_sql = get_query('building')
+    building_query = get_cached_query('building_query')
     
-    if not query_sql:
-        logger.error("❌ Query 'building' not found in configuration!")
+    if not building_query.sql:
+        logger.error("❌ Query 'building_query' not found in configuration!")
         return []
     
-    sql = text(query_sql)
-    results = []
+    with get_db_connection() as db:
+        rows = db.execute(building_query.statement).fetchall()
+    
+    if not rows:
+        logger.warning("No buildings found in Building_TBL.")
+    
+    results = [{"id": row.Building_PRK, "name": row.bldBuildingName_TXT} for row in rows]
+    logger.info(f"✅ Fetched {len(results)} distinct buildings from database")
+    return results
+
 
+def get_all_distinct_buildings_from_db() -> list[dict]:
+    """
+    Returns all buildings as [{"id", "name"}, ...], from the building name
+    cache (loaded in bulk and refreshed every BUILDING_NAME_CACHE_TTL_SECONDS).
+    """
     try:
-        with get_db_connection() as db:
-            result = db.execute(sql)
-            rows = result.fetchall()
-            
-            if not rows:
-                logger.warning("No buildings found in Building_TBL.")
-                return []
-                
-            for row in rows:
-                results.append({
-                    "id": row.Building_PRK,
-                    "name": row.bldBuildingName_TXT
-                })
-            
-            db.commit()
-        
-        logger.info(f"✅ Fetched {len(results)} distinct buildings from database")
-        return results
-        
+        return building_names.get_all()
     except Exception as e:
         logger.error(f"❌ Failed to query buildings from database: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+# Shared by the alert path and the building list endpoint
+building_names = BuildingNameCache(fetch_all_buildings_from_db, ttl_seconds=BUILDING_NAME_CACHE_TTL_SECONDS)
+
+
+def _on_query_changed(query_name: str):
+    # Names loaded with the old building_query may be wrong for the new one
+    if query_name == 'building_query':
+        building_names.invalidate()
+
+
+add_query_change_listener(_on_query_changed)
\ No newline at end of file
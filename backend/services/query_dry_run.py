@@ -0,0 +1,197 @@
+"""
+Query Dry Run
+=============
+Runs an admin query once without saving it (POST /api/admin/queries/{name}/test)
+so its cost and shape can be checked before it is saved or staged.
+
+The query runs on its own pooled connection, in a transaction that is
+always rolled back, with:
+
+- a row cap: at most QUERY_TEST_MAX_ROWS rows are fetched, then the result
+  is closed so the server stops sending the rest
+- a statement timeout of QUERY_TEST_TIMEOUT_SECONDS (the pyodbc query
+  timeout on SQL Server, a progress handler on SQLite)
+
+The result reports the elapsed time, the rows fetched, the first rows, and
+which of the columns the services read (query_shadow.RESULT_SHAPES) the
+query does not return. The execution plan comes from SET SHOWPLAN_TEXT on
+SQL Server, which compiles the query without running it, or from
+EXPLAIN QUERY PLAN on SQLite.
+
+When the ProServer database cannot be reached and QUERY_TEST_STANDIN_DB
+names a SQLite file (a copy of Device_TBL / Building_TBL with the same
+column names), the query runs against that stand-in instead, so queries can
+be tried offline. The stand-in is opened read-only.
+"""
+
+import threading
+import time
+from sqlalchemy import create_engine, text
+from config import engine, QUERY_TEST_MAX_ROWS, QUERY_TEST_TIMEOUT_SECONDS, QUERY_TEST_STANDIN_DB
+from logger import get_logger
+import query_config
+from services.db_timeouts import statement_timeout, error_message, is_timeout
+from services.query_shadow import RESULT_SHAPES
+
+logger = get_logger(__name__)
+
+_standin_engine = None
+_standin_lock = threading.Lock()
+
+
+class DryRunError(Exception):
+    """The dry run could not be started (unknown query, no database to run it on)."""
+
+
+def _get_standin_engine():
+    global _standin_engine
+    if not QUERY_TEST_STANDIN_DB:
+        return None
+    with _standin_lock:
+        if _standin_engine is None:
+            _standin_engine = create_engine(f"sqlite:///file:{QUERY_TEST_STANDIN_DB}?mode=ro&uri=true")
+        return _standin_engine
+
+
+def _connect(use_standin: bool):
+    """Returns (connection, fallback_reason). fallback_reason is set when the stand-in replaced ProServer."""
+    fallback_reason = None
+    if not use_standin:
+        try:
+            return engine.connect(), None
+        except Exception as e:
+            if not QUERY_TEST_STANDIN_DB:
+                raise DryRunError(f"ProServer database unreachable: {error_message(e)}")
+            fallback_reason = f"ProServer database unreachable: {error_message(e)}"
+            logger.warning(f"⚠️ DRY RUN: {fallback_reason}; using SQLite stand-in {QUERY_TEST_STANDIN_DB}")
+
+    standin = _get_standin_engine()
+    if standin is None:
+        raise DryRunError("No SQLite stand-in configured (QUERY_TEST_STANDIN_DB)")
+    try:
+        return standin.connect(), fallback_reason
+    except Exception as e:
+        raise DryRunError(f"SQLite stand-in {QUERY_TEST_STANDIN_DB} could not be opened: {e}")
+
+
+def _sqlite_plan(conn, sql: str) -> list[str]:
+    depths = {}
+    lines = []
+    for plan_id, parent, _, detail in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"):
+        depths[plan_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[plan_id] + detail)
+    return lines
+
+
+def _mssql_plan(conn, sql: str) -> list[str]:
+    # SHOWPLAN_TEXT must be alone in its batch and stays on for the session,
+    # so it is switched off again before the connection goes back to the pool
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.execute("SET SHOWPLAN_TEXT ON")
+    try:
+        cursor.execute(sql)
+        lines = []
+        while True:
+            if cursor.description:
+                lines.extend(str(row[0]).rstrip() for row in cursor.fetchall())
+            if not cursor.nextset():
+                break
+        return lines
+    finally:
+        try:
+            cursor.execute("SET SHOWPLAN_TEXT OFF")
+            cursor.close()
+        except Exception as e:
+            logger.warning(f"⚠️ DRY RUN: Could not switch SHOWPLAN off, discarding connection: {e}")
+            conn.invalidate()
+
+
+def _plan(conn, sql: str) -> list[str] | None:
+    if conn.dialect.name == "sqlite":
+        return _sqlite_plan(conn, sql)
+    if conn.dialect.name == "mssql":
+        return _mssql_plan(conn, sql)
+    return None
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+def run_query_test(query_name: str, query_sql: str | None = None, max_rows: int | None = None,
+                   preview_rows: int = 20, timeout_seconds: float | None = None,
+                   use_standin: bool = False) -> dict:
+    """
+    Runs `query_sql` (the active query if omitted) once and reports its timing,
+    result shape and plan. Errors from the query itself are reported in the
+    result; DryRunError is raised when there is nothing to run it on.
+    """
+    query_name = query_config.normalize_query_name(query_name)
+    shape = RESULT_SHAPES.get(query_name)
+    if shape is None:
+        raise DryRunError(f"Unknown query '{query_name}'")
+    if query_sql is None:
+        query_sql = query_config.get_query(query_name)
+
+    max_rows = min(max_rows or QUERY_TEST_MAX_ROWS, QUERY_TEST_MAX_ROWS)
+    preview_rows = max(0, min(preview_rows, max_rows))
+    timeout_seconds = min(timeout_seconds or QUERY_TEST_TIMEOUT_SECONDS, QUERY_TEST_TIMEOUT_SECONDS)
+
+    conn, fallback_reason = _connect(use_standin)
+    result = {
+        "query_name": query_name,
+        "database": "proserver" if conn.dialect.name != "sqlite" else "sqlite_standin",
+        "fallback_reason": fallback_reason,
+        "max_rows": max_rows,
+        "timeout_seconds": timeout_seconds,
+        "expected_columns": list(shape.columns),
+        "plan": None,
+        "plan_error": None,
+        "error": None,
+        "timed_out": False,
+    }
+    with conn:
+        try:
+            with statement_timeout(conn, timeout_seconds):
+                result["plan"] = _plan(conn, query_sql)
+        except Exception as e:
+            result["plan_error"] = error_message(e)
+            logger.warning(f"⚠️ DRY RUN: No plan for '{query_name}': {result['plan_error']}")
+
+        started = time.perf_counter()
+        try:
+            with statement_timeout(conn, timeout_seconds):
+                cursor_result = conn.execute(text(query_sql))
+                columns = list(cursor_result.keys())
+                rows = cursor_result.fetchmany(max_rows + 1)
+                cursor_result.close()
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            result["error"] = error_message(e)
+            result["timed_out"] = is_timeout(e)
+            result["success"] = False
+            logger.warning(f"⚠️ DRY RUN: '{query_name}' failed after {result['elapsed_ms']} ms: {result['error']}")
+            return result
+        finally:
+            conn.rollback()
+
+    missing = [column for column in shape.columns if column not in columns]
+    result.update({
+        "success": True,
+        "elapsed_ms": elapsed_ms,
+        "row_count": min(len(rows), max_rows),
+        "truncated": len(rows) > max_rows,
+        "columns": columns,
+        "missing_columns": missing,
+        "shape_ok": not missing,
+        "rows": [{key: _json_value(value) for key, value in row._mapping.items()} for row in rows[:preview_rows]],
+    })
+    logger.info(f"DRY RUN: '{query_name}' on {result['database']}: {result['row_count']} rows"
+                f"{' (truncated)' if result['truncated'] else ''} in {elapsed_ms} ms"
+                f"{', missing ' + ', '.join(missing) if missing else ''}")
+    return result
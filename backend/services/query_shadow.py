@@ -0,0 +1,288 @@
+"""
+Shadow-Run Query Staging
+========================
+Lets admins try a replacement for device_query or building_query before it
+goes live on the scheduler hot path.
+
+A staged (candidate) query is stored encrypted in query_candidates. The
+query_shadow scheduler job (leader only) runs the active query and the
+candidate back to back against the ProServer database, once per interval,
+until QUERY_SHADOW_RUNS runs are recorded. Each run stores both latencies,
+both row counts, the result columns the application needs that the
+candidate lacks, and how many entries of the parsed result differ (panel
+state per building for device_query, name per building for building_query).
+
+A candidate can be promoted only when every recorded run succeeded, its
+slowest run fits QUERY_SHADOW_LATENCY_BUDGET_MS, it returns the required
+columns, and no run differed from the active query in more than
+QUERY_SHADOW_MAX_DIFF_RATIO of the entries (a little drift is expected,
+since the two queries do not run at the same instant).
+
+Both queries run with a statement timeout and fetch at most
+QUERY_SHADOW_MAX_ROWS rows, so a runaway candidate cannot hold the leader's
+shadow job or a ProServer connection. The candidate is cancelled shortly
+after QUERY_SHADOW_LATENCY_BUDGET_MS (a slower run could never be promoted);
+the active query gets QUERY_TEST_TIMEOUT_SECONDS. A cancelled or truncated
+query is recorded as a failed run.
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable
+from sqlalchemy import text
+from config import (engine, QUERY_SHADOW_RUNS, QUERY_SHADOW_LATENCY_BUDGET_MS, QUERY_SHADOW_MAX_DIFF_RATIO,
+                    QUERY_SHADOW_MAX_ROWS, QUERY_TEST_TIMEOUT_SECONDS)
+from logger import get_logger
+import query_config
+from services import proserver_service
+from services.db_timeouts import statement_timeout, error_message, is_timeout
+
+logger = get_logger(__name__)
+
+# Headroom over the latency budget before the candidate is cancelled, so a run
+# just over budget is still recorded with its real latency
+SHADOW_TIMEOUT_HEADROOM = 1.25
+
+
+@dataclass(frozen=True)
+class ResultShape:
+    # Columns the application reads from the query's rows
+    columns: tuple
+    # Turns rows of those columns into the {key: value} map the application uses
+    summarize: Callable[[list], dict]
+
+
+RESULT_SHAPES = {
+    "device_query": ResultShape(("dvcBuilding_FRK", "dvcCurrentState_TXT"), proserver_service.classify_panel_states),
+    "building_query": ResultShape(("Building_PRK", "bldBuildingName_TXT"), lambda rows: dict(rows)),
+}
+
+
+class CandidateError(Exception):
+    """A candidate query cannot be staged or promoted."""
+
+
+# --- Staging ---
+
+def stage_query(query_name: str, query_sql: str, description: str = "", staged_by: str = "") -> dict:
+    """Stores (or replaces) the candidate for a query and clears its shadow runs."""
+    query_name = query_config.normalize_query_name(query_name)
+    if query_name not in RESULT_SHAPES:
+        raise CandidateError(f"Query '{query_name}' cannot be staged")
+
+    with query_config.get_sqlite_connection() as conn:
+        conn.execute("""
+            INSERT INTO query_candidates (query_name, query_sql, description, staged_by, staged_at, runs)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, '[]')
+            ON CONFLICT(query_name) DO UPDATE SET
+                query_sql = excluded.query_sql,
+                description = excluded.description,
+                staged_by = excluded.staged_by,
+                staged_at = excluded.staged_at,
+                runs = '[]'
+        """, (query_name, query_config.encrypt_query(query_sql), description, staged_by))
+    logger.info(f"✅ SHADOW: Staged candidate for '{query_name}' ({QUERY_SHADOW_RUNS} shadow runs needed)")
+    return get_candidate(query_name)
+
+
+def discard_candidate(query_name: str) -> bool:
+    query_name = query_config.normalize_query_name(query_name)
+    with query_config.get_sqlite_connection() as conn:
+        deleted = conn.execute("DELETE FROM query_candidates WHERE query_name = ?", (query_name,)).rowcount
+    if deleted:
+        logger.info(f"SHADOW: Discarded candidate for '{query_name}'")
+    return bool(deleted)
+
+
+def _load_candidates(query_name: str | None = None) -> list[dict]:
+    sql = "SELECT query_name, query_sql, description, staged_by, staged_at, runs FROM query_candidates"
+    params = ()
+    if query_name:
+        sql += " WHERE query_name = ?"
+        params = (query_name,)
+    with query_config.get_sqlite_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    candidates = []
+    for row in rows:
+        candidate = dict(row)
+        candidate["query_sql"] = query_config.decrypt_query(candidate["query_sql"])
+        candidate["runs"] = json.loads(candidate["runs"])
+        candidates.append(candidate)
+    return candidates
+
+
+def get_candidate(query_name: str) -> dict | None:
+    """Returns the candidate with its shadow runs and promotion verdict, or None."""
+    candidates = _load_candidates(query_config.normalize_query_name(query_name))
+    if not candidates:
+        return None
+    candidate = candidates[0]
+    return {**candidate, **evaluate(candidate["runs"])}
+
+
+def get_all_candidates() -> list[dict]:
+    return [{**candidate, **evaluate(candidate["runs"])} for candidate in _load_candidates()]
+
+
+# --- Shadow Runs ---
+
+class ShadowFetchError(Exception):
+    """One of the two queries was cancelled or returned too many rows."""
+
+    def __init__(self, message: str, elapsed_ms: float, timed_out: bool = False):
+        super().__init__(message)
+        self.elapsed_ms = elapsed_ms
+        self.timed_out = timed_out
+
+
+def _timed_fetch(statement, timeout_seconds: float) -> tuple[list, list, float]:
+    """Returns (rows, result columns, elapsed ms), raising ShadowFetchError on timeout or too many rows."""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        try:
+            with statement_timeout(conn, timeout_seconds):
+                result = conn.execute(statement)
+                columns = list(result.keys())
+                rows = result.fetchmany(QUERY_SHADOW_MAX_ROWS + 1)
+                result.close()
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            raise ShadowFetchError(f"Cancelled after {timeout_seconds:g} s: {error_message(e)}",
+                                   (time.perf_counter() - started) * 1000, timed_out=True)
+        finally:
+            conn.rollback()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if len(rows) > QUERY_SHADOW_MAX_ROWS:
+        raise ShadowFetchError(f"Returned more than {QUERY_SHADOW_MAX_ROWS} rows", elapsed_ms)
+    return rows, columns, elapsed_ms
+
+
+def _project(rows: list, available: list, columns: tuple) -> tuple[list, list]:
+    """Returns (rows reduced to `columns`, required columns missing from the result's `available` columns)."""
+    missing = [column for column in columns if column not in available]
+    if missing:
+        return [], missing
+    return [tuple(row._mapping[column] for column in columns) for row in rows], []
+
+
+def _compare(active: dict, candidate: dict) -> tuple[int, float]:
+    keys = active.keys() | candidate.keys()
+    mismatches = sum(1 for key in keys if active.get(key, object()) != candidate.get(key, object()))
+    return mismatches, mismatches / max(1, len(keys))
+
+
+def shadow_run(query_name: str, candidate_sql: str) -> dict:
+    """Runs the active query and the candidate once and compares them."""
+    shape = RESULT_SHAPES[query_name]
+    run = {"at": time.time()}
+    stage = "active"
+    try:
+        active_rows, active_columns, run["active_ms"] = _timed_fetch(
+            query_config.get_cached_query(query_name).statement, QUERY_TEST_TIMEOUT_SECONDS
+        )
+        stage = "candidate"
+        candidate_rows, candidate_columns, run["candidate_ms"] = _timed_fetch(
+            text(candidate_sql), QUERY_SHADOW_LATENCY_BUDGET_MS / 1000 * SHADOW_TIMEOUT_HEADROOM
+        )
+        run["active_rows"] = len(active_rows)
+        run["candidate_rows"] = len(candidate_rows)
+
+        active_projected, _ = _project(active_rows, active_columns, shape.columns)
+        candidate_projected, missing = _project(candidate_rows, candidate_columns, shape.columns)
+        run["missing_columns"] = missing
+        if not missing:
+            run["mismatches"], run["mismatch_ratio"] = _compare(
+                shape.summarize(active_projected), shape.summarize(candidate_projected)
+            )
+    except ShadowFetchError as e:
+        run[f"{stage}_ms"] = round(e.elapsed_ms, 1)
+        run["error"] = f"{stage.capitalize()} query: {e}"
+        run["timed_out"] = e.timed_out
+        logger.warning(f"⚠️ SHADOW: Run for '{query_name}' failed: {run['error']}")
+    except Exception as e:
+        run["error"] = error_message(e)
+        logger.warning(f"⚠️ SHADOW: Run for '{query_name}' failed: {run['error']}")
+    return run
+
+
+def run_shadow_round():
+    """Scheduler job: one shadow run for every candidate that still needs runs."""
+    try:
+        candidates = _load_candidates()
+    except Exception as e:
+        logger.error(f"❌ SHADOW: Could not load candidates: {e}")
+        return
+
+    for candidate in candidates:
+        if len(candidate["runs"]) >= QUERY_SHADOW_RUNS:
+            continue
+        query_name = candidate["query_name"]
+        run = shadow_run(query_name, candidate["query_sql"])
+        runs = candidate["runs"] + [run]
+        with query_config.get_sqlite_connection() as conn:
+            # Only if it was not re-staged meanwhile
+            conn.execute(
+                "UPDATE query_candidates SET runs = ? WHERE query_name = ? AND staged_at = ?",
+                (json.dumps(runs), query_name, candidate["staged_at"])
+            )
+        logger.info(f"SHADOW: '{query_name}' run {len(runs)}/{QUERY_SHADOW_RUNS}: "
+                    f"active {run.get('active_ms', 0):.0f} ms, candidate {run.get('candidate_ms', 0):.0f} ms, "
+                    f"mismatches {run.get('mismatches', '-')}")
+
+
+# --- Promotion ---
+
+def evaluate(runs: list[dict]) -> dict:
+    """Summarises shadow runs and decides whether the candidate may be promoted."""
+    reasons = []
+    if len(runs) < QUERY_SHADOW_RUNS:
+        reasons.append(f"{len(runs)} of {QUERY_SHADOW_RUNS} shadow runs recorded")
+
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        reasons.append(f"{len(errors)} run(s) failed: {errors[-1]}")
+
+    missing = sorted({column for run in runs for column in run.get("missing_columns", [])})
+    if missing:
+        reasons.append(f"Missing required columns: {', '.join(missing)}")
+
+    candidate_ms = [run["candidate_ms"] for run in runs if "candidate_ms" in run]
+    active_ms = [run["active_ms"] for run in runs if "active_ms" in run]
+    if candidate_ms and max(candidate_ms) > QUERY_SHADOW_LATENCY_BUDGET_MS:
+        reasons.append(f"Slowest run took {max(candidate_ms):.0f} ms "
+                       f"(budget {QUERY_SHADOW_LATENCY_BUDGET_MS:.0f} ms)")
+
+    ratios = [run["mismatch_ratio"] for run in runs if "mismatch_ratio" in run]
+    if ratios and max(ratios) > QUERY_SHADOW_MAX_DIFF_RATIO:
+        reasons.append(f"Results differ from the active query in up to {max(ratios):.1%} of entries "
+                       f"(allowed {QUERY_SHADOW_MAX_DIFF_RATIO:.1%})")
+
+    return {
+        "summary": {
+            "runs": len(runs),
+            "active_max_ms": round(max(active_ms), 1) if active_ms else None,
+            "candidate_max_ms": round(max(candidate_ms), 1) if candidate_ms else None,
+            "max_mismatch_ratio": max(ratios) if ratios else None,
+        },
+        "promotable": not reasons,
+        "reasons": reasons,
+    }
+
+
+def promote_candidate(query_name: str) -> dict:
+    """
+    Makes the candidate the active query if its shadow runs allow it.
+    Raises CandidateError with the reasons otherwise.
+    """
+    candidate = get_candidate(query_name)
+    if candidate is None:
+        raise CandidateError(f"No candidate staged for '{query_name}'")
+    if not candidate["promotable"]:
+        raise CandidateError("; ".join(candidate["reasons"]))
+    if not query_config.set_query(candidate["query_name"], candidate["query_sql"], candidate["description"] or ""):
+        raise CandidateError(f"Failed to save query '{candidate['query_name']}'")
+    discard_candidate(candidate["query_name"])
+    logger.info(f"✅ SHADOW: Promoted candidate for '{candidate['query_name']}'")
+    return candidate
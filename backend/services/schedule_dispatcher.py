@@ -0,0 +1,249 @@
+"""
+Schedule Dispatcher
+===================
+Fires building start-time alerts at the exact instant they are due.
+
+Instead of comparing every building's start_time with the current "HH:MM"
+once a minute, the dispatcher loads building_times once and keeps a min-heap
+of next-fire instants. Its thread sleeps until the earliest one is due, so a
+late or overrunning scheduler tick can no longer skip an alert, and the work
+per schedule event is O(log n) instead of O(buildings) per minute.
+
+Schedule changes made through sqlite_config.set_building_time are pushed to
+the dispatcher immediately, and any other local write to the schedule tables
+wakes it to reload (sqlite_config.add_table_change_listener). Edits made by
+other workers only bump the tables' data generation
+(sqlite_config.get_table_generation), so the dispatcher also checks that
+every DISPATCHER_REMOTE_CHECK_SECONDS; between alerts and writes the thread
+stays asleep. A reload only requeues buildings whose start time changed, so
+pending alerts keep their instant.
+"""
+
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta, time as dt_time
+import pytz
+import sqlite_config
+from config import SCHEDULE_TIMEZONE, DEFAULT_START_TIME, DISPATCHER_REMOTE_CHECK_SECONDS
+from services import proserver_service, proevent_service
+from services.leader_election import LeaderLease, scheduler_lease
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Alerts more than this late (e.g. after the host was suspended) are dropped, not sent
+MISFIRE_GRACE_SECONDS = 3600
+
+
+def next_fire_at(start_time: str, now: float, tz) -> float:
+    """
+    Returns the next epoch timestamp after `now` at which `start_time` ("HH:MM")
+    occurs in timezone `tz`.
+    """
+    hour, minute = (int(part) for part in start_time[:5].split(":"))
+    today = datetime.fromtimestamp(now, tz).date()
+    for day_offset in (0, 1):
+        local_fire = datetime.combine(today + timedelta(days=day_offset), dt_time(hour, minute))
+        fire_at = tz.localize(local_fire).timestamp()
+        if fire_at > now:
+            return fire_at
+    return fire_at
+
+
+class ScheduleDispatcher:
+    """
+    Background thread that sends start-time alerts when each building's schedule is due.
+
+    Heap entries are (fire_at, building_id, version). Changing a building's start
+    time bumps its version; stale entries are discarded lazily when popped.
+
+    With a lease, alerts are only dispatched while it is unexpired, so a
+    leader that stalled past its lease never fires next to the new leader.
+    """
+
+    def __init__(self, lease: LeaderLease | None = None):
+        self._lease = lease
+        self._tz = pytz.timezone(SCHEDULE_TIMEZONE)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._start_times = {}
+        self._versions = {}
+        self._next_check_at = 0.0
+        # Set by a local write to the schedule tables; the thread reloads right away
+        self._reload_requested = False
+        # Table generation the schedules were last loaded from
+        self._loaded_generation = None
+        self.last_fired_at = None
+        self._stopping = False
+        self._thread = None
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Starts the dispatcher thread (no-op if it is already running)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ScheduleDispatcher")
+        self._thread.start()
+        logger.info("✅ DISPATCHER: Started")
+
+    def stop(self, timeout: float = 10.0):
+        """Signals the dispatcher thread to stop and waits for it to exit."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info("DISPATCHER: Stopped")
+
+    # --- Schedule Updates ---
+
+    def reload(self):
+        """
+        Re-reads every building schedule from SQLite. Only buildings whose start
+        time changed (or that were added or removed) are requeued; the others keep
+        their pending fire instant, even if it came due while the table was read.
+        """
+        # Generation first: a write landing in between only causes one extra reload
+        generation = sqlite_config.get_table_generation()
+        building_times = sqlite_config.get_all_building_times()
+        now = time.time()
+        changed = 0
+        with self._cond:
+            for building_id in self._start_times.keys() - building_times.keys():
+                self._unschedule_locked(building_id)
+                changed += 1
+            for building_id, schedule in building_times.items():
+                start_time = (schedule.get("start_time") or DEFAULT_START_TIME)[:5]
+                if self._start_times.get(building_id) != start_time:
+                    self._schedule_locked(building_id, start_time, now)
+                    changed += 1
+            self._loaded_generation = generation
+            self._cond.notify_all()
+        logger.info(f"DISPATCHER: Loaded schedules for {len(building_times)} buildings "
+                    f"(generation {generation}, {changed} rescheduled)")
+
+    def on_building_time_changed(self, building_id: int, start_time: str):
+        """Listener for sqlite_config.set_building_time; reschedules one building."""
+        with self._cond:
+            if self._start_times.get(building_id) == start_time[:5]:
+                return
+            self._schedule_locked(building_id, start_time, time.time())
+            self._cond.notify_all()
+        logger.info(f"DISPATCHER: Building {building_id} rescheduled to {start_time[:5]}")
+
+    def on_tables_changed(self):
+        """Listener for sqlite_config table writes; wakes the thread to reload."""
+        with self._cond:
+            self._reload_requested = True
+            self._cond.notify_all()
+
+    def _schedule_locked(self, building_id: int, start_time: str, now: float):
+        start_time = start_time[:5]
+        try:
+            fire_at = next_fire_at(start_time, now, self._tz)
+        except ValueError:
+            logger.error(f"DISPATCHER: Invalid start time '{start_time}' for building {building_id}")
+            return
+        version = self._versions.get(building_id, 0) + 1
+        self._versions[building_id] = version
+        self._start_times[building_id] = start_time
+        heapq.heappush(self._heap, (fire_at, building_id, version))
+
+    def _unschedule_locked(self, building_id: int):
+        # Bumping the version turns the building's heap entry stale
+        self._versions[building_id] = self._versions.get(building_id, 0) + 1
+        self._start_times.pop(building_id, None)
+
+    def next_due(self) -> dict | None:
+        """Returns {"building_id", "fire_at"} for the earliest pending alert, if any."""
+        with self._cond:
+            while self._heap and self._heap[0][2] != self._versions.get(self._heap[0][1]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            fire_at, building_id, _ = self._heap[0]
+            return {"building_id": building_id, "fire_at": fire_at}
+
+    # --- Dispatch Loop ---
+
+    def _run(self):
+        logger.info("🚀 DISPATCHER: Thread started")
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"❌ DISPATCHER: Initial schedule load failed: {e}", exc_info=True)
+
+        while True:
+            try:
+                due, needs_check = self._wait_for_due()
+                if due is None:
+                    return
+                if due:
+                    self._fire(due)
+                if needs_check and sqlite_config.get_table_generation() != self._loaded_generation:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"❌ DISPATCHER: Error in dispatch loop: {e}", exc_info=True)
+                time.sleep(5)
+
+    def _wait_for_due(self) -> tuple[dict | None, bool]:
+        """
+        Sleeps until an alert is due, a local write requests a reload, or the
+        next check for writes by other workers.
+
+        Returns:
+            ({building_id: start_time} of due buildings, needs_check), or (None, False) when stopping
+        """
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                # Due alerts go first
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                if self._reload_requested or now >= self._next_check_at:
+                    self._reload_requested = False
+                    self._next_check_at = now + DISPATCHER_REMOTE_CHECK_SECONDS
+                    return {}, True
+                wake_at = self._next_check_at
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                self._cond.wait(wake_at - now)
+
+            if self._stopping:
+                return None, False
+
+            now = time.time()
+            due = {}
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, building_id, version = heapq.heappop(self._heap)
+                if version != self._versions.get(building_id):
+                    continue  # superseded by a schedule change
+
+                start_time = self._start_times[building_id]
+                heapq.heappush(self._heap, (next_fire_at(start_time, now, self._tz), building_id, version))
+
+                lateness = now - fire_at
+                if lateness > MISFIRE_GRACE_SECONDS:
+                    logger.warning(f"DISPATCHER: Building {building_id} alert for {start_time} is "
+                                   f"{lateness:.0f}s late. Dropped.")
+                    continue
+                due[building_id] = start_time
+            return due, False
+
+    def _fire(self, due: dict[int, str]):
+        if self._lease is not None and not self._lease.is_leader:
+            logger.warning(f"⚠️ DISPATCHER: Leader lease expired. Not dispatching start-time alerts "
+                           f"for building(s) {sorted(due)}.")
+            return
+        logger.info(f"📅 DISPATCHER: Start time reached for {len(due)} building(s)")
+        self.last_fired_at = time.time()
+        live_states = proserver_service.get_all_live_building_arm_states()
+        proevent_service.send_start_time_alerts(due, live_states)
+
+
+dispatcher = ScheduleDispatcher(lease=scheduler_lease)
+sqlite_config.add_building_time_listener(dispatcher.on_building_time_changed)
+sqlite_config.add_table_change_listener(dispatcher.on_tables_changed)
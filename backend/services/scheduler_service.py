@@ -2,6 +2,8 @@
 Scheduler Service - FIXED VERSION
 ==================================
 Runs periodic background tasks with correct logging and terminology.
+The scheduler lives on the asyncio loop and is started and drained by the
+FastAPI lifespan in main.py.
 
 TERMINOLOGY:
 - ProEvents: Reactive event triggers (not "devices")
@@ -10,41 +12,73 @@ TERMINOLOGY:
 - Panel States: AreaArmingStates.4 = ARMED, AreaArmingStates.2 = DISARMED
 """
 
-import schedule
+import asyncio
 import time
-import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from config import (SCHEDULER_EXECUTOR_WORKERS, SCHEDULER_DRAIN_TIMEOUT_SECONDS, LEADER_HEARTBEAT_SECONDS,
+                    PANEL_POLL_MIN_SECONDS, QUERY_SHADOW_INTERVAL_SECONDS)
 from logger import get_logger
-from services import proevent_service
+import sqlite_config
+from query_config import get_query_cache_stats
+from services import proevent_service, proserver_service, query_shadow
+from services.tick_context import TickContext
+from services.schedule_dispatcher import dispatcher
+from services.leader_election import LeaderLease, scheduler_lease
+from services.adaptive_poller import AdaptivePoller
+from services.notification_outbox import outbox_sender
 import traceback
 
 logger = get_logger(__name__)
 
 
+panel_poller = AdaptivePoller(schedule_source=dispatcher)
+
+
 def scheduled_job():
     """
-    Main scheduler job that runs every minute.
+    Main scheduler job. Runs at the interval chosen by panel_poller, between
+    PANEL_POLL_MIN_SECONDS and PANEL_POLL_MAX_SECONDS.
+    
+    Monitors panel state changes and updates ProEvent reactive states.
+    Start-time alerts are no longer checked here: the ScheduleDispatcher
+    fires them at the exact instant each building is due.
     
-    Phase 1: Check scheduled times and send alerts if panel is disarmed
-    Phase 2: Monitor panel state changes and update ProEvent reactive states
+    The tick uses one TickContext, so live panel states and the ignore map
+    are fetched at most once per tick.
     """
     logger.info("="*70)
     logger.info("🔄 SCHEDULER: Starting scheduled job execution")
     logger.info("="*70)
 
+    ctx = TickContext()
+    started_at = time.time()
+
     try:
-        # Phase 1: Scheduled Time Checks
-        logger.info("📅 PHASE 1: Checking scheduled times and sending alerts if needed...")
-        proevent_service.check_and_manage_scheduled_states()
-        logger.info("✅ PHASE 1: Completed successfully")
-        logger.info("-"*70)
-
-        # Phase 2: Panel State Monitoring and ProEvent Management
-        logger.info("🔍 PHASE 2: Monitoring panel state changes and managing ProEvents...")
-        proevent_service.manage_proevents_on_panel_state_change()
-        logger.info("✅ PHASE 2: Completed successfully")
+        # Panel State Monitoring and ProEvent Management
+        logger.info("🔍 Monitoring panel state changes and managing ProEvents...")
+        proevent_service.manage_proevents_on_panel_state_change(ctx)
+        logger.info("✅ Panel state monitoring completed successfully")
+        panel_poller.record_poll(started_at, ctx.buildings_changed, ctx.elapsed)
         
         logger.info("="*70)
-        logger.info("✅ SCHEDULER: Scheduled job completed successfully")
+        logger.info(f"✅ SCHEDULER: Scheduled job completed successfully "
+                   f"({ctx.round_trips} MSSQL round-trips, {ctx.elapsed:.2f}s wall-clock, "
+                   f"{ctx.proevents_updated} ProEvents updated, "
+                   f"{ctx.proevents_skipped} already at target)")
+        if ctx.live_states_unchanged:
+            probe = proserver_service.get_arm_state_probe_stats()
+            logger.info(f"🔎 SCHEDULER: Panel state probe unchanged. Full scan skipped "
+                       f"(hit rate {probe['hit_rate']:.0%}, {probe['rows_skipped']} rows not fetched so far)")
+        latency = ctx.latency_percentiles()
+        if latency:
+            logger.info(f"⏱️ SCHEDULER: Per-building latency over {latency['count']} buildings: "
+                       f"p50={latency['p50']:.3f}s, p95={latency['p95']:.3f}s, max={latency['max']:.3f}s")
+        elif ctx.batch_latency is not None:
+            logger.info(f"⏱️ SCHEDULER: {ctx.buildings_changed} changed buildings processed as one batch "
+                       f"in {ctx.batch_latency:.3f}s")
         logger.info("="*70)
         
     except Exception as e:
@@ -54,29 +88,230 @@ def scheduled_job():
         logger.error("="*70)
 
 
-def run_scheduler():
+@dataclass
+class ScheduledJob:
+    """A periodic job and its run metadata."""
+    name: str
+    func: Callable[[], None]
+    interval_seconds: float
+    leader_only: bool = True
+    # Called after each run to pick the delay before the next one (fixed rate if None)
+    next_interval: Callable[[], float] | None = None
+    next_run: datetime | None = None
+    last_run: datetime | None = None
+    last_duration: float | None = None
+    last_error: str | None = None
+    run_count: int = 0
+    skipped_count: int = 0
+    running: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval_seconds,
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_duration_seconds": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "last_error": self.last_error,
+            "run_count": self.run_count,
+            "skipped_count": self.skipped_count,
+            "running": self.running,
+        }
+
+
+class AsyncScheduler:
     """
-    Runs the scheduler loop in a separate thread.
-    Executes scheduled_job every 1 minute.
+    Runs periodic jobs on the asyncio event loop owned by the FastAPI lifespan.
+    
+    Jobs sleep on the loop (no polling wakeups) and their blocking DB work runs
+    in a bounded thread pool. stop() lets in-flight jobs finish (up to a drain
+    timeout) before the executor is shut down. start() is idempotent, so a
+    second lifespan start in the same process never registers duplicate jobs.
+    
+    With a lease, a heartbeat task keeps it renewed and leader-only jobs are
+    skipped in every process except the current leader.
     """
-    logger.info("🚀 SCHEDULER: Thread started")
-    schedule.every(1).minutes.do(scheduled_job)
-    logger.info("⏰ SCHEDULER: Job registered to run every 1 minute")
 
-    while True:
-        try:
-            schedule.run_pending()
-            time.sleep(1)
-        except Exception as e:
-            logger.error(f"❌ SCHEDULER: Error in scheduler loop: {e}", exc_info=True)
-            time.sleep(5)  # Wait before retrying
+    def __init__(self, max_workers: int = SCHEDULER_EXECUTOR_WORKERS, lease: LeaderLease | None = None):
+        self._max_workers = max_workers
+        self._lease = lease
+        self._jobs: dict[str, ScheduledJob] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._stop_event: asyncio.Event | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    def add_job(self, name: str, func: Callable[[], None], interval_seconds: float, leader_only: bool = True,
+                next_interval: Callable[[], float] | None = None):
+        """
+        Registers a job; re-registering a name replaces the previous definition.
+        
+        With `next_interval`, the job is rescheduled `next_interval()` seconds
+        after each run ends instead of at a fixed rate; `interval_seconds` is
+        then only the delay before the first run.
+        """
+        self._jobs[name] = ScheduledJob(name=name, func=func, interval_seconds=interval_seconds,
+                                        leader_only=leader_only, next_interval=next_interval)
+
+    async def start(self):
+        if self.is_running:
+            logger.warning("⚠️ SCHEDULER: Already running. Ignoring duplicate start.")
+            return
+
+        self._stop_event = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="SchedulerWorker")
+        if self._lease:
+            # Settle leadership before the first job can run
+            await asyncio.to_thread(self._lease.try_acquire)
+
+        self._tasks = [
+            asyncio.create_task(self._run_job(job), name=f"scheduler:{job.name}")
+            for job in self._jobs.values()
+        ]
+        if self._lease:
+            self._tasks.append(asyncio.create_task(self._heartbeat(), name="scheduler:leader_heartbeat"))
+        logger.info(f"✅ SCHEDULER: Started {len(self._tasks)} job(s) on {self._max_workers} worker thread(s)")
+
+    async def stop(self, drain_timeout: float = SCHEDULER_DRAIN_TIMEOUT_SECONDS):
+        """Stops scheduling new runs and waits up to `drain_timeout` seconds for in-flight jobs."""
+        if not self.is_running:
+            return
+
+        logger.info("🛑 SCHEDULER: Stopping, draining in-flight jobs...")
+        self._stop_event.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=drain_timeout)
+
+        if pending:
+            logger.warning(f"⚠️ SCHEDULER: {len(pending)} job(s) still running after {drain_timeout}s. Abandoning them.")
+            for task in pending:
+                task.cancel()
 
+        self._executor.shutdown(wait=not pending, cancel_futures=True)
+        self._executor = None
+        self._tasks = []
+        if self._lease:
+            await asyncio.to_thread(self._lease.release)
+        for job in self._jobs.values():
+            job.next_run = None
+        logger.info("✅ SCHEDULER: Stopped")
 
-def start_scheduler():
+    def status(self) -> list[dict]:
+        """Returns next-run and last-run metadata for every job."""
+        return [job.to_dict() for job in self._jobs.values()]
+
+    async def _heartbeat(self):
+        # Runs on the default executor so a busy job pool can never starve the lease
+        while True:
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=LEADER_HEARTBEAT_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                pass
+            await asyncio.to_thread(self._lease.try_acquire)
+
+    async def _run_job(self, job: ScheduledJob):
+        loop = asyncio.get_running_loop()
+        next_run_at = loop.time() + job.interval_seconds
+
+        while True:
+            delay = max(0.0, next_run_at - loop.time())
+            job.next_run = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                return  # stop requested while sleeping
+            except asyncio.TimeoutError:
+                pass
+
+            if job.leader_only and self._lease and not self._lease.is_leader:
+                job.skipped_count += 1
+                logger.debug(f"SCHEDULER: Not the leader. Skipping job '{job.name}'.")
+                next_run_at += job.interval_seconds
+                continue
+
+            job.running = True
+            job.last_run = datetime.now(timezone.utc)
+            started = loop.time()
+            try:
+                await loop.run_in_executor(self._executor, job.func)
+                job.last_error = None
+            except Exception as e:
+                job.last_error = str(e)
+                logger.error(f"❌ SCHEDULER: Job '{job.name}' failed: {e}", exc_info=True)
+            finally:
+                job.running = False
+                job.run_count += 1
+                job.last_duration = loop.time() - started
+
+            if job.next_interval:
+                try:
+                    job.interval_seconds = job.next_interval()
+                except Exception as e:
+                    logger.error(f"❌ SCHEDULER: Interval callback for job '{job.name}' failed: {e}")
+                next_run_at = loop.time() + job.interval_seconds
+                continue
+
+            # Fixed-rate schedule; runs missed during an overrun are skipped, not queued
+            next_run_at += job.interval_seconds
+            if next_run_at <= loop.time():
+                missed = int((loop.time() - next_run_at) // job.interval_seconds) + 1
+                logger.warning(f"⚠️ SCHEDULER: Job '{job.name}' overran its interval. Skipping {missed} run(s).")
+                next_run_at += missed * job.interval_seconds
+
+
+scheduler = AsyncScheduler(lease=scheduler_lease)
+scheduler.add_job("panel_state_monitor", scheduled_job, PANEL_POLL_MIN_SECONDS,
+                  next_interval=panel_poller.next_interval)
+scheduler.add_job("query_shadow", query_shadow.run_shadow_round, QUERY_SHADOW_INTERVAL_SECONDS)
+
+# Only the leader fires start-time alerts, so only it keeps a ProServer connection
+scheduler_lease.on_acquired(dispatcher.start)
+scheduler_lease.on_acquired(proserver_service.proserver_client.start)
+scheduler_lease.on_acquired(proserver_service.notification_sinks.start)
+scheduler_lease.on_acquired(outbox_sender.start)
+scheduler_lease.on_lost(dispatcher.stop)
+scheduler_lease.on_lost(outbox_sender.stop)
+scheduler_lease.on_lost(proserver_service.notification_sinks.stop)
+scheduler_lease.on_lost(proserver_service.proserver_client.stop)
+
+
+async def start_scheduler():
     """
-    Starts the scheduler in a background daemon thread.
+    Starts the async scheduler. If this process wins the leader lease, the
+    start-time alert dispatcher is started as well.
+    Called from the FastAPI lifespan.
     """
-    logger.info("🔧 SCHEDULER: Starting scheduler in background thread...")
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True, name="SchedulerThread")
-    scheduler_thread.start()
-    logger.info("✅ SCHEDULER: Background thread started successfully")
\ No newline at end of file
+    logger.info("🔧 SCHEDULER: Starting scheduler...")
+    await scheduler.start()
+
+
+async def stop_scheduler():
+    """
+    Stops the scheduler, letting in-flight work finish, and releases the
+    leader lease (which also stops the dispatcher).
+    Called from the FastAPI lifespan on shutdown.
+    """
+    await scheduler.stop()
+    await asyncio.to_thread(proevent_service.shutdown_building_executor)
+
+
+def get_scheduler_status() -> dict:
+    """Returns scheduler job metadata, panel polling metrics and the next pending start-time alert."""
+    next_due = dispatcher.next_due()
+    return {
+        "running": scheduler.is_running,
+        "leader": scheduler_lease.status(),
+        "jobs": scheduler.status(),
+        "panel_state_probe": proserver_service.get_arm_state_probe_stats(),
+        "panel_poller": panel_poller.status(),
+        "proserver_connection": proserver_service.proserver_client.status(),
+        "building_names": proserver_service.building_names.status(),
+        "sqlite_table_cache": sqlite_config.get_table_cache_stats(),
+        "query_cache": get_query_cache_stats(),
+        "next_start_time_alert": {
+            "building_id": next_due["building_id"],
+            "fire_at": datetime.fromtimestamp(next_due["fire_at"], timezone.utc).isoformat(),
+        } if next_due else None,
+    }
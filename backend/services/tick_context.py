@@ -0,0 +1,100 @@
+"""
+Tick Context
+============
+Per-tick snapshot of the data shared by every scheduler phase.
+
+A single scheduler tick used to fetch the live panel states, the building
+schedules and the ignore map separately in each phase. The TickContext loads
+each of them at most once per tick and hands the same snapshot to every phase.
+
+TERMINOLOGY:
+- Live States: {building_id: is_armed} read from Device_TBL
+- Building Times: {building_id: {"start_time": "HH:MM"}} read from SQLite
+- Ignore Map: {proevent_id: {...}} read from SQLite
+"""
+
+import math
+import time
+import sqlite_config
+from config import get_thread_round_trips
+from services import proserver_service
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TickContext:
+    """
+    Lazily loads and caches the shared data for one scheduler tick.
+
+    Every property is fetched on first access and reused afterwards, so
+    phases that do not need a piece of data never pay for it.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._round_trips_at_start = get_thread_round_trips()
+        self._live_states = None
+        self.live_states_unchanged = False
+        self._building_times = None
+        self._ignored_map = None
+        self.buildings_changed = 0
+        self.proevents_updated = 0
+        self.proevents_skipped = 0
+        self.worker_round_trips = 0
+        # Filled by the worker-pool path; the batched path sets batch_latency instead
+        self.building_latencies = {}
+        self.batch_latency = None
+
+    @property
+    def live_states(self) -> dict:
+        """Current panel state per building: {building_id: is_armed}."""
+        if self._live_states is None:
+            self._live_states, self.live_states_unchanged = \
+                proserver_service.get_live_building_arm_states_with_probe()
+        return self._live_states
+
+    @property
+    def building_times(self) -> dict:
+        """Configured schedules per building: {building_id: {"start_time": ...}}."""
+        if self._building_times is None:
+            self._building_times = sqlite_config.get_all_building_times()
+        return self._building_times
+
+    @property
+    def ignored_map(self) -> dict:
+        """User-selected (ignored) ProEvents: {proevent_id: {...}}."""
+        if self._ignored_map is None:
+            self._ignored_map = sqlite_config.get_ignored_proevents()
+        return self._ignored_map
+
+    @property
+    def round_trips(self) -> int:
+        """Number of MSSQL round-trips made by this tick so far, including worker threads."""
+        return get_thread_round_trips() - self._round_trips_at_start + self.worker_round_trips
+
+    def latency_percentiles(self) -> dict:
+        """
+        Per-building processing latency for this tick.
+        
+        Returns:
+            dict: {"count", "p50", "p95", "max"} in seconds (empty if no building was processed)
+        """
+        latencies = sorted(self.building_latencies.values())
+        if not latencies:
+            return {}
+
+        def nearest_rank(pct):
+            return latencies[max(0, math.ceil(pct / 100 * len(latencies)) - 1)]
+
+        return {
+            "count": len(latencies),
+            "p50": nearest_rank(50),
+            "p95": nearest_rank(95),
+            "max": latencies[-1],
+        }
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the tick started."""
+        return time.monotonic() - self.started_at
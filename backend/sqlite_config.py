@@ -1,39 +1,178 @@
 # backend/sqlite_config.py
 
-import sqlite3
-from contextlib import contextmanager
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+import sqlite_db
+from config import SQLITE_CACHE_CHECK_INTERVAL_SECONDS
 from logger import get_logger
 
 logger = get_logger(__name__)
 
 SQLITE_DB_PATH = "building_schedules.db"
 
-@contextmanager
+# Callbacks notified with (building_id, start_time) after a schedule is saved
+_building_time_listeners = []
+# Callbacks notified (no arguments) after this process wrote building_times or ignored_proevents
+_table_change_listeners = []
+
 def get_sqlite_connection():
-    """Context manager for SQLite database connections."""
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"SQLite transaction error: {e}")
-        raise
-    else:
-        conn.commit()
-    finally:
-        conn.close()
+    """Context manager for this thread's pooled SQLite connection (see sqlite_db)."""
+    return sqlite_db.get_connection(SQLITE_DB_PATH)
 
-# --- Building Schedule Functions ---
+# --- Read-through Cache ---
+#
+# building_times and ignored_proevents only change when an operator saves
+# something, so both tables are held in memory as one immutable snapshot.
+# Readers take the current snapshot without locking. Writers bump the
+# 'schedules' row of data_generation in the same transaction and invalidate
+# the local snapshot; other workers notice the new generation within
+# SQLITE_CACHE_CHECK_INTERVAL_SECONDS.
+
+@dataclass(frozen=True)
+class _TableSnapshot:
+    local_generation: int
+    db_generation: int
+    building_times: Mapping
+    ignored_proevents: Mapping
+    ignored_by_building: Mapping
+
+_snapshot = None
+# Bumped by writers in this process; a snapshot from an older generation is reloaded
+_local_generation = 0
+_next_check_at = 0.0
+_snapshot_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "reloads": 0, "generation_checks": 0, "invalidations": 0}
 
-def get_building_time(building_id: int) -> dict | None:
+def _read_db_generation(conn) -> int:
+    row = conn.execute("SELECT value FROM data_generation WHERE name = 'schedules'").fetchone()
+    return row["value"] if row else 0
+
+def _bump_db_generation(conn) -> None:
+    """Called inside a writer's transaction so other workers reload their snapshot."""
+    conn.execute("UPDATE data_generation SET value = value + 1 WHERE name = 'schedules'")
+
+def invalidate_table_cache() -> None:
+    """Drops this process's snapshot (the next read reloads from SQLite) and notifies table change listeners."""
+    global _local_generation
+    with _snapshot_lock:
+        _local_generation += 1
+        _cache_stats["invalidations"] += 1
+    for callback in list(_table_change_listeners):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Table change listener failed: {e}")
+
+def add_table_change_listener(callback) -> None:
+    """Registers callback(), called after every local write to building_times or ignored_proevents."""
+    _table_change_listeners.append(callback)
+
+def _load_snapshot(local_generation: int) -> _TableSnapshot:
     with get_sqlite_connection() as conn:
-        cursor = conn.execute(
-            "SELECT start_time FROM building_times WHERE building_id = ?",
-            (building_id,)
-        )
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        # Generation first: a write landing between the reads only causes one extra reload
+        db_generation = _read_db_generation(conn)
+        time_rows = conn.execute("SELECT building_id, start_time FROM building_times").fetchall()
+        ignored_rows = conn.execute("""
+            SELECT proevent_id, building_frk, ignore_on_arm, ignore_on_disarm
+            FROM ignored_proevents
+        """).fetchall()
+
+    building_times = {
+        row["building_id"]: MappingProxyType({"start_time": row["start_time"]})
+        for row in time_rows
+    }
+    ignored_proevents = {}
+    ignored_by_building = {}
+    for row in ignored_rows:
+        entry = MappingProxyType({
+            "building_frk": row["building_frk"],
+            "ignore_on_arm": bool(row["ignore_on_arm"]),
+            "ignore_on_disarm": bool(row["ignore_on_disarm"])
+        })
+        ignored_proevents[row["proevent_id"]] = entry
+        ignored_by_building.setdefault(row["building_frk"], {})[row["proevent_id"]] = entry
+
+    return _TableSnapshot(
+        local_generation=local_generation,
+        db_generation=db_generation,
+        building_times=MappingProxyType(building_times),
+        ignored_proevents=MappingProxyType(ignored_proevents),
+        ignored_by_building=MappingProxyType(
+            {building_id: MappingProxyType(entries) for building_id, entries in ignored_by_building.items()}
+        ),
+    )
+
+def _get_snapshot() -> _TableSnapshot:
+    """Returns the current snapshot, reloading it if this or another worker wrote since it was taken."""
+    global _snapshot, _next_check_at
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.local_generation == _local_generation \
+            and time.monotonic() < _next_check_at:
+        _cache_stats["hits"] += 1
+        return snapshot
+
+    with _snapshot_lock:
+        snapshot = _snapshot
+        local_generation = _local_generation
+        if snapshot is not None and snapshot.local_generation == local_generation:
+            # Only the periodic cross-process check is due
+            with get_sqlite_connection() as conn:
+                db_generation = _read_db_generation(conn)
+            if db_generation == snapshot.db_generation:
+                # Not a hit: this lookup read SQLite
+                _cache_stats["generation_checks"] += 1
+                _next_check_at = time.monotonic() + SQLITE_CACHE_CHECK_INTERVAL_SECONDS
+                return snapshot
+
+        _cache_stats["misses"] += 1
+        snapshot = _load_snapshot(local_generation)
+        if _snapshot is not None:
+            _cache_stats["reloads"] += 1
+        _snapshot = snapshot
+        _next_check_at = time.monotonic() + SQLITE_CACHE_CHECK_INTERVAL_SECONDS
+        return snapshot
+
+def get_table_generation() -> int:
+    """
+    Generation of building_times and ignored_proevents. It changes whenever
+    any worker saves either table (seen here within SQLITE_CACHE_CHECK_INTERVAL_SECONDS).
+    """
+    return _get_snapshot().db_generation
+
+def get_table_cache_stats() -> dict:
+    """
+    Counters of the read-through cache. Every lookup counts as exactly one of:
+    hits (served from memory, no SQLite access), generation_checks (the
+    periodic cross-process check read data_generation and the snapshot was
+    still current) or misses (the snapshot was reloaded).
+    """
+    snapshot = _snapshot
+    return {
+        **_cache_stats,
+        "generation": snapshot.db_generation if snapshot else None,
+        "building_times": len(snapshot.building_times) if snapshot else 0,
+        "ignored_proevents": len(snapshot.ignored_proevents) if snapshot else 0,
+    }
+
+# --- Building Schedule Functions ---
+
+def add_building_time_listener(callback) -> None:
+    """Registers callback(building_id, start_time), called after set_building_time saves a row."""
+    _building_time_listeners.append(callback)
+
+def _notify_building_time_listeners(building_id: int, start_time: str) -> None:
+    for callback in list(_building_time_listeners):
+        try:
+            callback(building_id, start_time)
+        except Exception as e:
+            logger.error(f"Building time listener failed for building {building_id}: {e}")
+
+def get_building_time(building_id: int) -> Mapping | None:
+    """Returns {"start_time": ...} for a building (read-only, from the cache), or None."""
+    return _get_snapshot().building_times.get(building_id)
 
 def set_building_time(building_id: int, start_time: str) -> bool:
     """
@@ -57,64 +196,123 @@ def set_building_time(building_id: int, start_time: str) -> bool:
                     VALUES (?, ?)
                 """, (building_id, start_time))
                 logger.info(f"Inserted new schedule for building {building_id}: start at {start_time}")
+            _bump_db_generation(conn)
+        invalidate_table_cache()
+        _notify_building_time_listeners(building_id, start_time)
         return True
     except Exception as e:
         logger.error(f"Error setting building time for ID {building_id}: {e}")
         return False
 
 
-def get_all_building_times() -> dict:
+def get_all_building_times() -> Mapping:
     """
-    Returns all building schedules.
+    Returns all building schedules as a read-only snapshot from the cache.
     """
-    with get_sqlite_connection() as conn:
-        cursor = conn.execute("SELECT building_id, start_time FROM building_times")
-        rows = cursor.fetchall()
-        return {row["building_id"]: {"start_time": row["start_time"]} for row in rows} if rows else {}
+    return _get_snapshot().building_times
 
 # --- Ignored ProEvent Functions ---
 
-def get_ignored_proevents() -> dict:
+def get_ignored_proevents() -> Mapping:
     """
-    Fetches all ignored proevents with their building associations.
+    Returns all ignored proevents with their building associations,
+    as a read-only snapshot from the cache.
     """
-    with get_sqlite_connection() as conn:
-        cursor = conn.execute("""
-            SELECT proevent_id, building_frk, ignore_on_arm, ignore_on_disarm 
-            FROM ignored_proevents
-        """)
-        rows = cursor.fetchall()
-        if not rows:
-            return {}
-            
-        return {
-            row["proevent_id"]: {
-                "building_frk": row["building_frk"],
-                "ignore_on_arm": bool(row["ignore_on_arm"]), 
-                "ignore_on_disarm": bool(row["ignore_on_disarm"])
-            } 
-            for row in rows
-        }
+    return _get_snapshot().ignored_proevents
+
+def get_ignored_proevents_for_building(building_id: int, disarm_only: bool = False) -> Mapping:
+    """
+    Returns the ignored proevents of one building, in the same shape as get_ignored_proevents().
+    With disarm_only=True only rows with ignore_on_disarm set are returned.
+    """
+    entries = _get_snapshot().ignored_by_building.get(building_id, MappingProxyType({}))
+    if disarm_only:
+        return MappingProxyType({pid: data for pid, data in entries.items() if data["ignore_on_disarm"]})
+    return entries
+
+_UPSERT_IGNORED_PROEVENT_SQL = """
+    INSERT INTO ignored_proevents (proevent_id, building_frk, device_prk, ignore_on_arm, ignore_on_disarm)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(proevent_id) DO UPDATE SET
+        building_frk = excluded.building_frk,
+        device_prk = excluded.device_prk,
+        ignore_on_arm = excluded.ignore_on_arm,
+        ignore_on_disarm = excluded.ignore_on_disarm
+"""
 
 def set_proevent_ignore_status(proevent_id: int, building_frk: int, device_prk: int, ignore_on_arm: bool, ignore_on_disarm: bool) -> bool:
     """Set the ignore status for a specific proevent."""
     try:
         with get_sqlite_connection() as conn:
-            conn.execute("""
-                INSERT INTO ignored_proevents (proevent_id, building_frk, device_prk, ignore_on_arm, ignore_on_disarm)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(proevent_id) DO UPDATE SET
-                    building_frk = excluded.building_frk,
-                    device_prk = excluded.device_prk,
-                    ignore_on_arm = excluded.ignore_on_arm,
-                    ignore_on_disarm = excluded.ignore_on_disarm
-            """, (proevent_id, building_frk, device_prk, ignore_on_arm, ignore_on_disarm))
+            conn.execute(_UPSERT_IGNORED_PROEVENT_SQL,
+                         (proevent_id, building_frk, device_prk, ignore_on_arm, ignore_on_disarm))
+            _bump_db_generation(conn)
+        invalidate_table_cache()
         logger.info(f"Updated ignore status for ProEvent {proevent_id}")
         return True
     except Exception as e:
         logger.error(f"Error setting ignore status for ProEvent ID {proevent_id}: {e}")
         return False
 
+def _upsert_ignored_proevents(conn, rows: list[tuple], results: list[bool]):
+    """Upserts `rows` inside the caller's ignore_bulk savepoint, marking rows that fail in `results`."""
+    try:
+        conn.executemany(_UPSERT_IGNORED_PROEVENT_SQL, rows)
+    except Exception as e:
+        # Find the offending rows: redo the batch row by row, each behind a savepoint,
+        # and still commit everything that succeeded in this one transaction
+        logger.warning(f"Bulk ignore update failed ({e}). Retrying {len(rows)} items individually.")
+        conn.execute("ROLLBACK TO ignore_bulk")
+        for index, row in enumerate(rows):
+            conn.execute("SAVEPOINT ignore_item")
+            try:
+                conn.execute(_UPSERT_IGNORED_PROEVENT_SQL, row)
+            except Exception as row_error:
+                conn.execute("ROLLBACK TO ignore_item")
+                results[index] = False
+                logger.error(f"Error setting ignore status for ProEvent ID {row[0]}: {row_error}")
+            conn.execute("RELEASE ignore_item")
+
+def set_proevent_ignore_status_bulk(items: list[dict]) -> list[bool]:
+    """
+    Sets the ignore status of many proevents in one transaction (one commit).
+
+    Args:
+        items: {"proevent_id", "building_frk", "device_prk", "ignore_on_arm", "ignore_on_disarm"} per proevent
+
+    Returns:
+        list[bool]: Per item, in input order, whether it was saved
+    """
+    if not items:
+        return []
+    rows = [
+        (item["proevent_id"], item["building_frk"], item["device_prk"],
+         bool(item["ignore_on_arm"]), bool(item["ignore_on_disarm"]))
+        for item in items
+    ]
+    results = [True] * len(rows)
+    try:
+        with get_sqlite_connection() as conn:
+            # A savepoint rather than BEGIN: the pooled connection may already be inside
+            # a caller's transaction, and a failed batch must not roll that back
+            conn.execute("SAVEPOINT ignore_bulk")
+            try:
+                _upsert_ignored_proevents(conn, rows, results)
+                if any(results):
+                    _bump_db_generation(conn)
+            except BaseException:
+                conn.execute("ROLLBACK TO ignore_bulk")
+                conn.execute("RELEASE ignore_bulk")
+                raise
+            conn.execute("RELEASE ignore_bulk")
+        invalidate_table_cache()
+    except Exception as e:
+        logger.error(f"Error saving ignore status for {len(rows)} ProEvents: {e}")
+        return [False] * len(rows)
+
+    logger.info(f"Updated ignore status for {results.count(True)} of {len(rows)} ProEvents in one transaction")
+    return results
+
 # --- ProEvent History Logging ---
 
 def log_proevent_state(proevent_id: int, building_frk: int, state: str) -> bool:
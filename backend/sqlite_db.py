@@ -0,0 +1,119 @@
+"""
+SQLite Connection Layer
+=======================
+Shared access to building_schedules.db for sqlite_config, query_config and
+admin_routes.
+
+Opening a connection (and re-applying pragmas) on every call used to cost
+more than the queries themselves; the scheduler tick alone opened dozens.
+Here each thread keeps one connection per database file and reuses it:
+
+- journal_mode=WAL so readers never block the writer and vice versa
+- synchronous=NORMAL: durable across application crashes, and in WAL mode
+  only the last transactions can be lost on power failure
+- a larger page cache and memory-mapped reads (SQLITE_CACHE_SIZE_KB,
+  SQLITE_MMAP_SIZE_BYTES)
+- busy_timeout so concurrent writers from other workers wait instead of
+  failing with "database is locked"
+- cached_statements: repeated SQL text reuses its prepared statement
+
+get_connection() keeps the old context-manager contract: commit on success,
+rollback on error. Nested uses on one thread share the outer transaction.
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from config import SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE_BYTES, SQLITE_CACHED_STATEMENTS
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+SQLITE_DB_PATH = "building_schedules.db"
+
+_local = threading.local()
+# Every open connection, so close_all() can close them on shutdown
+_all_connections = weakref.WeakSet()
+_stats_lock = threading.Lock()
+_stats = {"connections_opened": 0}
+
+
+class _PooledConnection:
+    """A thread's connection to one database file plus its transaction nesting depth."""
+
+    def __init__(self, path: str):
+        self.pid = os.getpid()
+        self.depth = 0
+        self.closed = False
+        # check_same_thread=False only so close_all() may close it from the shutdown thread
+        self.conn = sqlite3.connect(
+            path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+            check_same_thread=False,
+        )
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_SIZE_KB)}")
+        self.conn.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE_BYTES)}")
+        self.conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _checkout(path: str) -> _PooledConnection:
+    pooled_by_path = getattr(_local, "connections", None)
+    if pooled_by_path is None:
+        pooled_by_path = _local.connections = {}
+    pooled = pooled_by_path.get(path)
+    # A forked worker must not reuse its parent's connection
+    if pooled is None or pooled.closed or pooled.pid != os.getpid():
+        pooled = _PooledConnection(path)
+        pooled_by_path[path] = pooled
+        _all_connections.add(pooled)
+        with _stats_lock:
+            _stats["connections_opened"] += 1
+        logger.debug(f"Opened SQLite connection to {path} for thread {threading.current_thread().name}")
+    return pooled
+
+
+@contextmanager
+def get_connection(path: str = SQLITE_DB_PATH):
+    """
+    Context manager yielding this thread's connection to `path`.
+    The outermost block commits on success and rolls back on error.
+    """
+    pooled = _checkout(path)
+    pooled.depth += 1
+    try:
+        yield pooled.conn
+    except Exception as e:
+        if pooled.depth == 1:
+            pooled.conn.rollback()
+            logger.error(f"SQLite transaction error: {e}")
+        raise
+    else:
+        if pooled.depth == 1:
+            pooled.conn.commit()
+    finally:
+        pooled.depth -= 1
+
+
+def close_all():
+    """Closes every pooled connection. Threads that query afterwards open new ones."""
+    closed = 0
+    for pooled in list(_all_connections):
+        pooled.closed = True
+        try:
+            pooled.conn.close()
+            closed += 1
+        except sqlite3.Error as e:
+            logger.error(f"Error closing SQLite connection: {e}")
+    logger.info(f"Closed {closed} SQLite connection(s)")
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "open_connections": len(_all_connections)}
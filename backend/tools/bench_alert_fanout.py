@@ -0,0 +1,95 @@
+"""
+Start-Time Alert Fan-out Benchmark
+==================================
+Measures how long a burst of start-time alerts (many buildings sharing the
+default 20:00 start time) takes to reach a local fake ProServer.
+
+Latency is taken on the listener side: for each alert, the time from the
+start of the burst until the fake ProServer received the frame. The spread
+is the gap between the first and the last alert received.
+
+Compared paths:
+- serial: the old behaviour, one name lookup (simulated with --lookup-ms)
+  and one fresh socket per alert, one alert after another
+- pool N: the outbox path, names already cached and the batch split over N
+  persistent connections (ProServerClientPool), written concurrently
+
+--frame-delay-ms makes the fake ProServer spend time on each frame, which is
+where concurrent connections help.
+
+Usage (from backend/):
+    python -m tools.bench_alert_fanout
+    python -m tools.bench_alert_fanout --alerts 500 --frame-delay-ms 0.5 --pools 1 4 8
+"""
+
+import argparse
+import math
+import time
+from services.proserver_client import ProServerClientPool
+from tools.fake_proserver import FakeProServer, send_with_fresh_sockets
+
+
+def nearest_rank(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def report(label: str, fake: FakeProServer, started: float):
+    latencies = [t - started for t in fake.received_at]
+    spread = max(fake.received_at) - min(fake.received_at)
+    print(f"{label:>10} {len(latencies):>7} {nearest_rank(latencies, 50) * 1000:>9.1f} "
+          f"{nearest_rank(latencies, 95) * 1000:>9.1f} {max(latencies) * 1000:>9.1f} {spread * 1000:>10.1f}")
+
+
+def run_serial(messages: list[str], frame_delay: float, lookup_delay: float):
+    fake = FakeProServer(frame_delay=frame_delay).start()
+    started = time.time()
+    for message in messages:
+        time.sleep(lookup_delay)  # per-alert Building_TBL round-trip
+        send_with_fresh_sockets(fake.host, fake.port, [message])
+    assert fake.wait_for_frames(len(messages), timeout=600)
+    report("serial", fake, started)
+    fake.stop()
+
+
+def run_pool(messages: list[str], frame_delay: float, size: int):
+    fake = FakeProServer(frame_delay=frame_delay).start()
+    pool = ProServerClientPool(fake.host, fake.port, size=size, connect_timeout=2, send_timeout=10)
+    pool.send_batch(["axe,Warmup_Is_Disarmed@"] * size)  # open the connections
+    assert fake.wait_for_frames(size)
+    fake.frames.clear()
+    fake.received_at.clear()
+
+    started = time.time()
+    sent_times = pool.send_batch(messages)
+    assert all(sent_times), "some alerts were not sent"
+    assert fake.wait_for_frames(len(messages), timeout=600)
+    report(f"pool {size}", fake, started)
+    pool.close()
+    fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=300)
+    parser.add_argument("--pools", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--frame-delay-ms", type=float, default=0.5,
+                        help="Fake ProServer processing time per frame (default: 0.5)")
+    parser.add_argument("--lookup-ms", type=float, default=1.0,
+                        help="Simulated name lookup per alert on the serial path (default: 1.0)")
+    parser.add_argument("--skip-serial", action="store_true", help="Only run the pooled paths")
+    args = parser.parse_args()
+
+    messages = [f"axe,Building_{i}_Is_Disarmed@" for i in range(args.alerts)]
+    frame_delay = args.frame_delay_ms / 1000
+
+    print(f"{args.alerts} alerts due together, fake ProServer spends {args.frame_delay_ms} ms per frame")
+    print(f"{'path':>10} {'alerts':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9} {'spread (ms)':>10}")
+    if not args.skip_serial:
+        run_serial(messages, frame_delay, args.lookup_ms / 1000)
+    for size in args.pools:
+        run_pool(messages, frame_delay, size)
+
+
+if __name__ == "__main__":
+    main()
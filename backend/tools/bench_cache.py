@@ -0,0 +1,142 @@
+"""
+Cache Benchmark
+===============
+Compares the old whole-file JSON cache with the SQLite KV cache in cache.py,
+with `panel_state_cache` holding --buildings entries (default 10k).
+
+Operations timed:
+- tick, unchanged:   set panel_state_cache to the same map (most ticks)
+- tick, 1 changed:   set panel_state_cache with one building flipped
+- panel_armed set:   toggle the small panel_armed key (POST /panel_status)
+- get:               read panel_state_cache
+
+The KV cache writes behind: sets only touch memory and the flusher persists
+them. Each timed block ends with a flush, so the disk cost is included, but
+repeated sets of one key coalesce as they would in production. The
+"set latency" column is the time a caller (e.g. a request thread) is blocked.
+
+Usage (from backend/):
+    python -m tools.bench_cache
+    python -m tools.bench_cache --buildings 10000 --ops 200
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import cache
+
+
+class LegacyJsonCache:
+    """The previous cache.py behaviour: every set rewrites the whole file with indent=4."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def load_cache(self):
+        with self._lock:
+            if self._cache:
+                return self._cache
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    self._cache = json.load(f)
+            return self._cache
+
+    def save_cache(self, cache_data):
+        with self._lock:
+            self._cache = cache_data
+            with open(self.path, 'w') as f:
+                json.dump(self._cache, f, indent=4)
+
+    def get_value(self, key):
+        return self.load_cache().get(key)
+
+    def set_value(self, key, value):
+        data = self.load_cache()
+        data[key] = value
+        self.save_cache(data)
+
+
+def use_kv_cache(path: str):
+    """Points cache.py at a fresh database file."""
+    cache.CACHE_DB_PATH = path
+    cache.LEGACY_CACHE_FILE = path + ".json"
+    cache._conn = None
+    cache._cache.clear()
+    cache._serialized.clear()
+    cache._dirty.clear()
+    cache._loaded = False
+    cache._generation = 0
+    return cache
+
+
+def timed(ops: int, func, finish=None) -> float:
+    """Returns operations per second, including `finish` (e.g. a flush) in the timing."""
+    started = time.perf_counter()
+    for i in range(ops):
+        func(i)
+    if finish:
+        finish()
+    return ops / (time.perf_counter() - started)
+
+
+def set_latency_us(store, ops: int) -> float:
+    """Mean time a caller is blocked by one set of the small panel_armed key, in microseconds."""
+    started = time.perf_counter()
+    for i in range(ops):
+        store.set_value("panel_armed", i % 2 == 0)
+    return (time.perf_counter() - started) / ops * 1e6
+
+
+def run(store, buildings: int, ops: int, finish=None) -> dict:
+    states = {str(b): b % 2 == 0 for b in range(buildings)}
+    store.set_value("panel_state_cache", dict(states))
+    store.set_value("panel_armed", True)
+    if finish:
+        finish()
+
+    def flip_one(i):
+        states[str(i % buildings)] = not states[str(i % buildings)]
+        store.set_value("panel_state_cache", dict(states))
+
+    return {
+        "tick, unchanged": timed(ops, lambda i: store.set_value("panel_state_cache", dict(states)), finish),
+        "tick, 1 changed": timed(ops, flip_one, finish),
+        "panel_armed set": timed(ops, lambda i: store.set_value("panel_armed", i % 2 == 0), finish),
+        "get": timed(ops * 100, lambda i: store.get_value("panel_state_cache")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buildings", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_store = LegacyJsonCache(os.path.join(tmp, "app_cache.json"))
+        legacy = run(legacy_store, args.buildings, args.ops)
+        legacy_latency = set_latency_us(legacy_store, args.ops)
+
+        kv_store = use_kv_cache(os.path.join(tmp, "app_cache.db"))
+        kv = run(kv_store, args.buildings, args.ops, finish=cache.flush)
+        kv_latency = set_latency_us(kv_store, args.ops)
+        cache.shutdown()
+        stats = cache.get_stats()
+        cache._conn.close()
+
+    print(f"panel_state_cache with {args.buildings} buildings (ops/s, higher is better)")
+    print(f"{'operation':>16} {'JSON file':>12} {'SQLite KV':>12} {'speedup':>8}")
+    for name in legacy:
+        print(f"{name:>16} {legacy[name]:>12,.0f} {kv[name]:>12,.0f} {kv[name] / legacy[name]:>7.1f}x")
+    print(f"{'set latency (us)':>16} {legacy_latency:>12,.1f} {kv_latency:>12,.1f}")
+    print(f"KV cache: {stats['sets']} changed sets written as {stats['keys_written']} key writes "
+          f"in {stats['flushes']} flushes")
+
+
+if __name__ == "__main__":
+    main()
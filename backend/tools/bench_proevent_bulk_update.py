@@ -0,0 +1,122 @@
+"""
+ProEvent Bulk Update Benchmark
+==============================
+Compares the legacy per-row executemany UPDATE with the set-based
+`WHERE ProEvent_PRK IN (...)` engine in services/proevent_sql (used by
+proserver_service), against a local SQLite stand-in for ProEvent_TBL.
+Nothing here imports config, so it runs without an ODBC driver.
+
+SQLite has no network, so every statement can optionally pay a simulated
+round-trip latency (--latency-ms) the way a remote SQL Server would.
+executemany is charged one round-trip per parameter set, as pyodbc does
+without fast_executemany.
+
+Usage (from backend/):
+    python -m tools.bench_proevent_bulk_update
+    python -m tools.bench_proevent_bulk_update --latency-ms 0.5 --sizes 100 1000 10000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, event, text
+from services.proevent_sql import apply_reactive_state_updates
+
+LEGACY_UPDATE_SQL = text("""
+    UPDATE ProEvent_TBL
+    SET pevReactive_FRK = :state
+    WHERE ProEvent_PRK = :proevent_id
+""")
+
+
+def create_standin_engine(path: str, latency_ms: float):
+    """Creates a SQLite engine that charges `latency_ms` per simulated round-trip."""
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _simulate_latency(conn, cursor, statement, parameters, context, executemany):
+        trips = len(parameters) if executemany and parameters else 1
+        if latency_ms:
+            time.sleep(latency_ms * trips / 1000)
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE ProEvent_TBL (
+                ProEvent_PRK INTEGER PRIMARY KEY,
+                pevReactive_FRK INTEGER,
+                pevBuilding_FRK INTEGER
+            )
+        """))
+    return engine
+
+
+def seed(engine, rows: int):
+    """Resets ProEvent_TBL to `rows` rows with alternating reactive states."""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM ProEvent_TBL"))
+        conn.execute(
+            text("INSERT INTO ProEvent_TBL VALUES (:id, :state, :building)"),
+            [{"id": i, "state": i % 2, "building": i // 100} for i in range(rows)]
+        )
+
+
+def targets_for(rows: int) -> list[dict]:
+    """Every row flips state, so both paths must write all of them."""
+    return [{"id": i, "state": 1 - i % 2} for i in range(rows)]
+
+
+def run_legacy(engine, target_states: list[dict]):
+    with engine.begin() as conn:
+        conn.execute(
+            LEGACY_UPDATE_SQL,
+            [{"state": t["state"], "proevent_id": t["id"]} for t in target_states]
+        )
+
+
+def run_set_based(engine, target_states: list[dict]):
+    with engine.begin() as conn:
+        apply_reactive_state_updates(conn, target_states)
+
+
+def verify(engine, target_states: list[dict]):
+    with engine.connect() as conn:
+        wrong = conn.execute(text("""
+            SELECT COUNT(*) FROM ProEvent_TBL WHERE pevReactive_FRK = ProEvent_PRK % 2
+        """)).scalar()
+    if wrong:
+        raise AssertionError(f"{wrong} of {len(target_states)} rows were not updated")
+
+
+def time_path(engine, rows: int, runner) -> float:
+    seed(engine, rows)
+    target_states = targets_for(rows)
+    started = time.perf_counter()
+    runner(engine, target_states)
+    elapsed = time.perf_counter() - started
+    verify(engine, target_states)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency-ms", type=float, default=1.0,
+                        help="Simulated network round-trip per statement (default: 1.0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_standin_engine(os.path.join(tmp, "standin.db"), args.latency_ms)
+
+        print(f"Simulated round-trip latency: {args.latency_ms} ms")
+        print(f"{'rows':>8} {'executemany (s)':>16} {'set-based (s)':>14} {'speedup':>8}")
+        for rows in args.sizes:
+            legacy = time_path(engine, rows, run_legacy)
+            set_based = time_path(engine, rows, run_set_based)
+            print(f"{rows:>8} {legacy:>16.4f} {set_based:>14.4f} {legacy / set_based:>7.1f}x")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+SQLite Access Benchmark
+=======================
+Call latency of get_building_time, get_ignored_proevents and
+get_ignored_proevents_for_building along three paths:
+
+- per-call: the SQL run on a fresh connection per call (the original code)
+- pooled:   the same SQL on the pooled, tuned connections from sqlite_db
+- cached:   the sqlite_config functions, served from the read-through cache
+
+Runs against a temporary database seeded with --buildings schedules and
+--ignored ignored ProEvents, so building_schedules.db is never touched.
+
+Usage (from backend/):
+    python -m tools.bench_sqlite
+    python -m tools.bench_sqlite --buildings 2000 --ignored 5000 --calls 5000
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+import sqlite_config
+import sqlite_db
+
+
+@contextmanager
+def legacy_connection():
+    """The previous get_sqlite_connection(): connect, default pragmas, close."""
+    conn = sqlite3.connect(sqlite_config.SQLITE_DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def query_building_time(connection, building_id: int):
+    with connection() as conn:
+        row = conn.execute("SELECT start_time FROM building_times WHERE building_id = ?", (building_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def query_ignored_proevents(connection, building_id: int | None = None):
+    sql = "SELECT proevent_id, building_frk, ignore_on_arm, ignore_on_disarm FROM ignored_proevents"
+    params = ()
+    if building_id is not None:
+        sql += " WHERE building_frk = ? AND ignore_on_disarm = 1"
+        params = (building_id,)
+    with connection() as conn:
+        return {
+            row["proevent_id"]: {
+                "building_frk": row["building_frk"],
+                "ignore_on_arm": bool(row["ignore_on_arm"]),
+                "ignore_on_disarm": bool(row["ignore_on_disarm"])
+            }
+            for row in conn.execute(sql, params).fetchall()
+        }
+
+
+def seed(path: str, buildings: int, ignored: int):
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE building_times (
+                building_id INTEGER PRIMARY KEY,
+                start_time TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE ignored_proevents (
+                proevent_id INTEGER PRIMARY KEY,
+                building_frk INTEGER NOT NULL,
+                device_prk INTEGER NOT NULL,
+                ignore_on_arm BOOLEAN NOT NULL DEFAULT 0,
+                ignore_on_disarm BOOLEAN NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE TABLE data_generation (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO data_generation (name, value) VALUES ('schedules', 0)")
+        # Only the per-call and pooled SQL paths use it; the application serves this lookup from the cache
+        conn.execute("CREATE INDEX idx_ignored_proevents_building_disarm ON ignored_proevents (building_frk, ignore_on_disarm)")
+        conn.executemany("INSERT INTO building_times (building_id, start_time) VALUES (?, ?)",
+                         [(b, f"{18 + b % 4:02d}:00") for b in range(buildings)])
+        conn.executemany("INSERT INTO ignored_proevents VALUES (?, ?, ?, ?, ?)",
+                         [(p, p % buildings, p, p % 2, (p + 1) % 2) for p in range(ignored)])
+
+
+def measure(func, calls: int) -> list[float]:
+    latencies = []
+    for i in range(calls):
+        started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def percentile(latencies: list[float], pct: float) -> float:
+    return latencies[max(0, math.ceil(pct / 100 * len(latencies)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buildings", type=int, default=500)
+    parser.add_argument("--ignored", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_config.SQLITE_DB_PATH = os.path.join(tmp, "building_schedules.db")
+        seed(sqlite_config.SQLITE_DB_PATH, args.buildings, args.ignored)
+
+        b = args.buildings
+        paths = {}
+        for label, connection in (("per-call", legacy_connection), ("pooled", sqlite_config.get_sqlite_connection)):
+            paths[label] = {
+                "get_building_time": lambda i, c=connection: query_building_time(c, i % b),
+                "get_ignored_proevents": lambda i, c=connection: query_ignored_proevents(c),
+                "..._for_building": lambda i, c=connection: query_ignored_proevents(c, i % b),
+            }
+        paths["cached"] = {
+            "get_building_time": lambda i: sqlite_config.get_building_time(i % b),
+            "get_ignored_proevents": lambda i: sqlite_config.get_ignored_proevents(),
+            "..._for_building": lambda i: sqlite_config.get_ignored_proevents_for_building(i % b, disarm_only=True),
+        }
+
+        results = {}
+        for name in paths["cached"]:
+            # Reading the whole table is slow uncached, so it gets fewer calls
+            n = max(1, args.calls // 10) if name == "get_ignored_proevents" else args.calls
+            for label, funcs in paths.items():
+                funcs[name](0)  # warm up (opens the pooled connection, loads the cache)
+                results[(name, label)] = measure(funcs[name], n)
+        stats = sqlite_config.get_table_cache_stats()
+        sqlite_db.close_all()
+
+    print(f"{args.buildings} buildings, {args.ignored} ignored ProEvents (microseconds per call)")
+    print(f"{'function':>22} {'path':>9} {'calls':>6} {'p50':>9} {'p95':>9} {'mean':>9}")
+    for (name, label), latencies in results.items():
+        print(f"{name:>22} {label:>9} {len(latencies):>6} {percentile(latencies, 50) * 1e6:>9.1f} "
+              f"{percentile(latencies, 95) * 1e6:>9.1f} {sum(latencies) / len(latencies) * 1e6:>9.1f}")
+    print(f"Read-through cache: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['generation_checks']} generation checks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Fake ProServer
+==============
+A local TCP listener that accepts AXE notification frames the way ProServer
+does, so the notification path can be exercised without a real ProServer.
+
+Frames are split on the trailing '@' and recorded with their arrival time.
+Options let the listener drop connections after a number of frames, read
+slowly, or spend time on each frame like a busy ProServer, to exercise the
+client's reconnect handling and alert fan-out.
+
+Usage (from backend/):
+    python -m tools.fake_proserver --port 7777            # just listen and log frames
+    python -m tools.fake_proserver --bench 2000           # throughput + reconnect check
+"""
+
+import argparse
+import socket
+import socketserver
+import threading
+import time
+from services.proserver_client import ProServerClient
+
+LEGACY_SAMPLE_FRAMES = 200
+
+
+class FakeProServer:
+    """Threaded TCP listener that records every frame it receives."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, drop_after: int = 0,
+                 read_delay: float = 0.0, frame_delay: float = 0.0, verbose: bool = False):
+        self.frames = []
+        self.received_at = []
+        self.connections = 0
+        self.drop_after = drop_after
+        self.read_delay = read_delay
+        self.frame_delay = frame_delay
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with fake._lock:
+                    fake.connections += 1
+                buffer, received = b"", 0
+                while True:
+                    if fake.read_delay:
+                        time.sleep(fake.read_delay)
+                    try:
+                        data = self.request.recv(65536)
+                    except OSError:
+                        return
+                    if not data:
+                        return
+                    buffer += data
+                    *complete, buffer = buffer.split(b"@")
+                    for frame in complete:
+                        if fake.frame_delay:
+                            time.sleep(fake.frame_delay)
+                        with fake._lock:
+                            fake.frames.append(frame.decode() + "@")
+                            fake.received_at.append(time.time())
+                    if fake.verbose:
+                        for frame in complete:
+                            print(f"frame: {frame.decode()}@")
+                    received += len(complete)
+                    if fake.drop_after and received >= fake.drop_after:
+                        return  # simulate ProServer closing the connection
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def start(self) -> "FakeProServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait_for_frames(self, count: int, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if len(self.frames) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+
+def send_with_fresh_sockets(host: str, port: int, messages: list[str]):
+    """The old behaviour: one connect/send/close per frame."""
+    for message in messages:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect((host, port))
+            s.sendall(message.encode())
+
+
+def run_bench(frames: int):
+    messages = [f"axe,Building_{i}_Is_Disarmed@" for i in range(frames)]
+
+    # A connect per frame is slow enough that a sample gives the rate
+    legacy_frames = min(frames, LEGACY_SAMPLE_FRAMES)
+    fake = FakeProServer().start()
+    started = time.perf_counter()
+    send_with_fresh_sockets(fake.host, fake.port, messages[:legacy_frames])
+    assert fake.wait_for_frames(legacy_frames)
+    fresh = time.perf_counter() - started
+    fake.stop()
+
+    fake = FakeProServer().start()
+    client = ProServerClient(fake.host, fake.port, connect_timeout=2, send_timeout=2)
+    started = time.perf_counter()
+    for message in messages:
+        client.send(message)
+    assert fake.wait_for_frames(frames)
+    pooled = time.perf_counter() - started
+
+    fake.frames.clear()
+    fake.received_at.clear()
+    started = time.perf_counter()
+    client.send_many(messages)
+    assert fake.wait_for_frames(frames)
+    pipelined = time.perf_counter() - started
+    client.close()
+    fake.stop()
+
+    print(f"{frames} frames")
+    print(f"  socket per frame:    {fresh:.3f}s for {legacy_frames} ({legacy_frames / fresh:,.0f} frames/s)")
+    print(f"  persistent client:   {pooled:.3f}s ({frames / pooled:,.0f} frames/s)")
+    print(f"  pipelined send_many: {pipelined:.3f}s ({frames / pipelined:,.0f} frames/s)")
+
+    # Reconnect: ProServer closes the connection after every 10 frames
+    fake = FakeProServer(drop_after=10).start()
+    client = ProServerClient(fake.host, fake.port, connect_timeout=2, send_timeout=2)
+    for i in range(100):
+        assert client.send(f"axe,Drop_{i}_Is_Disarmed@"), f"frame {i} not sent"
+        time.sleep(0.002)  # give the listener time to close so the client sees it
+    assert fake.wait_for_frames(100), f"only {len(fake.frames)} of 100 frames arrived"
+    print(f"  reconnect: 100 frames over {fake.connections} connections, "
+          f"{client.status()['connects']} client connects")
+    client.close()
+    port = fake.port
+    fake.stop()
+
+    # Unreachable ProServer: sends fail fast instead of hanging
+    client = ProServerClient("127.0.0.1", port, connect_timeout=1, send_timeout=1)
+    started = time.perf_counter()
+    results = [client.send("axe,Down_Is_Disarmed@") for _ in range(50)]
+    elapsed = time.perf_counter() - started
+    assert not any(results)
+    print(f"  ProServer down: 50 sends failed in {elapsed:.3f}s "
+          f"({client.status()['connect_failures']} connect attempt(s), rest backed off)")
+    print("✅ Fake ProServer checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--drop-after", type=int, default=0,
+                        help="Close each connection after this many frames (default: never)")
+    parser.add_argument("--read-delay", type=float, default=0.0,
+                        help="Seconds to sleep before each read, to simulate a slow ProServer")
+    parser.add_argument("--frame-delay", type=float, default=0.0,
+                        help="Seconds spent on each frame, to simulate ProServer processing time")
+    parser.add_argument("--bench", type=int, metavar="FRAMES",
+                        help="Run the throughput and reconnect checks instead of listening")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_bench(args.bench)
+        return
+
+    fake = FakeProServer(args.host, args.port, args.drop_after, args.read_delay, args.frame_delay,
+                         verbose=True).start()
+    print(f"Fake ProServer listening on {fake.host}:{fake.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"{len(fake.frames)} frames over {fake.connections} connections")
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Leader Election Check
+=====================
+Starts several processes that compete for the scheduler lease the way
+uvicorn workers do. Each one runs the real AsyncScheduler (scheduler.start(),
+heartbeat task, leader-only job) and an OutboxSender started and stopped by
+the lease callbacks, exactly as scheduler_service wires them. Only the
+sender's delivery is replaced: it records each row instead of sending it to
+ProServer.
+
+While the processes run, outbox rows are queued continuously and:
+- a third of the way in, the leader's event loop is blocked for longer than
+  the lease (a stalled process). Its heartbeat stops, another process takes
+  over, and the stalled leader's sender thread, which keeps running, must
+  not send anything
+- two thirds of the way in, the current leader is killed with SIGKILL (no
+  lease release), so failover after the lease expires is covered as well
+
+Every tick and every delivered row is logged with its process. Afterwards:
+- ticks and deliveries never interleave between processes (one leader at a time)
+- no row is delivered twice, except a row the killed leader sent but could
+  not mark as sent, which is retried once its claim expires (at-least-once)
+- every row queued before the end was delivered
+
+Usage (from backend/):
+    python -m tools.leader_election_check [--workers 4] [--seconds 9]
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sqlite3
+import tempfile
+import time
+
+TICK_SECONDS = 0.25
+LEASE_TTL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 0.3
+STALL_SECONDS = 2.5
+CLAIM_SECONDS = 1.0
+ENQUEUE_EVERY_SECONDS = 0.05
+
+
+def worker(db_path: str, stop_path: str):
+    """One simulated uvicorn worker running the real scheduler and lease callbacks."""
+    import asyncio
+    import sqlite_config
+    sqlite_config.SQLITE_DB_PATH = db_path
+    from services import scheduler_service, notification_outbox
+    from services.leader_election import LeaderLease
+
+    scheduler_service.LEADER_HEARTBEAT_SECONDS = HEARTBEAT_SECONDS
+    notification_outbox.IDLE_POLL_SECONDS = ENQUEUE_EVERY_SECONDS
+
+    def record(kind: str, ref: int | None = None):
+        with sqlite3.connect(db_path, timeout=5) as conn:
+            conn.execute("INSERT INTO event_log (kind, ref, pid, at) VALUES (?, ?, ?, ?)",
+                         (kind, ref, os.getpid(), time.time()))
+
+    class RecordingSender(notification_outbox.OutboxSender):
+        """Real claiming and lease fencing; delivery is logged instead of sent."""
+
+        def _deliver(self, rows):
+            if not self._holds_lease():
+                return None
+            sent_at = time.time()
+            for row in rows:
+                record("send", row["id"])
+            return [(row, sent_at) for row in rows], [], []
+
+    lease = LeaderLease(name="scheduler", ttl_seconds=LEASE_TTL_SECONDS)
+    sender = RecordingSender(batch_size=5, lease=lease, claim_seconds=CLAIM_SECONDS)
+    scheduler = scheduler_service.AsyncScheduler(max_workers=1, lease=lease)
+    scheduler.add_job("tick", lambda: record("tick"), TICK_SECONDS)
+    lease.on_acquired(sender.start)
+    lease.on_lost(sender.stop)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        # SIGUSR1 blocks the event loop (heartbeat included); the sender thread keeps running
+        loop.add_signal_handler(signal.SIGUSR1, lambda: time.sleep(STALL_SECONDS))
+        await scheduler.start()
+        while not os.path.exists(stop_path):
+            await asyncio.sleep(0.1)
+        await scheduler.stop(drain_timeout=2)
+
+    asyncio.run(run())
+
+
+def current_leader_pid(db_path: str) -> int | None:
+    with sqlite3.connect(db_path, timeout=5) as conn:
+        row = conn.execute(
+            "SELECT holder_id FROM scheduler_lease WHERE name = 'scheduler' AND expires_at > ?",
+            (time.time(),)
+        ).fetchone()
+    return int(row[0].split(":")[1]) if row else None
+
+
+def create_schema(db_path: str):
+    import database_setup
+    database_setup.SQLITE_DB_PATH = db_path
+    database_setup.init_sqlite_db()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE event_log (kind TEXT NOT NULL, ref INTEGER, pid INTEGER NOT NULL, at REAL NOT NULL)")
+
+
+def enqueue(db_path: str, n: int):
+    now = time.time()
+    with sqlite3.connect(db_path, timeout=5) as conn:
+        conn.execute("""
+            INSERT INTO notification_outbox (dedupe_key, building_id, event, status, attempts, next_attempt_at, created_at)
+            VALUES (?, ?, 'disarmed', 'pending', 0, ?, ?)
+        """, (f"{n}:disarmed:check", n, now, now))
+
+
+def run_scenario(db_path: str, workers: int, seconds: float) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    # A file rather than a multiprocessing.Event: setting an Event blocks on a killed waiter
+    stop_path = db_path + ".stop"
+    processes = [ctx.Process(target=worker, args=(db_path, stop_path)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    # The timeline starts once the processes are up and one of them leads
+    while current_leader_pid(db_path) is None:
+        time.sleep(0.1)
+
+    started = time.time()
+    actions = [(seconds / 3, "stall"), (2 * seconds / 3, "kill")]
+    scenario = {"stalled_pid": None, "killed_pid": None}
+    n = 0
+    # Stop queueing early enough for the last rows to be delivered
+    while time.time() < started + seconds - 1.0:
+        enqueue(db_path, n)
+        n += 1
+        pid = current_leader_pid(db_path)
+        if actions and time.time() - started >= actions[0][0] and pid:
+            _, action = actions.pop(0)
+            os.kill(pid, signal.SIGUSR1 if action == "stall" else signal.SIGKILL)
+            scenario["stalled_pid" if action == "stall" else "killed_pid"] = pid
+            print(f"{'Stalled' if action == 'stall' else 'Killed'} leader pid {pid}")
+        time.sleep(ENQUEUE_EVERY_SECONDS)
+
+    time.sleep(1.0)
+    open(stop_path, "w").close()
+    for process in processes:
+        process.join()
+    scenario["queued"] = n
+    return scenario
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=9.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "building_schedules.db")
+        create_schema(db_path)
+        scenario = run_scenario(db_path, args.workers, args.seconds)
+
+        with sqlite3.connect(db_path) as conn:
+            events = conn.execute("SELECT kind, ref, pid, at FROM event_log ORDER BY at").fetchall()
+            unsent = conn.execute("SELECT COUNT(*) FROM notification_outbox WHERE status != 'sent'").fetchone()[0]
+
+    # Consecutive events by the same process form one leadership term
+    terms = []
+    for _, _, pid, _ in events:
+        if not terms or terms[-1] != pid:
+            terms.append(pid)
+
+    sends_by_row = {}
+    for kind, ref, pid, at in events:
+        if kind == "send":
+            sends_by_row.setdefault(ref, []).append((at, pid))
+    duplicates, resent_after_crash = [], []
+    for row_id, sends in sends_by_row.items():
+        for (first_at, first_pid), (again_at, _) in zip(sends, sends[1:]):
+            if first_pid == scenario["killed_pid"] and again_at - first_at >= CLAIM_SECONDS:
+                resent_after_crash.append(row_id)
+            else:
+                duplicates.append((row_id, sends))
+
+    ticks = sum(1 for kind, *_ in events if kind == "tick")
+    print(f"{ticks} ticks and {len(sends_by_row)} of {scenario['queued']} rows delivered "
+          f"by leadership terms {terms} across {args.workers} processes")
+    print(f"Duplicate deliveries: {duplicates or 'none'}")
+    print(f"Re-sent after the leader was killed mid-batch: {resent_after_crash or 'none'}")
+
+    assert len(terms) == 3, f"expected three leadership terms (start, stall, kill), got {terms}"
+    assert terms[0] == scenario["stalled_pid"] and terms[1] != scenario["stalled_pid"], \
+        "the stalled leader kept acting after its lease expired"
+    assert not duplicates, "a row was delivered twice"
+    assert not unsent, f"{unsent} queued row(s) were never delivered"
+    print("✅ One leader at a time, and every row delivered once")
+
+
+if __name__ == "__main__":
+    main()